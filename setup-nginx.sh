@@ -40,10 +40,11 @@ server {
     }
 
     # Archivos media (si no usas cloud storage)
-    location /media/ {
+    # Solo accesibles vía X-Accel-Redirect (MEDIA_ACCEL_REDIRECT=/protected-media/).
+    # El Cache-Control lo pone Django (inmutable en las URLs versionadas)
+    location /protected-media/ {
+        internal;
         alias $APP_DIR/src/media/;
-        expires 7d;
-        add_header Cache-Control "public";
     }
 
     # Proxy a Gunicorn en Docker
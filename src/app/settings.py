@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import copy
 import os
 from pathlib import Path
 
@@ -63,6 +64,7 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
+    'courses.database.PrimaryPinningMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -121,6 +123,11 @@ if USE_SQLITE:
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
     }
+    # Segunda base para probar localmente el ruteo a la réplica (DATABASE_REPLICA=replica)
+    DATABASES["replica"] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'db-replica.sqlite3',
+    }
 else:
     DATABASES["default"] = {
         'ENGINE': 'django.db.backends.postgresql',
@@ -129,7 +136,32 @@ else:
         'PASSWORD': os.environ.get("POSTGRES_PASSWORD"),
         'HOST': os.environ.get("POSTGRES_HOST", "db"),
         'PORT': os.environ.get("POSTGRES_PORT", "5432"),
+        'OPTIONS': {},
     }
+    # Conexiones reutilizables: un pool de psycopg por proceso (DB_POOL=1) o,
+    # sin pool, conexiones persistentes que se verifican antes de reusarse.
+    # Con pool, cada worker de gunicorn abre hasta DB_POOL_MAX_SIZE conexiones.
+    if os.environ.get("DB_POOL", "1") == "1":
+        DATABASES["default"]["OPTIONS"]["pool"] = {
+            "min_size": int(os.environ.get("DB_POOL_MIN_SIZE", "1")),
+            "max_size": int(os.environ.get("DB_POOL_MAX_SIZE", "4")),
+            "max_idle": float(os.environ.get("DB_POOL_MAX_IDLE", "600")),  # segundos
+            "timeout": float(os.environ.get("DB_POOL_TIMEOUT", "10")),  # espera por una conexión libre
+        }
+    else:
+        DATABASES["default"]["CONN_MAX_AGE"] = int(os.environ.get("DB_CONN_MAX_AGE", "60"))
+    # Verifica la conexión antes de entregarla (con pool, al sacarla del pool)
+    # y descarta las que el servidor ya cerró
+    DATABASES["default"]["CONN_HEALTH_CHECKS"] = os.environ.get("DB_HEALTH_CHECKS", "1") == "1"
+    if os.environ.get("POSTGRES_REPLICA_HOST"):
+        # Réplica de streaming del primario: mismas credenciales, otro host
+        DATABASES["replica"] = {
+            **DATABASES["default"],
+            'HOST': os.environ["POSTGRES_REPLICA_HOST"],
+            'PORT': os.environ.get("POSTGRES_REPLICA_PORT", DATABASES["default"]["PORT"]),
+            'OPTIONS': copy.deepcopy(DATABASES["default"]["OPTIONS"]),
+            'TEST': {'MIRROR': 'default'},
+        }
     missing = [
         key for key in ("POSTGRES_DB", "POSTGRES_USER", "POSTGRES_PASSWORD")
         if not os.environ.get(key)
@@ -140,6 +172,20 @@ else:
             f"Missing PostgreSQL configuration for: {missing_display}"
         )
 
+# Réplica de lectura para las vistas de solo lectura (courses.database)
+DATABASE_ROUTERS = ["courses.database.ReplicaRouter"]
+DATABASE_REPLICA = os.environ.get("DATABASE_REPLICA", "replica" if os.environ.get("POSTGRES_REPLICA_HOST") else "")
+# Primario tras escribir; nunca menos que REPLICA_MAX_LAG + REPLICA_HEALTH_INTERVAL
+REPLICA_PIN_SECONDS = int(os.environ.get("REPLICA_PIN_SECONDS", "35"))
+REPLICA_MAX_LAG = float(os.environ.get("REPLICA_MAX_LAG", "30"))  # segundos
+REPLICA_HEALTH_INTERVAL = float(os.environ.get("REPLICA_HEALTH_INTERVAL", "5"))
+REPLICA_CACHE_TIMEOUT = int(os.environ.get("REPLICA_CACHE_TIMEOUT", "30"))
+
+# Diccionario de PostgreSQL para la búsqueda de cursos (acorde a LANGUAGE_CODE).
+# La búsqueda usa "<diccionario>_unaccent", que crea la migración 0020; si
+# se cambia, hay que crearla de nuevo (courses.search.create_search_config)
+COURSE_SEARCH_CONFIG = os.environ.get("COURSE_SEARCH_CONFIG", "spanish")
+
 LOGIN_REDIRECT_URL = "/courses/"
 LOGOUT_REDIRECT_URL = "/courses/"
 LOGIN_URL = "/accounts/login/"
@@ -184,11 +230,21 @@ STATIC_URL = '/static/'
 STATIC_ROOT = BASE_DIR / "staticfiles"
 STATICFILES_STORAGE = "whitenoise.storage.CompressedManifestStaticFilesStorage"
 
+# Librerías JS de terceros (hls.js) servidas como static en lugar de un CDN.
+# El Dockerfile las baja con npm, que verifica el paquete contra el registro,
+# fuera de /code (compose monta el repo encima)
+VENDOR_STATIC_DIR = Path(os.environ.get("VENDOR_STATIC_DIR", "/opt/vendor-static"))
+STATICFILES_DIRS = [VENDOR_STATIC_DIR] if VENDOR_STATIC_DIR.is_dir() else []
+
 # Media files (Videos, Imágenes, Documentos subidos por usuarios)
 # Configuración flexible: local en desarrollo, cloud storage en producción
 
 USE_CLOUD_STORAGE = os.environ.get("USE_CLOUD_STORAGE", "0") == "1"
 
+# Guardar cada adjunto una sola vez por contenido (SHA-256) y contar referencias
+# (courses.storage). Sirve con disco y con bucket.
+DEDUPLICATE_ATTACHMENTS = os.environ.get("DEDUPLICATE_ATTACHMENTS", "0") == "1"
+
 if USE_CLOUD_STORAGE:
     # Configuración para almacenamiento en la nube (S3, OCI Object Storage, etc.)
     # OCI Object Storage es compatible con S3 API
@@ -218,8 +274,11 @@ if USE_CLOUD_STORAGE:
         # OCI usa paths diferentes
         AWS_S3_ADDRESSING_STYLE = 'path'
     
+    # Los nombres de los objetos no se reutilizan (directorio único por archivo,
+    # blobs por hash, corridas de HLS/variantes): se cachean un año en el
+    # navegador y en el CDN (AWS_S3_CUSTOM_DOMAIN)
     AWS_S3_OBJECT_PARAMETERS = {
-        'CacheControl': 'max-age=86400',
+        'CacheControl': 'public, max-age=31536000, immutable',
     }
     AWS_DEFAULT_ACL = 'public-read'  # Para que los archivos sean accesibles públicamente
     AWS_QUERYSTRING_AUTH = False  # URLs públicas sin autenticación
@@ -251,6 +310,60 @@ else:
     MEDIA_URL = "/media/"
     MEDIA_ROOT = BASE_DIR / "media"
 
+# Location interna de Nginx para los adjuntos de lecciones (ej. "/protected-media/").
+# Si está vacío, Django sirve el archivo con soporte de Range (courses.media).
+MEDIA_ACCEL_REDIRECT = os.environ.get("MEDIA_ACCEL_REDIRECT", "")
+
+# Subida directa del navegador al bucket (solo con USE_CLOUD_STORAGE)
+# El bucket necesita CORS que permita PUT desde el sitio y exponga el header ETag
+DIRECT_UPLOADS = USE_CLOUD_STORAGE and os.environ.get("DIRECT_UPLOADS", "1") == "1"
+DIRECT_UPLOAD_PART_SIZE = int(os.environ.get("DIRECT_UPLOAD_PART_SIZE", str(16 * 1024 * 1024)))
+DIRECT_UPLOAD_URL_EXPIRES = int(os.environ.get("DIRECT_UPLOAD_URL_EXPIRES", "3600"))
+
+# Subida por partes reanudable (solo almacenamiento local, sin USE_CLOUD_STORAGE)
+# Las subidas incompletas quedan en CHUNKED_UPLOAD_DIR (por defecto MEDIA_ROOT/.staging)
+# hasta que el comando sweep_upload_staging las borra
+CHUNKED_UPLOAD_CHUNK_SIZE = int(os.environ.get("CHUNKED_UPLOAD_CHUNK_SIZE", str(5 * 1024 * 1024)))
+CHUNKED_UPLOAD_DIR = os.environ.get("CHUNKED_UPLOAD_DIR", "")
+CHUNKED_UPLOAD_EXPIRES = int(os.environ.get("CHUNKED_UPLOAD_EXPIRES", str(24 * 60 * 60)))
+
+# ffprobe (paquete ffmpeg) para la duración y dimensiones de los videos subidos.
+# Si no está instalado esos metadatos quedan vacíos.
+FFPROBE_BINARY = os.environ.get("FFPROBE_BINARY", "ffprobe")
+
+# Transcodificación de videos subidos a HLS (worker: manage.py transcode_videos)
+FFMPEG_BINARY = os.environ.get("FFMPEG_BINARY", "ffmpeg")
+HLS_CONCURRENCY = int(os.environ.get("HLS_CONCURRENCY", "2"))  # procesos de ffmpeg a la vez por worker
+HLS_MAX_ATTEMPTS = int(os.environ.get("HLS_MAX_ATTEMPTS", "3"))
+HLS_RETRY_DELAY = int(os.environ.get("HLS_RETRY_DELAY", "60"))  # segundos; se duplica en cada intento
+HLS_JOB_TIMEOUT = int(os.environ.get("HLS_JOB_TIMEOUT", "3600"))
+
+# Variantes AVIF/WebP de las imágenes subidas (worker: manage.py generate_image_variants)
+IMAGE_VARIANTS_CONCURRENCY = int(os.environ.get("IMAGE_VARIANTS_CONCURRENCY", "4"))  # imágenes a la vez (lectura/escritura)
+IMAGE_VARIANTS_PROCESSES = int(os.environ.get("IMAGE_VARIANTS_PROCESSES", "2"))  # procesos que codifican
+IMAGE_VARIANTS_MAX_ATTEMPTS = int(os.environ.get("IMAGE_VARIANTS_MAX_ATTEMPTS", "3"))
+IMAGE_VARIANTS_RETRY_DELAY = int(os.environ.get("IMAGE_VARIANTS_RETRY_DELAY", "60"))
+IMAGE_VARIANTS_JOB_TIMEOUT = int(os.environ.get("IMAGE_VARIANTS_JOB_TIMEOUT", "600"))
+
+# Deduplicación de las subidas directas al bucket (worker: manage.py deduplicate_attachments)
+DEDUP_CONCURRENCY = int(os.environ.get("DEDUP_CONCURRENCY", "4"))  # archivos leídos a la vez
+DEDUP_MAX_ATTEMPTS = int(os.environ.get("DEDUP_MAX_ATTEMPTS", "3"))
+DEDUP_RETRY_DELAY = int(os.environ.get("DEDUP_RETRY_DELAY", "60"))
+DEDUP_JOB_TIMEOUT = int(os.environ.get("DEDUP_JOB_TIMEOUT", "3600"))
+
+# Borrado de archivos en segundo plano (worker: manage.py process_storage_deletions)
+# En el bucket se borra con DeleteObjects, hasta 1000 llaves por llamada
+STORAGE_CLEANUP_BATCH_SIZE = int(os.environ.get("STORAGE_CLEANUP_BATCH_SIZE", "1000"))
+STORAGE_CLEANUP_RETRY_DELAY = int(os.environ.get("STORAGE_CLEANUP_RETRY_DELAY", "60"))  # se duplica en cada intento
+
+# Borrado de cursos en segundo plano (worker: manage.py delete_courses)
+COURSE_DELETION_BATCH_SIZE = int(os.environ.get("COURSE_DELETION_BATCH_SIZE", "1000"))  # filas por DELETE
+
+# Progreso de lecciones: archivo frío (manage.py archive_progress) y
+# particiones por hash de usuario en PostgreSQL (manage.py partition_lesson_progress)
+PROGRESS_ARCHIVE_AFTER_DAYS = int(os.environ.get("PROGRESS_ARCHIVE_AFTER_DAYS", "365"))
+LESSON_PROGRESS_PARTITIONS = int(os.environ.get("LESSON_PROGRESS_PARTITIONS", "16"))
+
 # File upload settings
 FILE_UPLOAD_MAX_MEMORY_SIZE = 26214400  # 25 MB
 DATA_UPLOAD_MAX_MEMORY_SIZE = 26214400  # 25 MB
@@ -260,6 +373,59 @@ MAX_VIDEO_SIZE = 100 * 1024 * 1024  # 100 MB para videos
 MAX_IMAGE_SIZE = 10 * 1024 * 1024   # 10 MB para imágenes
 MAX_FILE_SIZE = 50 * 1024 * 1024    # 50 MB para otros archivos
 
+# Caché (páginas anónimas y fragmentos del catálogo)
+# CACHE_BACKEND: locmem (por proceso), file (compartido en disco) o redis.
+# Con varios workers o servicios (producción) debe ser file o redis: las
+# invalidaciones por versión solo llegan a los procesos que comparten el caché.
+CACHE_BACKEND = os.environ.get("CACHE_BACKEND", "locmem")
+
+if CACHE_BACKEND == "redis":
+    try:
+        import redis  # noqa: F401
+    except ImportError:
+        raise ImproperlyConfigured(
+            "CACHE_BACKEND=redis requiere el paquete redis. Ejecuta: pip install redis"
+        )
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": os.environ.get("CACHE_LOCATION", "redis://127.0.0.1:6379/1"),
+        }
+    }
+elif CACHE_BACKEND == "file":
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+            "LOCATION": os.environ.get("CACHE_LOCATION", str(BASE_DIR / "cache")),
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "LOCATION": "courses",
+        }
+    }
+
+# Segundos que viven páginas y fragmentos cacheados (0 desactiva el caché)
+COURSE_CACHE_TIMEOUT = int(os.environ.get("COURSE_CACHE_TIMEOUT", "300"))
+
+# Segundos que se cachean los cursos en los que está inscrito cada usuario
+# (se invalida al inscribirse o darse de baja)
+ENROLLMENT_CACHE_TIMEOUT = int(os.environ.get("ENROLLMENT_CACHE_TIMEOUT", "60"))
+
+# Paginación del catálogo: "keyset" (cursor por created_at, id) u "offset"
+# Las búsquedas por texto siempre usan offset (se ordenan por relevancia)
+CATALOG_PAGINATION = os.environ.get("CATALOG_PAGINATION", "keyset")
+# Segundos que se cachean los totales del catálogo (cursos e instructores)
+CATALOG_TOTALS_TIMEOUT = int(os.environ.get("CATALOG_TOTALS_TIMEOUT", "60"))
+
+# Heartbeat de reproducción de video (write-behind)
+# Las posiciones se acumulan en memoria y se escriben cada N segundos en bloque.
+# Con 0 se desactiva el hilo de volcado (solo se escribe al apagar el worker).
+PROGRESS_HEARTBEAT_FLUSH_INTERVAL = int(os.environ.get("PROGRESS_HEARTBEAT_FLUSH_INTERVAL", "10"))
+PROGRESS_HEARTBEAT_MAX_PENDING = int(os.environ.get("PROGRESS_HEARTBEAT_MAX_PENDING", "5000"))
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
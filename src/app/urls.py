@@ -19,8 +19,6 @@ from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import include, path
 from django.views.generic import RedirectView
-from django.views.static import serve
-from django.urls import re_path
 
 from courses.views import ProfileUpdateView, SignUpView
 
@@ -38,13 +36,8 @@ urlpatterns = [
 # Si no, se sirven localmente
 USE_CLOUD_STORAGE = getattr(settings, 'USE_CLOUD_STORAGE', False)
 
-if not USE_CLOUD_STORAGE:
-    if settings.DEBUG:
-        urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
-    else:
-        # En producción sin cloud storage, servir archivos media con Django
-        # En producción real, deberías usar Nginx para servir archivos estáticos
-        if settings.MEDIA_ROOT:
-            urlpatterns += [
-                re_path(r'^media/(?P<path>.*)$', serve, {'document_root': settings.MEDIA_ROOT}),
-            ]
+# En desarrollo, /media/ se sirve directo. En producción los adjuntos de las
+# lecciones pasan por courses:lesson_media, que valida la inscripción y
+# delega la transferencia a Nginx (MEDIA_ACCEL_REDIRECT).
+if not USE_CLOUD_STORAGE and settings.DEBUG:
+    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
@@ -0,0 +1,121 @@
+"""
+Resolución de acceso a cursos.
+
+Un solo lugar responde "¿qué es este usuario en este curso?" (staff,
+instructor, inscrito). El resultado se memoriza en el request, así que las
+vistas pueden preguntar varias veces sin repetir consultas, y los IDs de
+los cursos en los que el usuario está inscrito (y de aquellos cuyo progreso
+está archivado, ver courses.archive) se cachean unos segundos
+(ENROLLMENT_CACHE_TIMEOUT). courses.signals invalida ese caché al crear o
+borrar una inscripción. Solo se cachean con un caché compartido: con
+locmem cada worker tendría su copia y la invalidación no llegaría a los
+demás (dando o negando acceso hasta que expire).
+"""
+from django.conf import settings
+from django.db import transaction
+from django.shortcuts import get_object_or_404
+
+from . import caching
+from .models import Course, Enrollment
+
+ENROLLMENTS_KEY = "user:{}:enrollments"
+
+
+class CourseAccess:
+    """Rol de un usuario en un curso."""
+
+    def __init__(self, is_staff=False, is_instructor=False, is_enrolled=False, progress_archived=False):
+        self.is_staff = is_staff
+        self.is_instructor = is_instructor
+        self.is_enrolled = is_enrolled
+        # Hay que restaurar el progreso antes de leerlo (courses.archive)
+        self.progress_archived = progress_archived
+
+    @property
+    def can_manage(self):
+        """Puede editar el curso y sus lecciones."""
+        return self.is_staff or self.is_instructor
+
+    @property
+    def can_view(self):
+        """Puede ver lecciones, marcar progreso y comentar."""
+        return self.can_manage or self.is_enrolled
+
+
+def _enrollments(user_id):
+    """(cursos inscritos, cursos con el progreso archivado), cacheados."""
+    cache = caching.get_cache() if caching.shared() else None
+    key = ENROLLMENTS_KEY.format(user_id)
+    enrollments = cache.get(key) if cache is not None else None
+    if enrollments is None:
+        rows = list(Enrollment.objects.filter(user_id=user_id).values_list("course_id", "progress_archived"))
+        enrollments = (
+            frozenset(course_id for course_id, _ in rows),
+            frozenset(course_id for course_id, archived in rows if archived),
+        )
+        if cache is not None:
+            cache.set(key, enrollments, getattr(settings, "ENROLLMENT_CACHE_TIMEOUT", 60))
+    return enrollments
+
+
+def enrolled_course_ids(user_id):
+    """IDs de los cursos en los que el usuario está inscrito (cacheados)."""
+    return _enrollments(user_id)[0]
+
+
+def archived_course_ids(user_id):
+    """IDs de los cursos en los que el progreso del usuario está archivado."""
+    return _enrollments(user_id)[1]
+
+
+def invalidate_enrollments(user_id):
+    key = ENROLLMENTS_KEY.format(user_id)
+    caching.get_cache().delete(key)
+    # De nuevo al confirmar, por si otra petición lo recargó mientras tanto
+    transaction.on_commit(lambda: caching.get_cache().delete(key))
+
+
+def resolve(request, course):
+    """Retorna el CourseAccess del usuario del request (una vez por request)."""
+    resolved = request.__dict__.setdefault("_course_access", {})
+    if course.pk not in resolved:
+        user = request.user
+        if not user.is_authenticated:
+            resolved[course.pk] = CourseAccess()
+        else:
+            enrolled, archived = _enrollments(user.id)
+            resolved[course.pk] = CourseAccess(
+                is_staff=user.is_staff,
+                is_instructor=course.instructor_id == user.id,
+                is_enrolled=course.pk in enrolled,
+                progress_archived=course.pk in archived,
+            )
+    return resolved[course.pk]
+
+
+def get_course(request, identifier, queryset=None):
+    """
+    Carga el curso por identifier una sola vez por request. Los cursos que
+    se están borrando (courses.deletion) ya no existen para las vistas.
+    """
+    courses = request.__dict__.setdefault("_courses", {})
+    key = str(identifier)
+    if key not in courses:
+        if queryset is None:
+            queryset = Course.objects.all()
+        courses[key] = get_object_or_404(queryset, identifier=identifier, deletion_requested_at__isnull=True)
+    return courses[key]
+
+
+class CourseAccessMixin:
+    """Da a las vistas con <identifier> en la URL el curso y el acceso del usuario."""
+
+    course_queryset = None
+
+    def get_course(self):
+        if not hasattr(self, "course"):
+            self.course = get_course(self.request, self.kwargs["identifier"], self.course_queryset)
+        return self.course
+
+    def get_access(self, course=None):
+        return resolve(self.request, course or self.get_course())
@@ -5,7 +5,8 @@ from .models import (
     Enrollment,
     LessonProgress,
     CourseRating,
-    Comment
+    Comment,
+    CourseProgressSummary,
 )
 
 
@@ -14,7 +15,15 @@ from .models import (
 # =========================
 @admin.register(Course)
 class CourseAdmin(admin.ModelAdmin):
-    list_display = ("title", "identifier", "instructor", "is_listed", "created_at")
+    list_display = (
+        "title",
+        "identifier",
+        "instructor",
+        "is_listed",
+        "lesson_count",
+        "enrollment_count",
+        "created_at",
+    )
     list_filter = ("is_listed", "created_at")
     search_fields = ("title", "description")
 
@@ -64,3 +73,12 @@ class CommentAdmin(admin.ModelAdmin):
     list_display = ("user", "course", "created_at")
     list_filter = ("course", "created_at")
     search_fields = ("content",)
+
+
+# =========================
+# CourseProgressSummary
+# =========================
+@admin.register(CourseProgressSummary)
+class CourseProgressSummaryAdmin(admin.ModelAdmin):
+    list_display = ("user", "course", "completed_lessons", "total_lessons", "last_activity")
+    raw_id_fields = ("user", "course")
@@ -1,6 +1,16 @@
+import mimetypes
+
 from django.apps import AppConfig
 
 
 class CoursesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'courses'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+
+        # Tipos de HLS para servir y subir playlists y segmentos (algunos
+        # sistemas registran .ts como traducciones de Qt)
+        mimetypes.add_type("application/vnd.apple.mpegurl", ".m3u8")
+        mimetypes.add_type("video/mp2t", ".ts")
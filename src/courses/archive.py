@@ -0,0 +1,185 @@
+"""
+Archivo frío del progreso de lecciones.
+
+LessonProgress tiene una fila por usuario y lección tocada; la mayoría
+pertenece a inscripciones que nadie abre hace meses y solo suman vacuum e
+índices. El comando `archive_progress` mueve el progreso de las
+inscripciones inactivas a ArchivedProgress: una fila por usuario y curso
+con las lecciones comprimidas (JSON + zlib). La inscripción queda marcada
+(Enrollment.progress_archived) y CourseProgressSummary no cambia, así que
+el panel sigue mostrando el avance sin restaurar nada.
+
+Una inscripción es inactiva si su resumen no registra actividad y el
+usuario no inicia sesión hace más de PROGRESS_ARCHIVE_AFTER_DAYS días.
+
+Cuando el alumno vuelve, las vistas que leen o escriben su progreso en el
+curso llaman a rehydrate_for() antes de hacerlo: el marcador viaja en el
+caché de inscripciones (courses.access), así que en el caso normal no
+cuesta ninguna consulta.
+"""
+import json
+import logging
+import zlib
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import access
+from .models import ArchivedProgress, CourseProgressSummary, Enrollment, Lesson, LessonProgress
+
+logger = logging.getLogger("courses")
+
+BATCH_SIZE = 500
+
+# Columnas guardadas por lección, en este orden
+FIELDS = ("lesson_id", "completed", "completed_at", "last_position_seconds")
+
+
+def pack(rows):
+    """Comprime filas (tuplas en el orden de FIELDS)."""
+    data = [
+        [lesson_id, int(completed), completed_at.isoformat() if completed_at else None, position]
+        for lesson_id, completed, completed_at, position in rows
+    ]
+    return zlib.compress(json.dumps(data, separators=(",", ":")).encode(), 9)
+
+
+def unpack(data):
+    return [
+        (lesson_id, bool(completed), parse_datetime(completed_at) if completed_at else None, position)
+        for lesson_id, completed, completed_at, position in json.loads(zlib.decompress(bytes(data)))
+    ]
+
+
+def inactive_enrollments(inactive_days=None):
+    """Inscripciones sin actividad reciente que todavía tienen filas de progreso."""
+    inactive_days = inactive_days or getattr(settings, "PROGRESS_ARCHIVE_AFTER_DAYS", 365)
+    cutoff = timezone.now() - timedelta(days=inactive_days)
+    recent = CourseProgressSummary.objects.filter(
+        user_id=OuterRef("user_id"), course_id=OuterRef("course_id"), last_activity__gte=cutoff
+    )
+    has_progress = LessonProgress.objects.filter(user_id=OuterRef("user_id"), course_id=OuterRef("course_id"))
+    return (
+        Enrollment.objects.filter(progress_archived=False, enrolled_at__lt=cutoff)
+        .filter(Q(user__last_login__isnull=True) | Q(user__last_login__lt=cutoff))
+        .filter(~Exists(recent), Exists(has_progress))
+    )
+
+
+def archive_enrollment(enrollment_id):
+    """Archiva el progreso de una inscripción. Retorna las filas movidas."""
+    with transaction.atomic():
+        enrollment = (
+            Enrollment.objects.select_for_update(skip_locked=True)
+            .filter(pk=enrollment_id, progress_archived=False)
+            .only("id", "user_id", "course_id")
+            .first()
+        )
+        if enrollment is None:
+            return 0
+        progress = LessonProgress.objects.filter(user_id=enrollment.user_id, course_id=enrollment.course_id)
+        rows = list(progress.values_list(*FIELDS))
+        if not rows:
+            return 0
+        ArchivedProgress.objects.create(
+            user_id=enrollment.user_id,
+            course_id=enrollment.course_id,
+            data=pack(rows),
+            lesson_count=len(rows),
+            completed_count=sum(1 for row in rows if row[1]),
+        )
+        progress.delete()
+        Enrollment.objects.filter(pk=enrollment.pk).update(progress_archived=True)
+        access.invalidate_enrollments(enrollment.user_id)
+    return len(rows)
+
+
+def run(inactive_days=None, batch_size=BATCH_SIZE, dry_run=False):
+    """
+    Archiva las inscripciones inactivas en lotes de `batch_size`. Retorna
+    (inscripciones, filas) archivadas, o las candidatas con dry_run=True.
+    """
+    candidates = inactive_enrollments(inactive_days).order_by("pk").values_list("pk", flat=True)
+    if dry_run:
+        return candidates.count(), 0
+    enrollments = rows = 0
+    last_id = 0
+    while True:
+        batch = list(candidates.filter(pk__gt=last_id)[:batch_size])
+        if not batch:
+            return enrollments, rows
+        last_id = batch[-1]
+        for enrollment_id in batch:
+            moved = archive_enrollment(enrollment_id)
+            if moved:
+                enrollments += 1
+                rows += moved
+
+
+def remove_lesson(lesson):
+    """
+    Quita la lección del progreso archivado de su curso (se llama antes de
+    borrarla, ver courses.progress.lesson_removed). Retorna los usuarios que
+    la tenían completada.
+    """
+    completed_by = []
+    with transaction.atomic():
+        archived_rows = ArchivedProgress.objects.select_for_update().filter(course_id=lesson.course_id)
+        for archived in archived_rows.only("id", "user_id", "data"):
+            rows = unpack(archived.data)
+            kept = [row for row in rows if row[0] != lesson.pk]
+            if len(kept) == len(rows):
+                continue
+            if any(completed for lesson_id, completed, _, _ in rows if lesson_id == lesson.pk):
+                completed_by.append(archived.user_id)
+            ArchivedProgress.objects.filter(pk=archived.pk).update(
+                data=pack(kept), lesson_count=len(kept), completed_count=sum(1 for row in kept if row[1])
+            )
+    return completed_by
+
+
+def rehydrate(user_id, course_id):
+    """
+    Devuelve a LessonProgress el progreso archivado del usuario en el curso.
+    Se omiten las lecciones borradas mientras estaba archivado. Retorna las
+    filas restauradas.
+    """
+    with transaction.atomic():
+        archived = ArchivedProgress.objects.select_for_update().filter(user_id=user_id, course_id=course_id).first()
+        restored = []
+        if archived is not None:
+            lessons = set(Lesson.objects.filter(course_id=course_id).values_list("pk", flat=True))
+            restored = [
+                LessonProgress(
+                    user_id=user_id,
+                    lesson_id=lesson_id,
+                    course_id=course_id,
+                    completed=completed,
+                    completed_at=completed_at,
+                    last_position_seconds=position,
+                )
+                for lesson_id, completed, completed_at, position in unpack(archived.data)
+                if lesson_id in lessons
+            ]
+            # Si el alumno ya generó progreso nuevo en una lección, ese gana
+            LessonProgress.objects.bulk_create(restored, ignore_conflicts=True)
+            archived.delete()
+        Enrollment.objects.filter(user_id=user_id, course_id=course_id, progress_archived=True).update(
+            progress_archived=False
+        )
+        access.invalidate_enrollments(user_id)
+    if archived is not None:
+        logger.info(f"Progreso restaurado: usuario {user_id}, curso {course_id} ({len(restored)} lecciones)")
+    return len(restored)
+
+
+def rehydrate_for(request, course):
+    """Restaura el progreso del usuario del request si está archivado (antes de leerlo)."""
+    course_access = access.resolve(request, course)
+    if course_access.progress_archived:
+        rehydrate(request.user.id, course.pk)
+        course_access.progress_archived = False
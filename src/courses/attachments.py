@@ -0,0 +1,161 @@
+"""
+Reglas de los adjuntos de lecciones (extensiones y tamaños por tipo).
+
+Las usan LessonForm y los flujos de subida que no pasan por el formulario
+(courses.direct_upload y courses.chunked_upload), para que los límites
+estén en un solo lugar. Esos flujos entregan al formulario un token firmado
+con el nombre del archivo ya guardado y sus metadatos (sign_attachment /
+attachment_name).
+"""
+import posixpath
+import uuid
+from datetime import datetime
+
+from django import forms
+from django.conf import settings
+from django.core import signing
+from django.utils.text import get_valid_filename
+
+ATTACHMENT_SALT = "courses.uploaded-attachment"
+# Tiempo para enviar el formulario después de terminar la subida
+ATTACHMENT_TOKEN_MAX_AGE = 24 * 60 * 60
+
+ALLOWED_EXTENSIONS = {
+    "video": [".mp4", ".webm", ".mov", ".avi", ".mkv", ".m4v"],
+    "image": [".jpg", ".jpeg", ".png", ".gif", ".webp", ".svg"],
+    "file": [".pdf", ".doc", ".docx", ".zip", ".rar", ".txt", ".xlsx", ".xls", ".pptx", ".ppt"],
+}
+
+# (setting, valor por defecto) del tamaño máximo por tipo
+MAX_SIZE_SETTINGS = {
+    "video": ("MAX_VIDEO_SIZE", 100 * 1024 * 1024),
+    "image": ("MAX_IMAGE_SIZE", 10 * 1024 * 1024),
+    "file": ("MAX_FILE_SIZE", 50 * 1024 * 1024),
+}
+
+EXTENSION_ERRORS = {
+    "video": "Por favor sube un video válido (MP4, WebM, MOV, AVI, MKV) o usa una URL de video.",
+    "image": "Por favor sube una imagen válida (JPG, PNG, GIF, WEBP, SVG).",
+    "file": "Por favor sube un archivo válido (PDF, DOC, DOCX, ZIP, TXT, XLSX, PPTX, etc.).",
+}
+
+SIZE_ERRORS = {
+    "video": "El video es demasiado grande. Tamaño máximo: {max_size_mb:.0f} MB",
+    "image": "La imagen es demasiado grande. Tamaño máximo: {max_size_mb:.0f} MB",
+    "file": "El archivo es demasiado grande. Tamaño máximo: {max_size_mb:.0f} MB",
+}
+
+
+def max_attachment_size(content_type):
+    setting, default = MAX_SIZE_SETTINGS[content_type]
+    return getattr(settings, setting, default)
+
+
+def attachment_extension(name):
+    """Extensión permitida con la que termina el nombre (o None)."""
+    name = name.lower()
+    for extensions in ALLOWED_EXTENSIONS.values():
+        for extension in extensions:
+            if name.endswith(extension):
+                return extension
+    return None
+
+
+def validate_attachment(content_type, name, size):
+    """Valida extensión y tamaño según el tipo de lección (forms.ValidationError)."""
+    if content_type not in ALLOWED_EXTENSIONS:
+        return
+    if attachment_extension(name) not in ALLOWED_EXTENSIONS[content_type]:
+        raise forms.ValidationError(EXTENSION_ERRORS[content_type])
+    max_size = max_attachment_size(content_type)
+    if size > max_size:
+        raise forms.ValidationError(
+            SIZE_ERRORS[content_type].format(max_size_mb=max_size / (1024 * 1024))
+        )
+
+
+# Primeros bytes esperados por extensión: (desplazamiento, firmas posibles)
+ISO_MEDIA = (4, (b"ftyp", b"moov", b"mdat", b"wide", b"free", b"skip"))
+MATROSKA = (0, (b"\x1a\x45\xdf\xa3",))
+OLE = (0, (b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1",))
+ZIP = (0, (b"PK\x03\x04", b"PK\x05\x06"))
+SIGNATURES = {
+    ".mp4": ISO_MEDIA,
+    ".m4v": ISO_MEDIA,
+    ".mov": ISO_MEDIA,
+    ".webm": MATROSKA,
+    ".mkv": MATROSKA,
+    ".jpg": (0, (b"\xff\xd8\xff",)),
+    ".jpeg": (0, (b"\xff\xd8\xff",)),
+    ".png": (0, (b"\x89PNG\r\n\x1a\n",)),
+    ".gif": (0, (b"GIF87a", b"GIF89a")),
+    ".doc": OLE,
+    ".xls": OLE,
+    ".ppt": OLE,
+    ".docx": ZIP,
+    ".xlsx": ZIP,
+    ".pptx": ZIP,
+    ".zip": ZIP,
+    ".rar": (0, (b"Rar!\x1a\x07",)),
+}
+# Tipos RIFF: "RIFF" + tamaño + subtipo
+RIFF_TYPES = {".avi": b"AVI ", ".webp": b"WEBP"}
+
+CONTENT_ERROR = "El contenido del archivo no corresponde a su tipo."
+
+
+def content_matches(name, header):
+    """
+    True si los primeros bytes del archivo (`header`) corresponden a su
+    extensión. La extensión ya pasó validate_attachment.
+    """
+    extension = attachment_extension(name)
+    if extension in SIGNATURES:
+        offset, signatures = SIGNATURES[extension]
+        return header[offset:offset + max(map(len, signatures))].startswith(signatures)
+    if extension in RIFF_TYPES:
+        return header[:4] == b"RIFF" and header[8:12] == RIFF_TYPES[extension]
+    if extension == ".pdf":
+        # El estándar admite basura antes del encabezado (dentro del primer KB)
+        return b"%PDF-" in header[:1024]
+    if extension == ".svg":
+        return b"<svg" in header.lower()
+    if extension == ".txt":
+        return b"\x00" not in header
+    return False
+
+
+def attachment_upload_to(instance, filename):
+    """
+    upload_to de Lesson.attachment: un directorio único por archivo, así un
+    nombre nunca se reutiliza y su URL se puede cachear para siempre.
+    """
+    return posixpath.join(datetime.now().strftime("lessons/%Y/%m/%d"), uuid.uuid4().hex, filename)
+
+
+def new_attachment_name(filename):
+    """Nombre para Lesson.attachment, sin preguntar al storage si ya existe."""
+    from .models import Lesson
+
+    return Lesson._meta.get_field("attachment").generate_filename(None, get_valid_filename(filename))
+
+
+def sign_attachment(course, name, content_type, metadata=None):
+    return signing.dumps(
+        {"course": course.pk, "name": name, "type": content_type, "metadata": metadata or {}},
+        salt=ATTACHMENT_SALT,
+    )
+
+
+def attachment_name(token, course, content_type):
+    """
+    (nombre, metadatos) del archivo ya subido a partir del token de
+    sign_attachment().
+    """
+    try:
+        data = signing.loads(token, salt=ATTACHMENT_SALT, max_age=ATTACHMENT_TOKEN_MAX_AGE)
+    except signing.BadSignature:
+        raise forms.ValidationError("La subida del archivo expiró. Vuelve a subirlo.")
+    if data["course"] != course.pk or data["type"] != content_type:
+        raise forms.ValidationError("El archivo subido no corresponde a esta lección.")
+    return data["name"], data.get("metadata", {})
@@ -0,0 +1,184 @@
+"""
+Caché de páginas y fragmentos del catálogo.
+
+Las llaves llevan una versión por curso (y una global del catálogo) que se
+incrementa desde courses.signals cuando cambia un Course, Lesson, Comment o
+Enrollment; así nunca hay que borrar llaves: las viejas simplemente expiran.
+
+Los contadores de aciertos/fallos viven en el mismo caché para que se
+sumen entre workers (ver CacheStatsView).
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+
+from . import database
+
+CATALOG_VERSION_KEY = "catalog:version"
+COURSE_VERSION_KEY = "course:{}:version"
+COURSE_ID_KEY = "course:identifier:{}"
+CATALOG_TOTALS_KEY = "catalog:totals"
+STATS_KEY = "cache-stats:{}:{}"
+
+# Tipos de entrada con contadores propios
+KINDS = ("page", "fragment")
+
+
+def get_cache():
+    return caches[getattr(settings, "COURSE_CACHE_ALIAS", "default")]
+
+
+def shared():
+    """True si todos los procesos ven el mismo caché (locmem es por proceso)."""
+    return not isinstance(get_cache(), LocMemCache)
+
+
+def timeout():
+    return getattr(settings, "COURSE_CACHE_TIMEOUT", 300)
+
+
+def enabled():
+    return timeout() > 0
+
+
+def _new_version():
+    # Basada en el reloj: si el caché expulsa la llave de versión, la nueva
+    # nunca coincide con una versión anterior (evita servir contenido viejo)
+    return time.time_ns() // 1000
+
+
+def _get_version(key):
+    cache = get_cache()
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, _new_version(), None)
+        version = cache.get(key)
+    return version
+
+
+def _bump(key):
+    cache = get_cache()
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, _new_version(), None)
+
+
+def catalog_version():
+    return _get_version(CATALOG_VERSION_KEY)
+
+
+def course_version(course_id):
+    return _get_version(COURSE_VERSION_KEY.format(course_id))
+
+
+def attach_versions(courses):
+    """Asigna `cache_version` a cada curso con una sola lectura (get_many)."""
+    courses = list(courses)
+    keys = {COURSE_VERSION_KEY.format(course.pk): course for course in courses}
+    found = get_cache().get_many(keys.keys())
+    for key, course in keys.items():
+        course.cache_version = found.get(key) or _get_version(key)
+    return courses
+
+
+def invalidate_course(course_id, catalog=True):
+    """Invalida las páginas y fragmentos del curso (y opcionalmente el catálogo)."""
+
+    def bump():
+        _bump(COURSE_VERSION_KEY.format(course_id))
+        if catalog:
+            _bump(CATALOG_VERSION_KEY)
+
+    # Ahora y de nuevo al confirmar la transacción, para que una lectura
+    # concurrente no guarde datos sin confirmar bajo la versión nueva
+    bump()
+    transaction.on_commit(bump)
+
+
+def course_id_for_identifier(identifier):
+    """Resuelve identifier -> id (inmutable, se cachea sin expiración)."""
+    from .models import Course
+
+    cache = get_cache()
+    key = COURSE_ID_KEY.format(identifier)
+    course_id = cache.get(key)
+    if course_id is None:
+        course_id = Course.objects.filter(identifier=identifier).values_list("pk", flat=True).first()
+        if course_id is not None:
+            cache.set(key, course_id, None)
+    return course_id
+
+
+def catalog_totals():
+    """
+    Totales del catálogo (cursos e instructores) con un TTL corto, para no
+    hacer dos COUNT sobre toda la tabla en cada visita.
+    """
+    from .models import Course
+
+    cache = get_cache()
+    totals = cache.get(CATALOG_TOTALS_KEY)
+    if totals is None:
+        listed = Course.objects.filter(is_listed=True)
+        totals = {
+            "courses": listed.count(),
+            "instructors": listed.values("instructor").distinct().count(),
+        }
+        cache.set(CATALOG_TOTALS_KEY, totals, getattr(settings, "CATALOG_TOTALS_TIMEOUT", 60))
+    return totals
+
+
+def fragment_key(name, course):
+    version = getattr(course, "cache_version", None) or course_version(course.pk)
+    return f"fragment:{name}:{course.identifier}:{version}"
+
+
+def page_key(*parts):
+    digest = hashlib.md5(":".join(str(part) for part in parts).encode()).hexdigest()
+    return f"page:{digest}"
+
+
+def get_entry(key, kind):
+    value = get_cache().get(key)
+    record(kind, hit=value is not None)
+    return value
+
+
+def set_entry(key, value):
+    entry_timeout = timeout()
+    if database.reading_replica():
+        # La réplica puede ir atrasada respecto de la versión: poco tiempo
+        entry_timeout = min(entry_timeout, getattr(settings, "REPLICA_CACHE_TIMEOUT", 30))
+    get_cache().set(key, value, entry_timeout)
+
+
+def record(kind, hit):
+    cache = get_cache()
+    key = STATS_KEY.format(kind, "hits" if hit else "misses")
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 0, None)
+        cache.incr(key)
+
+
+def stats():
+    cache = get_cache()
+    keys = [STATS_KEY.format(kind, result) for kind in KINDS for result in ("hits", "misses")]
+    values = cache.get_many(keys)
+    result = {}
+    for kind in KINDS:
+        hits = values.get(STATS_KEY.format(kind, "hits"), 0)
+        misses = values.get(STATS_KEY.format(kind, "misses"), 0)
+        total = hits + misses
+        result[kind] = {
+            "hits": hits,
+            "misses": misses,
+            "hit_ratio": round(hits / total, 4) if total else None,
+        }
+    return result
@@ -0,0 +1,212 @@
+"""
+Subida por partes y reanudable (estilo tus) para almacenamiento local.
+
+Cada subida vive en CHUNKED_UPLOAD_DIR como dos archivos:
+- <id>.json: datos fijos (curso, usuario, tipo, nombre y tamaño total);
+- <id>.part: los bytes recibidos. Su tamaño ES el offset confirmado, así
+  que después de un corte basta un HEAD para saber desde dónde seguir.
+
+Cada PATCH agrega un chunk de a lo sumo CHUNKED_UPLOAD_CHUNK_SIZE bytes,
+leído del request en bloques (memoria acotada) y verificado con el header
+Upload-Checksum ("sha256 <base64>"). Con el último chunk el archivo se mueve
+con os.replace() a la ruta de upload_to de Lesson.attachment (mismo
+sistema de archivos, sin copiar) y se retorna el token del adjunto con sus
+metadatos (courses.metadata), calculados leyendo el archivo una vez.
+
+sweep_staging() (comando sweep_upload_staging) borra las subidas sin
+actividad por más de CHUNKED_UPLOAD_EXPIRES segundos.
+"""
+import base64
+import fcntl
+import hashlib
+import json
+import os
+import time
+import uuid
+
+from django import forms
+from django.conf import settings
+
+from . import metadata
+from .attachments import new_attachment_name, sign_attachment, validate_attachment
+
+READ_BLOCK_SIZE = 64 * 1024
+
+
+class ChunkError(Exception):
+    """Chunk rechazado. `status` es el código HTTP a responder."""
+
+    def __init__(self, message, status=400, offset=None):
+        super().__init__(message)
+        self.status = status
+        self.offset = offset
+
+
+def enabled():
+    return not getattr(settings, "USE_CLOUD_STORAGE", False)
+
+
+def chunk_size():
+    return getattr(settings, "CHUNKED_UPLOAD_CHUNK_SIZE", 5 * 1024 * 1024)
+
+
+def staging_dir():
+    return getattr(settings, "CHUNKED_UPLOAD_DIR", "") or os.path.join(settings.MEDIA_ROOT, ".staging")
+
+
+def _paths(upload_id):
+    directory = staging_dir()
+    return os.path.join(directory, f"{upload_id}.json"), os.path.join(directory, f"{upload_id}.part")
+
+
+def create_upload(course, user, content_type, filename, size):
+    """Registra una subida nueva y retorna su id."""
+    try:
+        size = int(size)
+    except (TypeError, ValueError):
+        raise ChunkError("Tamaño de archivo inválido.")
+    if size <= 0:
+        raise ChunkError("El archivo está vacío.")
+    try:
+        validate_attachment(content_type, filename or "", size)
+    except forms.ValidationError as e:
+        raise ChunkError(e.messages[0])
+
+    upload_id = uuid.uuid4().hex
+    meta_path, part_path = _paths(upload_id)
+    os.makedirs(staging_dir(), exist_ok=True)
+    with open(part_path, "xb"):
+        pass
+    with open(meta_path, "x") as meta_file:
+        json.dump(
+            {
+                "course": course.pk,
+                "user": user.pk,
+                "type": content_type,
+                "filename": filename,
+                "size": size,
+            },
+            meta_file,
+        )
+    return upload_id
+
+
+def get_upload(upload_id, course, user):
+    """Datos de la subida con su offset actual, o None si no existe o es ajena."""
+    meta_path, part_path = _paths(upload_id)
+    try:
+        with open(meta_path) as meta_file:
+            meta = json.load(meta_file)
+        meta["offset"] = os.path.getsize(part_path)
+    except (OSError, ValueError):
+        return None
+    if meta["course"] != course.pk or meta["user"] != user.pk:
+        return None
+    return meta
+
+
+def _parse_checksum(header):
+    if not header:
+        return None
+    algorithm, _, digest = header.partition(" ")
+    if algorithm.lower() != "sha256":
+        raise ChunkError("Algoritmo de checksum no soportado (usa sha256).")
+    try:
+        return base64.b64decode(digest, validate=True)
+    except ValueError:
+        raise ChunkError("Checksum inválido.")
+
+
+def append_chunk(upload_id, meta, offset, length, stream, checksum_header=None):
+    """
+    Agrega el chunk en `offset` leyendo `length` bytes de `stream`.
+    Retorna el offset nuevo.
+    """
+    expected_digest = _parse_checksum(checksum_header)
+    if length <= 0 or length > chunk_size():
+        raise ChunkError("Tamaño de chunk inválido.", status=413)
+    if offset + length > meta["size"]:
+        raise ChunkError("El chunk excede el tamaño declarado.", status=413)
+
+    meta_path, part_path = _paths(upload_id)
+    with open(part_path, "r+b") as part:
+        try:
+            # Un solo escritor por subida; un reintento concurrente recibe 409
+            fcntl.flock(part, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            raise ChunkError("Otro chunk se está escribiendo.", status=409)
+        current = os.fstat(part.fileno()).st_size
+        if offset != current:
+            raise ChunkError("Offset incorrecto.", status=409, offset=current)
+
+        part.seek(offset)
+        digest = hashlib.sha256()
+        received = 0
+        while received < length:
+            data = stream.read(min(READ_BLOCK_SIZE, length - received))
+            if not data:
+                break
+            part.write(data)
+            digest.update(data)
+            received += len(data)
+
+        if received != length or (expected_digest and digest.digest() != expected_digest):
+            # Se descarta el chunk completo: el offset confirmado no cambia
+            part.truncate(offset)
+            if received != length:
+                raise ChunkError("Chunk incompleto.", offset=offset)
+            raise ChunkError("El checksum no coincide.", status=460, offset=offset)
+        part.flush()
+
+    # La fecha del .json marca la última actividad (ver sweep_staging)
+    os.utime(meta_path)
+    return offset + length
+
+
+def finish_upload(upload_id, meta, course):
+    """Mueve el archivo completo a su ruta final y retorna el token del adjunto."""
+    from .models import Lesson
+
+    meta_path, part_path = _paths(upload_id)
+    storage = Lesson._meta.get_field("attachment").storage
+    name = new_attachment_name(meta["filename"])
+    target = storage.path(name)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    os.replace(part_path, target)
+    permissions = getattr(settings, "FILE_UPLOAD_PERMISSIONS", None)
+    if permissions is not None:
+        os.chmod(target, permissions)
+    os.remove(meta_path)
+    return sign_attachment(course, name, meta["type"], metadata.from_path(target, name))
+
+
+def sweep_staging(max_age=None, dry_run=False):
+    """Borra subidas sin actividad reciente. Retorna cuántas se borraron."""
+    if max_age is None:
+        max_age = getattr(settings, "CHUNKED_UPLOAD_EXPIRES", 24 * 60 * 60)
+    directory = staging_dir()
+    if not os.path.isdir(directory):
+        return 0
+    cutoff = time.time() - max_age
+    upload_ids = {
+        os.path.splitext(entry.name)[0]
+        for entry in os.scandir(directory)
+        if entry.name.endswith((".json", ".part"))
+    }
+    removed = 0
+    for upload_id in upload_ids:
+        paths = [path for path in _paths(upload_id) if os.path.exists(path)]
+        # La fecha del .json (o del .part si quedó solo) es la última actividad
+        try:
+            if not paths or os.path.getmtime(paths[0]) >= cutoff:
+                continue
+        except FileNotFoundError:
+            continue
+        removed += 1
+        if not dry_run:
+            for path in paths:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+    return removed
@@ -0,0 +1,257 @@
+"""
+Borrado de archivos del storage en segundo plano.
+
+Borrar en el request (un DELETE al bucket por archivo, varios cientos para
+una escalera HLS) hace esperar al usuario y, si falla, el archivo queda
+huérfano. En su lugar, quien suelta un archivo lo anota en StorageDeletion
+dentro de la misma transacción que el cambio en la base de datos (si se
+revierte, no se borra nada) y el worker `process_storage_deletions` los
+borra en lotes:
+
+- en el bucket, con DeleteObjects (hasta 1000 llaves por llamada);
+- en disco, uno por uno.
+
+Los prefijos (directorios de una corrida de HLS) se expanden al
+procesarlos. Lo que falla se reintenta con espera exponencial (hasta
+MAX_RETRY_DELAY) y nunca se descarta.
+
+`gc_media` recorre el listado del storage por páginas y anota los archivos
+que nada referencia: huérfanos de versiones anteriores a esta cola o de
+subidas directas que nunca se asociaron a una lección.
+"""
+import logging
+import re
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .storage import BLOB_PREFIX, DeduplicatingStorage, base_storage
+
+logger = logging.getLogger("courses")
+
+# Máximo de llaves por llamada a DeleteObjects
+BATCH_SIZE = 1000
+MAX_RETRY_DELAY = 60 * 60
+
+# Lo que gc_media revisa: adjuntos (y sus derivados) y blobs deduplicados
+GC_PREFIXES = ("lessons/", BLOB_PREFIX)
+# Directorio de una corrida de HLS o de variantes de imagen
+RUN_DIRECTORY = re.compile(r"^(.+?\.(?:hls|variants)/\d+/[0-9a-f]+)/")
+
+
+def attachment_storage():
+    from .models import Lesson
+
+    return base_storage(Lesson._meta.get_field("attachment").storage)
+
+
+def enqueue(names, prefix=False):
+    """Anota archivos (o prefijos, con prefix=True) para borrarlos."""
+    from .models import StorageDeletion
+
+    StorageDeletion.objects.bulk_create(
+        [StorageDeletion(name=name, is_prefix=prefix) for name in names if name],
+        ignore_conflicts=True,
+    )
+
+
+def release(storage, name):
+    """
+    Suelta el adjunto `name` de una lección. Con deduplicación resta una
+    referencia y el blob se anota recién cuando llega a cero.
+
+    Todo en una transacción: si el blob se borrara de AttachmentBlob antes
+    de anotarlo, una subida del mismo contenido en ese intervalo lo volvería
+    a registrar y el borrado anotado después se llevaría un blob en uso.
+    """
+    with transaction.atomic():
+        if isinstance(storage, DeduplicatingStorage):
+            name = storage.release(name)
+        if name:
+            enqueue([name])
+
+
+def list_files(storage, prefix):
+    """Archivos bajo `prefix`, recorriendo los subdirectorios."""
+    try:
+        directories, files = storage.listdir(prefix)
+    except (FileNotFoundError, NotImplementedError):
+        return
+    for directory in directories:
+        yield from list_files(storage, f"{prefix}/{directory}")
+    for name in files:
+        yield f"{prefix}/{name}"
+
+
+def _cloud():
+    return getattr(settings, "USE_CLOUD_STORAGE", False)
+
+
+def delete_files(storage, names):
+    """Borra `names` y retorna {nombre: error} de los que fallaron."""
+    if not names:
+        return {}
+    if _cloud():
+        return _delete_objects(names)
+    errors = {}
+    for name in names:
+        try:
+            storage.delete(name)
+        except Exception as e:
+            errors[name] = e
+    return errors
+
+
+def _delete_objects(names):
+    from botocore.exceptions import BotoCoreError, ClientError
+
+    from .direct_upload import object_key, s3_client
+
+    keys = {object_key(name): name for name in names}
+    try:
+        response = s3_client().delete_objects(
+            Bucket=settings.AWS_STORAGE_BUCKET_NAME,
+            # Quiet: la respuesta solo trae las llaves que fallaron
+            Delete={"Objects": [{"Key": key} for key in keys], "Quiet": True},
+        )
+    except (BotoCoreError, ClientError) as e:
+        return {name: e for name in names}
+    return {
+        keys[error["Key"]]: f"{error.get('Code')}: {error.get('Message')}"
+        for error in response.get("Errors", [])
+        if error.get("Key") in keys
+    }
+
+
+def process_batch(batch_size=None):
+    """
+    Borra un lote de archivos pendientes. Retorna (tomados, borrados, fallidos).
+    """
+    from .models import StorageDeletion
+
+    batch_size = min(batch_size or getattr(settings, "STORAGE_CLEANUP_BATCH_SIZE", BATCH_SIZE), BATCH_SIZE)
+    retry_delay = getattr(settings, "STORAGE_CLEANUP_RETRY_DELAY", 60)
+    storage = attachment_storage()
+    now = timezone.now()
+    with transaction.atomic():
+        # Las filas quedan bloqueadas mientras se borra: una subida del mismo
+        # blob espera a que termine y lo vuelve a subir (courses.storage)
+        pending = list(
+            StorageDeletion.objects.select_for_update(skip_locked=True)
+            .filter(available_at__lte=now)
+            .order_by("available_at", "id")[:batch_size]
+        )
+        errors = {}
+        for entry in pending:
+            if entry.is_prefix:
+                try:
+                    enqueue(list_files(storage, entry.name))
+                except Exception as e:
+                    errors[entry.name] = e
+        files = [entry.name for entry in pending if not entry.is_prefix]
+        errors.update(delete_files(storage, files))
+
+        failed = [entry for entry in pending if entry.name in errors]
+        for entry in failed:
+            entry.attempts += 1
+            entry.error = str(errors[entry.name])[:2000]
+            entry.available_at = now + timedelta(
+                seconds=min(retry_delay * 2 ** (entry.attempts - 1), MAX_RETRY_DELAY)
+            )
+            logger.warning(f"No se pudo borrar {entry.name} del storage: {entry.error}")
+        StorageDeletion.objects.bulk_update(failed, ["attempts", "error", "available_at"])
+        StorageDeletion.objects.filter(pk__in=[entry.pk for entry in pending if entry.name not in errors]).delete()
+    deleted = len([name for name in files if name not in errors])
+    return len(pending), deleted, len(failed)
+
+
+def run(batch_size=None, once=False, poll_interval=5):
+    """
+    Procesa la cola lote por lote. Con once=True termina cuando no queda
+    nada disponible. Retorna (borrados, fallidos).
+    """
+    deleted = failed = 0
+    while True:
+        claimed, batch_deleted, batch_failed = process_batch(batch_size)
+        deleted += batch_deleted
+        failed += batch_failed
+        if not claimed:
+            if once:
+                return deleted, failed
+            time.sleep(poll_interval)
+
+
+def iter_listing(prefix, page_size=BATCH_SIZE):
+    """Páginas de (nombre, fecha de modificación) de los archivos bajo `prefix`."""
+    if _cloud():
+        from .direct_upload import object_key, s3_client
+
+        # El listado trae la fecha de cada objeto sin un HEAD por archivo
+        location = object_key("")
+        paginator = s3_client().get_paginator("list_objects_v2")
+        for page in paginator.paginate(
+            Bucket=settings.AWS_STORAGE_BUCKET_NAME,
+            Prefix=object_key(prefix),
+            PaginationConfig={"PageSize": page_size},
+        ):
+            yield [(item["Key"][len(location):], item["LastModified"]) for item in page.get("Contents", [])]
+        return
+    storage = attachment_storage()
+    page = []
+    for name in list_files(storage, prefix.rstrip("/")):
+        page.append((name, storage.get_modified_time(name)))
+        if len(page) >= page_size:
+            yield page
+            page = []
+    if page:
+        yield page
+
+
+def referenced(names):
+    """Los nombres de `names` que una lección o un blob usan."""
+    from .models import AttachmentBlob, Lesson
+    from .transcoding import MASTER_PLAYLIST
+
+    used = set(Lesson.objects.filter(attachment__in=names).values_list("attachment", flat=True))
+    used |= set(AttachmentBlob.objects.filter(key__in=names).values_list("key", flat=True))
+    runs = {}
+    for name in names:
+        match = RUN_DIRECTORY.match(name)
+        if match:
+            runs.setdefault(match.group(1), []).append(name)
+    if runs:
+        live = {
+            playlist.rsplit("/", 1)[0]
+            for playlist in Lesson.objects.filter(
+                hls_playlist__in=[f"{run}/{MASTER_PLAYLIST}" for run in runs]
+            ).values_list("hls_playlist", flat=True)
+        }
+        live |= set(
+            Lesson.objects.filter(image_variants__prefix__in=list(runs)).values_list(
+                "image_variants__prefix", flat=True
+            )
+        )
+        for run in live & runs.keys():
+            used.update(runs[run])
+    return used
+
+
+def find_orphans(min_age, page_size=BATCH_SIZE):
+    """
+    Recorre el storage por páginas y retorna, página por página, los
+    archivos sin referencias modificados hace más de `min_age` (las subidas
+    recientes pueden no estar asociadas todavía a su lección).
+    """
+    cutoff = timezone.now() - min_age
+    for prefix in GC_PREFIXES:
+        for page in iter_listing(prefix, page_size):
+            old = [name for name, modified in page if modified < cutoff]
+            if not old:
+                continue
+            used = referenced(old)
+            orphans = [name for name in old if name not in used]
+            if orphans:
+                yield orphans
@@ -0,0 +1,47 @@
+"""Recalcula los contadores desnormalizados de Course desde las tablas reales."""
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def _subquery(queryset, aggregate):
+    return Coalesce(
+        Subquery(
+            queryset.filter(course=OuterRef("pk"))
+            .order_by()
+            .values("course")
+            .annotate(total=aggregate)
+            .values("total"),
+            output_field=IntegerField(),
+        ),
+        Value(0),
+    )
+
+
+def counter_expressions(Lesson, Enrollment, Comment, CourseRating):
+    """
+    Expresiones para un único UPDATE ... SET campo = (SELECT COUNT ...).
+    Recibe los modelos para poder usarse también desde migraciones.
+    """
+    return {
+        "lesson_count": _subquery(Lesson.objects.all(), Count("pk")),
+        "enrollment_count": _subquery(Enrollment.objects.all(), Count("pk")),
+        "comment_count": _subquery(Comment.objects.all(), Count("pk")),
+        "rating_sum": _subquery(CourseRating.objects.all(), Sum("rating")),
+        "rating_count": _subquery(CourseRating.objects.all(), Count("pk")),
+    }
+
+
+def rebuild_counters(Course, Lesson, Enrollment, Comment, CourseRating, batch_size=1000):
+    """Reconstruye los contadores por rangos de id. Retorna los cursos actualizados."""
+    expressions = counter_expressions(Lesson, Enrollment, Comment, CourseRating)
+    ids = Course.objects.order_by("pk").values_list("pk", flat=True)
+    updated = 0
+    last_id = 0
+    while True:
+        batch = list(ids.filter(pk__gt=last_id)[:batch_size])
+        if not batch:
+            return updated
+        updated += Course.objects.filter(pk__gte=batch[0], pk__lte=batch[-1]).update(
+            **expressions
+        )
+        last_id = batch[-1]
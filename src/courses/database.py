@@ -0,0 +1,208 @@
+"""
+Conexiones a la base de datos: estado del pool y réplica de lectura.
+
+Con DB_POOL=1 cada proceso (worker de gunicorn o de management) tiene un
+pool de psycopg por alias; sin pool, Django reusa una conexión persistente
+por hilo hasta CONN_MAX_AGE. Las estadísticas son del proceso que atiende
+el request: con varios workers, cada uno reporta las suyas (ver "pid").
+"""
+import logging
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+logger = logging.getLogger("courses")
+
+
+def pool_stats():
+    """Configuración y estadísticas de conexión de cada alias en este proceso."""
+    databases = {}
+    for alias in connections:
+        connection = connections[alias]
+        pool = getattr(connection, "pool", None)
+        databases[alias] = {
+            "vendor": connection.vendor,
+            "conn_max_age": connection.settings_dict["CONN_MAX_AGE"],
+            "health_checks": connection.settings_dict["CONN_HEALTH_CHECKS"],
+            # requests_wait_ms / requests_queued muestran si el pool queda chico
+            "pool": pool.get_stats() if pool else None,
+        }
+    return {"pid": os.getpid(), "databases": databases}
+
+
+# Réplica de lectura
+#
+# Con DATABASE_REPLICA (alias de DATABASES) las vistas de solo lectura
+# marcadas con ReplicaReadMixin leen de la réplica. El resto de las
+# consultas, y toda escritura, va al primario. Quien escribe queda fijado
+# al primario (cookie, ver pin_seconds) para leer lo que acaba de escribir,
+# y si la réplica no responde o se atrasa más de REPLICA_MAX_LAG se vuelve
+# al primario hasta el siguiente chequeo.
+
+PIN_COOKIE = "db_primary"
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+_routing = ContextVar("database_routing", default=None)
+_replica_health = {"healthy": True, "checked_at": None}
+_health_lock = threading.Lock()
+
+
+class RequestRouting:
+    """Estado de ruteo de un request."""
+
+    def __init__(self, pinned=False):
+        self.pinned = pinned
+        self.read_replica = False
+        self.wrote = False
+
+
+def replica_alias():
+    alias = getattr(settings, "DATABASE_REPLICA", "")
+    return alias if alias in connections else None
+
+
+def pin_seconds():
+    """
+    Segundos que se fija al primario a quien escribe. Nunca menos que el
+    atraso que se tolera a la réplica (REPLICA_MAX_LAG, más el intervalo
+    entre chequeos): antes de eso la réplica sana podría no tener aún la
+    escritura.
+    """
+    tolerated = getattr(settings, "REPLICA_MAX_LAG", 30) + getattr(settings, "REPLICA_HEALTH_INTERVAL", 5)
+    return max(getattr(settings, "REPLICA_PIN_SECONDS", 10), math.ceil(tolerated))
+
+
+def reading_replica():
+    """
+    True si las lecturas de este request van a la réplica. Después de la
+    primera escritura del request, el resto de sus lecturas va al primario.
+    """
+    state = _routing.get()
+    return bool(state and state.read_replica and not state.wrote)
+
+
+def replica_lag(alias):
+    """Segundos de atraso de la réplica (0 si está al día o no es una réplica)."""
+    connection = connections[alias]
+    if connection.vendor != "postgresql":
+        connection.ensure_connection()
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+            "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END"
+        )
+        lag = cursor.fetchone()[0]
+    return float(lag or 0)
+
+
+def replica_healthy(alias):
+    """Estado de la réplica, verificado a lo sumo cada REPLICA_HEALTH_INTERVAL segundos."""
+    interval = getattr(settings, "REPLICA_HEALTH_INTERVAL", 5)
+    now = time.monotonic()
+    with _health_lock:
+        checked_at = _replica_health["checked_at"]
+        if checked_at is not None and now - checked_at < interval:
+            return _replica_health["healthy"]
+        _replica_health["checked_at"] = now
+    try:
+        lag = replica_lag(alias)
+        healthy = lag <= getattr(settings, "REPLICA_MAX_LAG", 30)
+        if not healthy:
+            logger.warning(f"Réplica {alias} atrasada {lag:.1f}s: se lee del primario")
+    except DatabaseError as e:
+        logger.warning(f"Réplica {alias} no disponible: {e}")
+        connections[alias].close()
+        healthy = False
+    _replica_health["healthy"] = healthy
+    return healthy
+
+
+def mark_replica_down():
+    """La réplica falló a mitad de un request: se deja de usar hasta el próximo chequeo."""
+    with _health_lock:
+        _replica_health.update(healthy=False, checked_at=time.monotonic())
+    alias = replica_alias()
+    if alias:
+        connections[alias].close()
+
+
+@contextmanager
+def replica_reads(request):
+    """
+    Envía las lecturas del bloque a la réplica si hay una configurada y sana,
+    el request es de lectura y el usuario no escribió hace poco. Retorna si
+    se usa la réplica.
+    """
+    state = _routing.get()
+    alias = replica_alias()
+    use = bool(
+        alias
+        and state is not None
+        and not state.pinned
+        and request.method in SAFE_METHODS
+        and replica_healthy(alias)
+    )
+    if not use:
+        yield False
+        return
+    state.read_replica = True
+    try:
+        yield True
+    finally:
+        state.read_replica = False
+
+
+class PrimaryPinningMiddleware:
+    """
+    Registra si el request escribió en la base de datos y, en ese caso (o
+    si el método no es de lectura), fija al usuario al primario un rato.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        state = RequestRouting(pinned=PIN_COOKIE in request.COOKIES)
+        token = _routing.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _routing.reset(token)
+        if replica_alias() and (state.wrote or request.method not in SAFE_METHODS):
+            response.set_cookie(
+                PIN_COOKIE,
+                "1",
+                max_age=pin_seconds(),
+                secure=settings.SESSION_COOKIE_SECURE,
+                httponly=True,
+                samesite="Lax",
+            )
+        return response
+
+
+class ReplicaRouter:
+    """Lecturas a la réplica dentro de replica_reads(); todo lo demás al primario."""
+
+    def db_for_read(self, model, **hints):
+        if reading_replica() and not connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return replica_alias() or DEFAULT_DB_ALIAS
+        # Explícito: un objeto leído de la réplica (y guardado en caché) no
+        # debe arrastrar a la réplica las lecturas de sus relaciones
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        state = _routing.get()
+        if state is not None:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Réplica y primario tienen los mismos datos
+        return True
@@ -0,0 +1,71 @@
+"""
+Deduplicación en segundo plano de los archivos subidos directo al bucket.
+
+Con DEDUPLICATE_ATTACHMENTS, LessonForm deduplica al guardar los archivos
+cuyo SHA-256 ya conoce (los subidos por el formulario o por partes). Los de
+courses.direct_upload nunca pasan por Django: la petición no los lee, la
+lección queda con el archivo tal como se subió y entra en la cola "dedup"
+(courses.jobs). El worker `deduplicate_attachments`:
+
+1. Lee el objeto desde el storage en bloques y calcula su SHA-256.
+2. Con la fila de la lección bloqueada, y solo si el archivo no cambió, lo
+   registra como blob (DeduplicatingStorage.adopt) y guarda el nuevo nombre.
+3. Si el HLS o las variantes de la imagen se estaban generando a partir del
+   nombre anterior, los vuelve a poner en cola (su resultado se descartaría).
+"""
+import hashlib
+import logging
+
+from django.db import transaction
+
+from . import images, transcoding
+from .jobs import PENDING, PROCESSING, LessonJobQueue
+from .storage import CHUNK_SIZE, DeduplicatingStorage
+
+logger = logging.getLogger("courses")
+
+queue = LessonJobQueue("dedup", "DEDUP")
+
+
+def needed(storage, name):
+    """True si el archivo `name` todavía no está deduplicado."""
+    return bool(name) and isinstance(storage, DeduplicatingStorage) and not storage.is_blob(name)
+
+
+def enqueue(lesson):
+    queue.enqueue([lesson.pk])
+    lesson.dedup_status = PENDING
+
+
+def deduplicate(lesson_id):
+    """Trabajo de la cola: registra el adjunto de la lección como blob."""
+    from .models import Lesson
+
+    lesson = Lesson.objects.get(pk=lesson_id)
+    field = Lesson._meta.get_field("attachment")
+    name = lesson.attachment.name if lesson.attachment else ""
+    if not needed(field.storage, name):
+        queue.complete(lesson_id)
+        return
+
+    digest = hashlib.sha256()
+    size = 0
+    with field.storage.open(name, "rb") as file:
+        for chunk in file.chunks(CHUNK_SIZE):
+            digest.update(chunk)
+            size += len(chunk)
+
+    with transaction.atomic():
+        # Bloqueada, el formulario no puede cambiar el archivo mientras se mueve
+        if not Lesson.objects.select_for_update().filter(
+            pk=lesson_id, attachment=name, dedup_status=PROCESSING
+        ).exists():
+            # El archivo cambió (o la lección se reencoló) mientras se leía
+            queue.complete(lesson_id)
+            return
+        adopted = field.storage.adopt(name, digest.hexdigest(), size, field.max_length)
+        queue.complete(lesson_id, attachment=adopted, attachment_sha256=digest.hexdigest())
+        for media in (transcoding.queue, images.queue):
+            if Lesson.objects.filter(pk=lesson_id, **{f"{media.prefix}_status__in": [PENDING, PROCESSING]}).exists():
+                media.enqueue([lesson_id])
+    logger.info(f"Adjunto deduplicado para la lección {lesson_id}: {adopted}")
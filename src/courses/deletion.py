@@ -0,0 +1,203 @@
+"""
+Borrado de cursos en segundo plano, por lotes.
+
+Course.delete() junta en memoria todas las lecciones, inscripciones,
+progresos, calificaciones y comentarios y los borra en una sola
+transacción: en un curso popular son cientos de miles de filas, el request
+vence y los locks duran minutos. En su lugar:
+
+1. request_deletion() marca el curso (deletion_requested_at), lo saca del
+   catálogo (is_listed=False) y del índice de búsqueda; desde ese momento
+   las páginas del curso responden 404 (courses.access.get_course).
+2. El worker `delete_courses` borra las filas dependientes tabla por tabla
+   con DELETE de a lo sumo `batch_size` filas, cada uno en su transacción
+   (locks cortos). Al borrar lecciones, sus archivos pasan a la cola de
+   borrado (courses.cleanup).
+3. Sin dependientes, se borra el curso.
+
+El avance queda en deletion_done / deletion_total y el instructor lo ve en
+su panel. Todo el estado está en la base de datos: si el worker se cae, al
+volver sigue con lo que falte.
+"""
+import logging
+import time
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import access, caching, cleanup, images, search, transcoding
+from .models import (
+    ArchivedProgress,
+    Comment,
+    Course,
+    CourseProgressSummary,
+    CourseRating,
+    Enrollment,
+    Lesson,
+    LessonProgress,
+)
+
+logger = logging.getLogger("courses")
+
+BATCH_SIZE = 1000
+
+
+def request_deletion(course):
+    """Marca el curso para borrarlo en segundo plano y lo oculta de inmediato."""
+    total = (
+        LessonProgress.objects.filter(course=course).count()
+        + CourseProgressSummary.objects.filter(course=course).count()
+        + ArchivedProgress.objects.filter(course=course).count()
+        + course.comment_count
+        + course.rating_count
+        + course.enrollment_count
+        + course.lesson_count
+    )
+    Course.objects.filter(pk=course.pk).update(
+        deletion_requested_at=timezone.now(), deletion_total=total, deletion_done=0, is_listed=False
+    )
+    search.remove_courses([course.pk])
+    caching.invalidate_course(course.pk)
+
+
+def _raw_delete(model, where, params, batch_size):
+    """DELETE de hasta `batch_size` filas de `model` que cumplen `where` (SQL)."""
+    table = connection.ops.quote_name(model._meta.db_table)
+    pk = connection.ops.quote_name(model._meta.pk.column)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"DELETE FROM {table} WHERE {pk} IN (SELECT {pk} FROM {table} WHERE {where} LIMIT %s)",
+            [*params, batch_size],
+        )
+        return cursor.rowcount
+
+
+def _delete_ids(model, ids):
+    if not ids:
+        return 0
+    table = connection.ops.quote_name(model._meta.db_table)
+    pk = connection.ops.quote_name(model._meta.pk.column)
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {table} WHERE {pk} IN ({', '.join(['%s'] * len(ids))})", ids)
+        return cursor.rowcount
+
+
+def _column(model, field):
+    return connection.ops.quote_name(model._meta.get_field(field).column)
+
+
+def _delete_progress(course_id, batch_size):
+    lessons = (
+        f"SELECT {connection.ops.quote_name(Lesson._meta.pk.column)} "
+        f"FROM {connection.ops.quote_name(Lesson._meta.db_table)} WHERE {_column(Lesson, 'course')} = %s"
+    )
+    return _raw_delete(LessonProgress, f"{_column(LessonProgress, 'lesson')} IN ({lessons})", [course_id], batch_size)
+
+
+def _delete_by_course(model):
+    def delete(course_id, batch_size):
+        return _raw_delete(model, f"{_column(model, 'course')} = %s", [course_id], batch_size)
+
+    return delete
+
+
+def _delete_enrollments(course_id, batch_size):
+    rows = list(Enrollment.objects.filter(course_id=course_id).values_list("pk", "user_id")[:batch_size])
+    deleted = _delete_ids(Enrollment, [pk for pk, _ in rows])
+    # Sin señales: el caché de inscripciones de cada alumno se invalida aquí
+    user_ids = {user_id for _, user_id in rows}
+
+    def invalidate():
+        for user_id in user_ids:
+            access.invalidate_enrollments(user_id)
+
+    transaction.on_commit(invalidate)
+    return deleted
+
+
+def _delete_lessons(course_id, batch_size):
+    lessons = list(
+        Lesson.objects.filter(course_id=course_id).only("id", "attachment", "hls_playlist", "image_variants")[
+            :batch_size
+        ]
+    )
+    for lesson in lessons:
+        if lesson.attachment:
+            cleanup.release(lesson.attachment.storage, lesson.attachment.name)
+        transcoding.discard_output(lesson)
+        images.discard_output(lesson)
+    return _delete_ids(Lesson, [lesson.pk for lesson in lessons])
+
+
+# En orden: cada tabla antes que aquellas a las que apunta
+STEPS = (
+    _delete_by_course(LessonProgress),
+    # Filas de progreso sin curso asignado (anteriores al backfill de 0018)
+    _delete_progress,
+    _delete_by_course(CourseProgressSummary),
+    _delete_by_course(ArchivedProgress),
+    _delete_by_course(Comment),
+    _delete_by_course(CourseRating),
+    _delete_enrollments,
+    _delete_lessons,
+)
+
+
+def delete_batch(course_id, batch_size=None):
+    """
+    Borra un lote de filas del curso. Retorna las filas borradas, 0 si se
+    borró el curso (terminó) o None si no hay nada que hacer (el curso no
+    está marcado u otro worker lo está procesando).
+    """
+    batch_size = batch_size or getattr(settings, "COURSE_DELETION_BATCH_SIZE", BATCH_SIZE)
+    with transaction.atomic():
+        course = (
+            Course.objects.select_for_update(skip_locked=True)
+            .filter(pk=course_id, deletion_requested_at__isnull=False)
+            .only("id")
+            .first()
+        )
+        if course is None:
+            return None
+        for step in STEPS:
+            deleted = step(course_id, batch_size)
+            if deleted:
+                Course.objects.filter(pk=course_id).update(deletion_done=F("deletion_done") + deleted)
+                return deleted
+        # Sin dependientes: el collector de Django solo encuentra tablas vacías
+        course.delete()
+    logger.info(f"Curso {course_id} eliminado")
+    return 0
+
+
+def delete_course(course_id, batch_size=None):
+    """Borra el curso marcado lote por lote. Retorna las filas borradas."""
+    total = 0
+    while True:
+        deleted = delete_batch(course_id, batch_size)
+        if not deleted:
+            return total
+        total += deleted
+
+
+def run(batch_size=None, once=False, poll_interval=5):
+    """
+    Borra los cursos marcados, del más antiguo al más nuevo. Con once=True
+    termina cuando no queda ninguno. Retorna cuántos cursos borró.
+    """
+    deleted_courses = 0
+    while True:
+        pending = list(
+            Course.objects.filter(deletion_requested_at__isnull=False)
+            .order_by("deletion_requested_at")
+            .values_list("pk", flat=True)
+        )
+        for course_id in pending:
+            delete_course(course_id, batch_size)
+            if not Course.objects.filter(pk=course_id).exists():
+                deleted_courses += 1
+        if once:
+            return deleted_courses
+        time.sleep(poll_interval)
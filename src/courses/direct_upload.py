@@ -0,0 +1,230 @@
+"""
+Subida directa del navegador al bucket (S3 / OCI Object Storage) con
+multipart upload y URLs prefirmadas. Django nunca recibe los bytes:
+
+1. start_upload(): valida nombre y tamaño declarados, abre el multipart
+   upload y firma una URL PUT por parte.
+2. El navegador sube las partes directo al bucket y guarda el ETag de cada una.
+3. complete_upload(): cierra el multipart upload, revisa con HEAD el tamaño
+   real y con una lectura parcial (Range) que los primeros bytes
+   correspondan al tipo declarado, y retorna un token firmado con el nombre
+   del archivo y sus metadatos (courses.attachments). LessonForm acepta ese
+   token en lugar del archivo.
+
+Los bytes no pasan por Django, así que el SHA-256 lo completa después
+backfill_attachment_metadata o, con DEDUPLICATE_ATTACHMENTS, el worker de
+courses.deduplication. Las dimensiones de imágenes salen de esa misma
+lectura parcial y las de videos de ffprobe sobre una URL prefirmada.
+
+Los uploads abandonados (nunca completados) los limpia una regla de ciclo de
+vida del bucket (AbortIncompleteMultipartUpload).
+
+Para probar en local basta un servicio compatible con S3 (MinIO, etc.) en
+AWS_S3_ENDPOINT_URL.
+"""
+import math
+import mimetypes
+from functools import lru_cache
+
+from django import forms
+from django.conf import settings
+from django.core import signing
+
+from . import metadata
+from .attachments import CONTENT_ERROR, content_matches, new_attachment_name, sign_attachment, validate_attachment
+
+UPLOAD_SALT = "courses.direct-upload"
+
+# Límites de S3 para multipart upload
+MIN_PART_SIZE = 5 * 1024 * 1024
+MAX_PARTS = 10000
+
+
+class UploadError(Exception):
+    """La subida no se pudo iniciar o completar; el mensaje es para el usuario."""
+
+
+def enabled():
+    return getattr(settings, "USE_CLOUD_STORAGE", False) and getattr(settings, "DIRECT_UPLOADS", False)
+
+
+def url_expires():
+    return getattr(settings, "DIRECT_UPLOAD_URL_EXPIRES", 3600)
+
+
+@lru_cache(maxsize=1)
+def s3_client():
+    import boto3
+    from botocore.config import Config
+
+    endpoint_url = getattr(settings, "AWS_S3_ENDPOINT_URL", "") or None
+    return boto3.client(
+        "s3",
+        endpoint_url=endpoint_url,
+        region_name=getattr(settings, "AWS_S3_REGION_NAME", None),
+        aws_access_key_id=getattr(settings, "AWS_ACCESS_KEY_ID", None),
+        aws_secret_access_key=getattr(settings, "AWS_SECRET_ACCESS_KEY", None),
+        config=Config(
+            signature_version="s3v4",
+            s3={"addressing_style": "path" if endpoint_url else "auto"},
+        ),
+    )
+
+
+def _bucket():
+    return settings.AWS_STORAGE_BUCKET_NAME
+
+
+def object_key(name):
+    """Llave en el bucket del nombre que guarda el FileField (respeta AWS_LOCATION)."""
+    location = getattr(settings, "AWS_LOCATION", "").strip("/")
+    return f"{location}/{name}" if location else name
+
+
+def _client_error(action, error):
+    import logging
+
+    logging.getLogger("courses").warning(f"Error de almacenamiento al {action}: {error}")
+    return UploadError(f"No se pudo {action}. Intenta de nuevo.")
+
+
+def start_upload(course, content_type, filename, size):
+    """Abre el multipart upload y retorna las URLs prefirmadas de cada parte."""
+    from botocore.exceptions import BotoCoreError, ClientError
+
+    try:
+        size = int(size)
+    except (TypeError, ValueError):
+        raise UploadError("Tamaño de archivo inválido.")
+    if size <= 0:
+        raise UploadError("El archivo está vacío.")
+    try:
+        validate_attachment(content_type, filename or "", size)
+    except forms.ValidationError as e:
+        raise UploadError(e.messages[0])
+
+    name = new_attachment_name(filename)
+    mime = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+    part_size = max(
+        MIN_PART_SIZE,
+        getattr(settings, "DIRECT_UPLOAD_PART_SIZE", 16 * 1024 * 1024),
+        math.ceil(size / MAX_PARTS),
+    )
+    client = s3_client()
+    key = object_key(name)
+    try:
+        # Mismos parámetros que los objetos que guarda django-storages (Cache-Control)
+        upload_id = client.create_multipart_upload(
+            Bucket=_bucket(), Key=key, ContentType=mime, **getattr(settings, "AWS_S3_OBJECT_PARAMETERS", {})
+        )["UploadId"]
+        parts = [
+            {
+                "part_number": number,
+                "url": client.generate_presigned_url(
+                    "upload_part",
+                    Params={"Bucket": _bucket(), "Key": key, "UploadId": upload_id, "PartNumber": number},
+                    ExpiresIn=url_expires(),
+                ),
+            }
+            for number in range(1, math.ceil(size / part_size) + 1)
+        ]
+    except (BotoCoreError, ClientError) as e:
+        raise _client_error("iniciar la subida", e)
+
+    token = signing.dumps(
+        {
+            "course": course.pk,
+            "name": name,
+            "upload_id": upload_id,
+            "type": content_type,
+            "size": size,
+            "mime": mime,
+        },
+        salt=UPLOAD_SALT,
+    )
+    return {"token": token, "part_size": part_size, "parts": parts}
+
+
+def _parse_parts(parts):
+    try:
+        parsed = sorted((int(part["part_number"]), str(part["etag"])) for part in parts)
+    except (KeyError, TypeError, ValueError):
+        raise UploadError("Lista de partes inválida.")
+    if not parsed or [number for number, _ in parsed] != list(range(1, len(parsed) + 1)):
+        raise UploadError("Faltan partes del archivo.")
+    return [{"PartNumber": number, "ETag": etag} for number, etag in parsed]
+
+
+def complete_upload(course, token, parts):
+    """
+    Cierra el multipart upload y valida el objeto resultante. Si no cumple
+    las reglas se borra del bucket. Retorna el token del adjunto.
+    """
+    from botocore.exceptions import BotoCoreError, ClientError
+
+    try:
+        data = signing.loads(token, salt=UPLOAD_SALT, max_age=url_expires())
+    except signing.BadSignature:
+        raise UploadError("La subida expiró o no es válida.")
+    if data["course"] != course.pk:
+        raise UploadError("La subida no pertenece a este curso.")
+
+    client = s3_client()
+    key = object_key(data["name"])
+    try:
+        client.complete_multipart_upload(
+            Bucket=_bucket(),
+            Key=key,
+            UploadId=data["upload_id"],
+            MultipartUpload={"Parts": _parse_parts(parts)},
+        )
+        head = client.head_object(Bucket=_bucket(), Key=key)
+        # El Content-Type del objeto lo fijó start_upload: se revisan los bytes
+        header = client.get_object(
+            Bucket=_bucket(), Key=key, Range=f"bytes=0-{metadata.HEADER_SIZE - 1}"
+        )["Body"].read()
+    except (BotoCoreError, ClientError) as e:
+        raise _client_error("completar la subida", e)
+
+    size = head.get("ContentLength", 0)
+    try:
+        validate_attachment(data["type"], data["name"], size)
+        if size != data["size"]:
+            raise forms.ValidationError("El archivo subido no coincide con el declarado.")
+        if not content_matches(data["name"], header):
+            raise forms.ValidationError(CONTENT_ERROR)
+    except forms.ValidationError as e:
+        try:
+            client.delete_object(Bucket=_bucket(), Key=key)
+        except (BotoCoreError, ClientError) as delete_error:
+            _client_error("borrar el archivo rechazado", delete_error)
+        raise UploadError(e.messages[0])
+
+    return sign_attachment(
+        course,
+        data["name"],
+        data["type"],
+        _object_metadata(client, key, data["name"], size, data["mime"], header),
+    )
+
+
+def _object_metadata(client, key, name, size, mime, header):
+    """Metadatos del objeto ya subido sin descargarlo completo (`header`: sus primeros bytes)."""
+    from botocore.exceptions import BotoCoreError, ClientError
+
+    values = metadata.empty()
+    values.update(attachment_size=size, attachment_mime=mime)
+    try:
+        if mime.startswith("image/"):
+            dimensions = metadata.image_dimensions(header)
+            if dimensions:
+                values["attachment_width"], values["attachment_height"] = dimensions
+        elif mime.startswith("video/") and metadata.ffprobe_available():
+            url = client.generate_presigned_url(
+                "get_object", Params={"Bucket": _bucket(), "Key": key}, ExpiresIn=300
+            )
+            values.update(metadata.probe_video(url))
+    except (BotoCoreError, ClientError) as e:
+        # Sin dimensiones no se bloquea la subida; el backfill las completa
+        _client_error(f"leer los metadatos de {name}", e)
+    return values
@@ -1,8 +1,24 @@
 from django import forms
 from django.contrib.auth import get_user_model
 from django.contrib.auth.forms import AuthenticationForm, UserCreationForm
+from django.core.files.uploadedfile import UploadedFile
+from django.db import transaction
+from django.db.models import Value
+from django.db.models.functions import Lower
 
+from . import deduplication, metadata
+from .attachments import attachment_name, validate_attachment
 from .models import Comment, Course, Lesson
+from .storage import DeduplicatingStorage
+
+
+def users_with_email(email):
+    """
+    Usuarios con ese correo sin distinguir mayúsculas. Compara LOWER(email)
+    para usar el índice funcional auth_user_email_lower_idx (email__iexact
+    usa UPPER y no lo aprovecha).
+    """
+    return get_user_model().objects.alias(email_lower=Lower("email")).filter(email_lower=Lower(Value(email)))
 
 
 class StyledFormMixin:
@@ -61,6 +77,10 @@ class CourseForm(StyledFormMixin, forms.ModelForm):
 
 
 class LessonForm(StyledFormMixin, forms.ModelForm):
+    # Token de courses.attachments cuando el archivo ya se subió por otra vía
+    # (directo al bucket o por partes)
+    uploaded_attachment = forms.CharField(required=False, widget=forms.HiddenInput())
+
     field_placeholders = {
         "title": "Nombre claro para la lección",
         "text_content": "Contenido en formato texto (Markdown básico permitido)",
@@ -85,58 +105,15 @@ class LessonForm(StyledFormMixin, forms.ModelForm):
 
     def clean_attachment(self):
         """Valida el tipo y tamaño de archivo según el content_type."""
-        from django.conf import settings
-        
         attachment = self.cleaned_data.get("attachment")
         content_type = self.cleaned_data.get("content_type")
         
         if attachment and content_type:
-            # Extensiones permitidas por tipo
-            video_extensions = ['.mp4', '.webm', '.mov', '.avi', '.mkv', '.m4v']
-            image_extensions = ['.jpg', '.jpeg', '.png', '.gif', '.webp', '.svg']
-            file_extensions = ['.pdf', '.doc', '.docx', '.zip', '.rar', '.txt', '.xlsx', '.xls', '.pptx', '.ppt']
-            
-            file_name = attachment.name.lower()
-            file_ext = None
-            for ext in video_extensions + image_extensions + file_extensions:
-                if file_name.endswith(ext):
-                    file_ext = ext
-                    break
-            
-            # Validar tipo de archivo
-            if content_type == "video":
-                if file_ext not in video_extensions:
-                    raise forms.ValidationError(
-                        "Por favor sube un video válido (MP4, WebM, MOV, AVI, MKV) o usa una URL de video."
-                    )
-                # Validar tamaño máximo de video (100 MB)
-                if attachment.size > getattr(settings, 'MAX_VIDEO_SIZE', 100 * 1024 * 1024):
-                    max_size_mb = getattr(settings, 'MAX_VIDEO_SIZE', 100 * 1024 * 1024) / (1024 * 1024)
-                    raise forms.ValidationError(
-                        f"El video es demasiado grande. Tamaño máximo: {max_size_mb:.0f} MB"
-                    )
-            elif content_type == "image":
-                if file_ext not in image_extensions:
-                    raise forms.ValidationError(
-                        "Por favor sube una imagen válida (JPG, PNG, GIF, WEBP, SVG)."
-                    )
-                # Validar tamaño máximo de imagen (10 MB)
-                if attachment.size > getattr(settings, 'MAX_IMAGE_SIZE', 10 * 1024 * 1024):
-                    max_size_mb = getattr(settings, 'MAX_IMAGE_SIZE', 10 * 1024 * 1024) / (1024 * 1024)
-                    raise forms.ValidationError(
-                        f"La imagen es demasiado grande. Tamaño máximo: {max_size_mb:.0f} MB"
-                    )
-            elif content_type == "file":
-                if file_ext not in file_extensions:
-                    raise forms.ValidationError(
-                        "Por favor sube un archivo válido (PDF, DOC, DOCX, ZIP, TXT, XLSX, PPTX, etc.)."
-                    )
-                # Validar tamaño máximo de archivo (50 MB)
-                if attachment.size > getattr(settings, 'MAX_FILE_SIZE', 50 * 1024 * 1024):
-                    max_size_mb = getattr(settings, 'MAX_FILE_SIZE', 50 * 1024 * 1024) / (1024 * 1024)
-                    raise forms.ValidationError(
-                        f"El archivo es demasiado grande. Tamaño máximo: {max_size_mb:.0f} MB"
-                    )
+            validate_attachment(content_type, attachment.name, attachment.size)
+
+        if isinstance(attachment, UploadedFile):
+            # Se lee una vez aquí, en bloques, para no preguntar al storage después
+            self.attachment_metadata = metadata.from_file(attachment)
         
         return attachment
 
@@ -146,6 +123,19 @@ class LessonForm(StyledFormMixin, forms.ModelForm):
         text_content = cleaned_data.get("text_content", "").strip()
         video_url = cleaned_data.get("video_url", "").strip()
         attachment = cleaned_data.get("attachment")
+        uploaded_attachment = cleaned_data.get("uploaded_attachment")
+        
+        if uploaded_attachment and content_type and self.course is not None:
+            try:
+                attachment, self.attachment_metadata = attachment_name(
+                    uploaded_attachment, self.course, content_type
+                )
+            except forms.ValidationError as e:
+                self.add_error("attachment", e)
+            else:
+                # El FileField acepta el nombre del objeto ya guardado en el bucket
+                cleaned_data["attachment"] = attachment
+                self.uploaded_attachment = attachment
         
         # Obtener la instancia existente si estamos editando
         instance = getattr(self, 'instance', None)
@@ -178,8 +168,42 @@ class LessonForm(StyledFormMixin, forms.ModelForm):
 
         return cleaned_data
 
-    def __init__(self, *args, **kwargs):
+    def save(self, commit=True):
+        if self.attachment_metadata is not None:
+            metadata.apply(self.instance, self.attachment_metadata)
+        elif not self.instance.attachment:
+            metadata.apply(self.instance, None)
+        if not commit:
+            return super().save(commit)
+        # Las referencias a blobs (courses.storage) se suman en la misma
+        # transacción que la lección: si el guardado falla, se revierten
+        with transaction.atomic():
+            self._adopt_uploaded_attachment()
+            lesson = super().save(commit)
+            if self.uploaded_attachment and deduplication.needed(lesson.attachment.storage, lesson.attachment.name):
+                # Subida directa al bucket: el hash se calcula en segundo plano
+                deduplication.enqueue(lesson)
+            return lesson
+
+    def _adopt_uploaded_attachment(self):
+        """Deduplica el archivo que llegó por token (subida por partes o directa)."""
+        field = Lesson._meta.get_field("attachment")
+        digest = (self.attachment_metadata or {}).get("attachment_sha256")
+        if self.uploaded_attachment and digest and isinstance(field.storage, DeduplicatingStorage):
+            self.instance.attachment.name = field.storage.adopt(
+                self.uploaded_attachment,
+                digest,
+                self.attachment_metadata.get("attachment_size"),
+                field.max_length,
+            )
+
+    def __init__(self, *args, course=None, **kwargs):
         super().__init__(*args, **kwargs)
+        self.course = course
+        # Metadatos del archivo nuevo (None si no se subió uno)
+        self.attachment_metadata = None
+        # Nombre del archivo que llegó ya subido (token de courses.attachments)
+        self.uploaded_attachment = None
         # Hacer que order no sea requerido (se calcula automáticamente)
         self.fields["order"].required = False
         # Mejorar el widget de archivo con extensiones de video
@@ -263,7 +287,7 @@ class SignupForm(StyledFormMixin, UserCreationForm):
         email = self.cleaned_data.get("email")
         if (
             email
-            and get_user_model().objects.filter(email__iexact=email).exists()
+            and users_with_email(email).exists()
         ):
             raise forms.ValidationError(
                 "Ya existe una cuenta con este correo."
@@ -317,7 +341,7 @@ class EmailLoginForm(StyledFormMixin, AuthenticationForm):
             User = get_user_model()
             try:
                 # Buscar usuario por email (case-insensitive)
-                user = User.objects.get(email__iexact=email)
+                user = users_with_email(email).get()
                 # Retornar el username real para la autenticación
                 return user.username
             except User.DoesNotExist:
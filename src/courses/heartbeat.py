@@ -0,0 +1,209 @@
+"""
+Buffer write-behind para la posición de reproducción de videos.
+
+El reproductor envía un heartbeat cada pocos segundos. En lugar de escribir
+cada uno en la base de datos, se guardan en memoria (coalescidos por
+usuario y lección) y se vuelcan periódicamente con UPDATEs masivos. Si la
+fila de progreso aún no existe se crea en el mismo volcado.
+"""
+import atexit
+import logging
+import math
+import threading
+
+from django.conf import settings
+from django.db import DataError, DatabaseError, close_old_connections
+from django.db.models import Case, PositiveIntegerField, Q, Value, When
+
+logger = logging.getLogger("courses")
+
+# Máximo de pares (usuario, lección) por sentencia UPDATE
+FLUSH_BATCH_SIZE = 500
+
+# Mayor valor que acepta PositiveIntegerField en todos los motores
+MAX_POSITION_SECONDS = 2147483647
+
+
+def parse_position(value):
+    """Segundos enteros a partir del valor enviado, o None si no es válido."""
+    try:
+        position = float(value)
+    except (ValueError, TypeError):
+        return None
+    if not math.isfinite(position) or not 0 <= position <= MAX_POSITION_SECONDS:
+        return None
+    return int(position)
+
+
+class PositionBuffer:
+    """Acumula posiciones por (user_id, lesson_id) y las vuelca en bloque."""
+
+    def __init__(self):
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._flusher = None
+        self._stop = threading.Event()
+        atexit.register(self.shutdown)
+
+    def record(self, user_id, lesson_id, position):
+        """Guarda la última posición conocida; las anteriores se descartan."""
+        with self._lock:
+            self._pending[(user_id, lesson_id)] = position
+            pending_count = len(self._pending)
+        self._ensure_flusher()
+        if pending_count >= getattr(settings, "PROGRESS_HEARTBEAT_MAX_PENDING", 5000):
+            self.flush()
+
+    def pending_count(self):
+        with self._lock:
+            return len(self._pending)
+
+    def flush(self):
+        """Escribe todas las posiciones pendientes. Retorna las filas actualizadas."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+
+        items = []
+        for key, position in pending.items():
+            if isinstance(position, int) and 0 <= position <= MAX_POSITION_SECONDS:
+                items.append((key, position))
+            else:
+                logger.warning(f"Posición de video inválida descartada: {key} = {position!r}")
+        chunks = [items[start:start + FLUSH_BATCH_SIZE] for start in range(0, len(items), FLUSH_BATCH_SIZE)]
+        updated = 0
+        while chunks:
+            chunk = chunks.pop(0)
+            try:
+                updated += self._write(chunk)
+            except DataError as e:
+                if len(chunk) > 1:
+                    # Una fila que la base de datos rechaza no debe tumbar el lote:
+                    # se reintenta de a una y solo se descarta la inválida
+                    chunks[:0] = [[item] for item in chunk]
+                else:
+                    logger.warning(f"Posición de video descartada {chunk[0][0]}: {e}")
+            except DatabaseError as e:
+                # Regresar lo no escrito al buffer sin pisar heartbeats más recientes
+                with self._lock:
+                    for pending_chunk in [chunk, *chunks]:
+                        for key, position in pending_chunk:
+                            self._pending.setdefault(key, position)
+                logger.warning(f"No se pudieron guardar las posiciones de video: {e}")
+                break
+        return updated
+
+    def _write(self, chunk):
+        """Un UPDATE masivo para el lote; crea las filas que falten."""
+        from .models import LessonProgress
+
+        condition = Q()
+        whens = []
+        for (user_id, lesson_id), position in chunk:
+            condition |= Q(user_id=user_id, lesson_id=lesson_id)
+            whens.append(When(user_id=user_id, lesson_id=lesson_id, then=Value(position)))
+        updated = LessonProgress.objects.filter(condition).update(
+            last_position_seconds=Case(*whens, output_field=PositiveIntegerField())
+        )
+        if updated < len(chunk):
+            # Abrir una lección ya no crea la fila de progreso
+            updated += self._create_missing(chunk, condition)
+        return updated
+
+    def _create_missing(self, chunk, condition):
+        """
+        Crea las filas de progreso que aún no existen, solo para usuarios con
+        acceso al curso (inscritos, instructor o staff): el heartbeat no
+        valida acceso para no consultar la base de datos en cada petición.
+        """
+        from django.contrib.auth import get_user_model
+
+        from . import archive
+        from .models import ArchivedProgress, Enrollment, Lesson, LessonProgress
+
+        existing = set(LessonProgress.objects.filter(condition).values_list("user_id", "lesson_id"))
+        missing = {key: position for key, position in chunk if key not in existing}
+        if not missing:
+            return 0
+        user_ids = {user_id for user_id, _ in missing}
+        lesson_ids = {lesson_id for _, lesson_id in missing}
+
+        allowed = set(
+            Enrollment.objects.filter(user_id__in=user_ids, course__lessons__in=lesson_ids)
+            .values_list("user_id", "course__lessons")
+        )
+        allowed.update(
+            Lesson.objects.filter(pk__in=lesson_ids, course__instructor_id__in=user_ids)
+            .values_list("course__instructor_id", "pk")
+        )
+        staff = set(
+            get_user_model().objects.filter(pk__in=user_ids, is_staff=True).values_list("pk", flat=True)
+        )
+        # bulk_create no pasa por save(): el curso se asigna aquí
+        lesson_courses = dict(Lesson.objects.filter(pk__in=lesson_ids).values_list("pk", "course_id"))
+
+        rows = [
+            LessonProgress(
+                user_id=user_id,
+                lesson_id=lesson_id,
+                course_id=lesson_courses[lesson_id],
+                last_position_seconds=position,
+            )
+            for (user_id, lesson_id), position in missing.items()
+            if lesson_id in lesson_courses
+            and ((user_id, lesson_id) in allowed or user_id in staff)
+        ]
+        # Alumno que vuelve: su progreso archivado se restaura antes de crear
+        # filas (como en la vista de lección) y la posición se escribe encima
+        pairs = {(row.user_id, row.course_id) for row in rows}
+        archived = pairs & set(
+            ArchivedProgress.objects.filter(
+                user_id__in={user_id for user_id, _ in pairs},
+                course_id__in={course_id for _, course_id in pairs},
+            ).values_list("user_id", "course_id")
+        )
+        for user_id, course_id in archived:
+            archive.rehydrate(user_id, course_id)
+        created = []
+        restored = 0
+        for row in rows:
+            if (row.user_id, row.course_id) in archived and LessonProgress.objects.filter(
+                user_id=row.user_id, lesson_id=row.lesson_id
+            ).update(last_position_seconds=row.last_position_seconds):
+                restored += 1
+            else:
+                created.append(row)
+        LessonProgress.objects.bulk_create(created, ignore_conflicts=True)
+        return len(created) + restored
+
+    def shutdown(self):
+        """Detiene el hilo de volcado y guarda lo pendiente (apagado ordenado)."""
+        self._stop.set()
+        self.flush()
+
+    def _ensure_flusher(self):
+        interval = getattr(settings, "PROGRESS_HEARTBEAT_FLUSH_INTERVAL", 10)
+        if interval <= 0 or (self._flusher and self._flusher.is_alive()):
+            return
+        with self._lock:
+            if self._flusher and self._flusher.is_alive():
+                return
+            self._stop.clear()
+            self._flusher = threading.Thread(
+                target=self._run, args=(interval,), name="progress-heartbeat-flusher", daemon=True
+            )
+            self._flusher.start()
+
+    def _run(self, interval):
+        while not self._stop.wait(interval):
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Error inesperado al volcar posiciones de video")
+            finally:
+                # El hilo tiene su propia conexión; no dejarla abierta indefinidamente
+                close_old_connections()
+
+
+position_buffer = PositionBuffer()
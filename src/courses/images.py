@@ -0,0 +1,205 @@
+"""
+Variantes responsivas de las imágenes subidas a lecciones.
+
+Cuando una lección de imagen recibe un archivo, courses.signals la pone en la
+cola "image" (courses.jobs) y el worker `generate_image_variants` la procesa:
+
+1. Se lee el original desde el storage (en los hilos del worker, es I/O).
+2. Un pool de procesos acotado (IMAGE_VARIANTS_PROCESSES) lo decodifica una
+   vez y genera AVIF y WebP en cada ancho de WIDTHS menor que el original
+   (más el propio ancho, hasta el mayor de WIDTHS), y un placeholder de
+   PLACEHOLDER_WIDTH píxeles que se guarda en la fila como data URI.
+3. Las variantes se guardan con el storage configurado junto al original:
+   <archivo sin extensión>.variants/<lección>/<corrida>/<ancho>.<formato>
+4. Lesson.image_variants lista los anchos por formato y la plantilla arma
+   el <picture> con srcset/sizes; el navegador baja solo el ancho que
+   necesita en lugar del original (hasta MAX_IMAGE_SIZE).
+
+Las imágenes animadas y los formatos que Pillow no lee (SVG) quedan sin
+variantes y se muestran como antes. Si el archivo cambia mientras se
+procesa, el resultado se descarta.
+"""
+import base64
+import io
+import logging
+import multiprocessing
+import posixpath
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+
+from . import cleanup
+from .jobs import LessonJobQueue
+from .storage import base_storage, stored_name
+
+logger = logging.getLogger("courses")
+
+queue = LessonJobQueue("image", "IMAGE_VARIANTS")
+
+WIDTHS = (320, 640, 960, 1280, 1920)
+# De más liviano a más pesado: la plantilla los ofrece en este orden
+FORMATS = ("avif", "webp")
+MIME_TYPES = {"avif": "image/avif", "webp": "image/webp"}
+QUALITY = {"avif": 50, "webp": 75}
+PLACEHOLDER_WIDTH = 16
+
+# Formatos de origen que se procesan (el resto se muestra tal cual)
+SOURCE_MIMES = {"image/jpeg", "image/png", "image/webp", "image/gif", "image/avif", "image/bmp", "image/tiff"}
+
+
+class ImageVariantError(Exception):
+    pass
+
+
+def widths_for(width):
+    """Anchos a generar para una imagen de `width` píxeles (no se escala hacia arriba)."""
+    widths = [candidate for candidate in WIDTHS if candidate < width]
+    widths.append(min(width, WIDTHS[-1]))
+    return widths
+
+
+def render(data, formats=FORMATS):
+    """
+    Genera las variantes de una imagen (bytes). Corre en el pool de procesos:
+    solo usa Pillow, sin base de datos ni storage.
+
+    Retorna ({formato: {ancho: bytes}}, placeholder en bytes WebP), o
+    (None, None) si la imagen es animada.
+    """
+    from PIL import Image, ImageOps
+
+    with Image.open(io.BytesIO(data)) as source:
+        if getattr(source, "is_animated", False):
+            return None, None
+        # JPEG: decodifica directo a escala reducida (1/2, 1/4, 1/8) si
+        # aun así cubre el mayor ancho en ambos lados (la foto puede venir rotada)
+        source.draft("RGB", (WIDTHS[-1], WIDTHS[-1]))
+        image = ImageOps.exif_transpose(source)
+        image = image.convert("RGBA" if "A" in image.getbands() or "transparency" in image.info else "RGB")
+    widths = widths_for(image.width)
+
+    variants = {format: {} for format in formats}
+    current = image
+    # Del mayor al menor: cada reducción parte de la anterior, que ya es chica
+    for width in sorted(widths, reverse=True):
+        height = max(1, round(image.height * width / image.width))
+        if current.width != width:
+            current = current.resize((width, height), Image.Resampling.LANCZOS, reducing_gap=3.0)
+        for format in formats:
+            output = io.BytesIO()
+            current.save(output, format=format.upper(), quality=QUALITY[format])
+            variants[format][width] = output.getvalue()
+
+    height = max(1, round(image.height * PLACEHOLDER_WIDTH / image.width))
+    output = io.BytesIO()
+    current.resize((PLACEHOLDER_WIDTH, height), Image.Resampling.BOX).save(output, format="WEBP", quality=30)
+    return variants, output.getvalue()
+
+
+def process_pool(processes=None):
+    """
+    Pool acotado para codificar (CPU). Usa "spawn": el worker tiene hilos y
+    conexiones abiertas que no deben copiarse a los procesos hijos.
+    """
+    processes = processes or getattr(settings, "IMAGE_VARIANTS_PROCESSES", 2)
+    return ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context("spawn"))
+
+
+def placeholder_uri(data):
+    return "data:image/webp;base64," + base64.b64encode(data).decode("ascii")
+
+
+def enqueue(lesson):
+    """
+    Pone la lección en cola y deja de usar las variantes anteriores (eran de
+    otro archivo); sus archivos van a la cola de borrado.
+    """
+    queue.enqueue([lesson.pk], image_variants={}, image_placeholder="")
+    discard_output(lesson)
+    lesson.image_status, lesson.image_variants, lesson.image_placeholder = "pending", {}, ""
+
+
+def discard(lesson):
+    """La lección ya no tiene imagen subida: se quitan las variantes."""
+    from .models import Lesson
+
+    Lesson.objects.filter(pk=lesson.pk).update(
+        image_status="", image_variants={}, image_placeholder="", image_available_at=None
+    )
+    discard_output(lesson)
+    lesson.image_status, lesson.image_variants, lesson.image_placeholder = "", {}, ""
+
+
+def discard_output(lesson):
+    """Pone las variantes de la lección en la cola de borrado (courses.cleanup)."""
+    if lesson.image_variants:
+        cleanup.enqueue(output_names(lesson.image_variants))
+
+
+def output_prefix(lesson):
+    """Directorio de una corrida, junto al archivo original."""
+    source = stored_name(lesson.attachment.storage, lesson.attachment.name)
+    return f"{posixpath.splitext(source)[0]}.variants/{lesson.pk}/{uuid.uuid4().hex[:12]}"
+
+
+def variant_name(variants, format, width):
+    return f"{variants['prefix']}/{width}.{format}"
+
+
+def output_names(variants):
+    return [variant_name(variants, format, width) for format in FORMATS for width in variants.get(format, [])]
+
+
+def generate(lesson_id, pool=None):
+    """
+    Trabajo de la cola: genera y guarda las variantes de una lección. La
+    codificación va al `pool` de procesos; sin pool se hace en este proceso.
+    """
+    from .models import Lesson
+
+    lesson = Lesson.objects.get(pk=lesson_id)
+    if lesson.content_type != "image" or not lesson.attachment:
+        queue.complete(lesson_id, image_status="", image_variants={}, image_placeholder="")
+        return
+    if lesson.attachment_mime and lesson.attachment_mime not in SOURCE_MIMES:
+        queue.complete(lesson_id)
+        return
+
+    name = lesson.attachment.name
+    with lesson.attachment.storage.open(name, "rb") as file:
+        data = file.read()
+    try:
+        if pool is None:
+            variants, placeholder = render(data)
+        else:
+            variants, placeholder = pool.submit(render, data).result(timeout=queue.job_timeout)
+    except Exception as e:
+        raise ImageVariantError(f"No se pudo procesar la imagen: {e}")
+    if variants is None:
+        queue.complete(lesson_id)
+        return
+
+    storage = base_storage(lesson.attachment.storage)
+    saved = {"prefix": output_prefix(lesson)}
+    try:
+        for format, files in variants.items():
+            for width, content in sorted(files.items()):
+                storage.save(variant_name(saved, format, width), ContentFile(content))
+                saved.setdefault(format, []).append(width)
+    except Exception:
+        cleanup.enqueue(output_names(saved))
+        raise
+
+    completed = queue.complete(
+        lesson_id,
+        only_if={"attachment": name},
+        image_variants=saved,
+        image_placeholder=placeholder_uri(placeholder),
+    )
+    if not completed:
+        # El archivo cambió (o la lección se reencoló) mientras se procesaba
+        cleanup.enqueue(output_names(saved))
+        return
+    logger.info(f"Variantes listas para la lección {lesson_id}: {saved['prefix']}")
@@ -0,0 +1,201 @@
+"""
+Colas de trabajos en segundo plano sobre columnas de Lesson.
+
+Cada cola usa cuatro columnas con un prefijo (por ejemplo "hls"):
+<prefijo>_status, _attempts, _error y _available_at. No hace falta un
+broker: la base de datos es la cola y un comando de management es el
+worker (transcode_videos, ...).
+
+- enqueue() deja la lección en "pending".
+- claim() toma hasta N lecciones con un UPDATE condicionado por lección, así
+  dos workers nunca toman la misma. Mientras se procesa, _available_at es el
+  vencimiento del lease: si el worker muere, otro la retoma al vencer.
+- Si el trabajo falla se reintenta con espera exponencial hasta
+  max_attempts; después queda en "failed" con el error.
+- run() mantiene como máximo `concurrency` trabajos a la vez.
+"""
+import logging
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import F
+from django.utils import timezone
+
+logger = logging.getLogger("courses")
+
+PENDING = "pending"
+PROCESSING = "processing"
+READY = "ready"
+FAILED = "failed"
+
+STATUS_CHOICES = [
+    (PENDING, "Pendiente"),
+    (PROCESSING, "Procesando"),
+    (READY, "Lista"),
+    (FAILED, "Fallida"),
+]
+
+
+class LessonJobQueue:
+    def __init__(self, prefix, settings_prefix):
+        self.prefix = prefix
+        self.settings_prefix = settings_prefix
+
+    def _field(self, name):
+        return f"{self.prefix}_{name}"
+
+    def _setting(self, name, default):
+        return getattr(settings, f"{self.settings_prefix}_{name}", default)
+
+    @property
+    def concurrency(self):
+        return self._setting("CONCURRENCY", 2)
+
+    @property
+    def max_attempts(self):
+        return self._setting("MAX_ATTEMPTS", 3)
+
+    @property
+    def retry_delay(self):
+        return self._setting("RETRY_DELAY", 60)
+
+    @property
+    def job_timeout(self):
+        return self._setting("JOB_TIMEOUT", 3600)
+
+    def _lessons(self):
+        from .models import Lesson
+
+        return Lesson.objects
+
+    def enqueue(self, lesson_ids, **values):
+        """Pone las lecciones en cola. `values` son columnas extra a actualizar."""
+        return self._lessons().filter(pk__in=lesson_ids).update(
+            **{
+                self._field("status"): PENDING,
+                self._field("attempts"): 0,
+                self._field("error"): "",
+                self._field("available_at"): timezone.now(),
+                **values,
+            }
+        )
+
+    def claim(self, limit):
+        """Toma hasta `limit` trabajos disponibles y retorna sus ids."""
+        now = timezone.now()
+        status, available_at = self._field("status"), self._field("available_at")
+        candidates = list(
+            self._lessons()
+            .filter(**{status: PENDING, f"{available_at}__lte": now})
+            .order_by(available_at)
+            .values_list("pk", flat=True)[:limit]
+        )
+        if len(candidates) < limit:
+            # Trabajos de un worker que murió: el lease venció
+            candidates += list(
+                self._lessons()
+                .filter(**{status: PROCESSING, f"{available_at}__lte": now})
+                .order_by(available_at)
+                .values_list("pk", flat=True)[:limit - len(candidates)]
+            )
+        lease = now + timedelta(seconds=self.job_timeout)
+        claimed = []
+        for lesson_id in candidates:
+            taken = self._lessons().filter(
+                **{"pk": lesson_id, f"{status}__in": [PENDING, PROCESSING], f"{available_at}__lte": now}
+            ).update(
+                **{
+                    status: PROCESSING,
+                    self._field("attempts"): F(self._field("attempts")) + 1,
+                    available_at: lease,
+                }
+            )
+            if taken:
+                claimed.append(lesson_id)
+        return claimed
+
+    def complete(self, lesson_id, only_if=None, **values):
+        """
+        Marca el trabajo como terminado. False si la lección ya no está en
+        proceso o no cumple `only_if` (filtros extra).
+        """
+        return bool(
+            self._lessons()
+            .filter(**{"pk": lesson_id, self._field("status"): PROCESSING}, **(only_if or {}))
+            .update(
+                **{
+                    self._field("status"): READY,
+                    self._field("error"): "",
+                    self._field("available_at"): None,
+                    **values,
+                }
+            )
+        )
+
+    def fail(self, lesson_id, error):
+        """Reprograma el trabajo con espera exponencial, o lo marca como fallido."""
+        attempts = (
+            self._lessons()
+            .filter(**{"pk": lesson_id, self._field("status"): PROCESSING})
+            .values_list(self._field("attempts"), flat=True)
+            .first()
+        )
+        if attempts is None:
+            return
+        values = {self._field("error"): str(error)[:2000]}
+        if attempts >= self.max_attempts:
+            values[self._field("status")] = FAILED
+            values[self._field("available_at")] = None
+        else:
+            values[self._field("status")] = PENDING
+            values[self._field("available_at")] = timezone.now() + timedelta(
+                seconds=self.retry_delay * 2 ** (attempts - 1)
+            )
+        self._lessons().filter(**{"pk": lesson_id, self._field("status"): PROCESSING}).update(**values)
+
+    def run_job(self, handler, lesson_id):
+        """Ejecuta un trabajo ya tomado. Retorna True si terminó bien."""
+        try:
+            handler(lesson_id)
+            return True
+        except Exception as e:
+            logger.warning(f"Trabajo {self.prefix} de la lección {lesson_id} falló: {e}")
+            self.fail(lesson_id, e)
+            return False
+
+    def _run_in_thread(self, handler, lesson_id):
+        try:
+            return self.run_job(handler, lesson_id)
+        finally:
+            # Cada hilo del pool abre su propia conexión
+            connections.close_all()
+
+    def run(self, handler, concurrency=None, once=False, poll_interval=5):
+        """
+        Procesa la cola con `handler(lesson_id)`, como máximo `concurrency`
+        trabajos a la vez. Con once=True termina cuando no queda nada
+        disponible. Retorna (terminados, fallidos).
+        """
+        concurrency = concurrency or self.concurrency
+        done_count = failed_count = 0
+        running = set()
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix=f"{self.prefix}-worker") as executor:
+            while True:
+                if len(running) < concurrency:
+                    for lesson_id in self.claim(concurrency - len(running)):
+                        running.add(executor.submit(self._run_in_thread, handler, lesson_id))
+                if not running:
+                    if once:
+                        break
+                    time.sleep(poll_interval)
+                    continue
+                finished, running = wait(running, timeout=poll_interval, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    if future.result():
+                        done_count += 1
+                    else:
+                        failed_count += 1
+        return done_count, failed_count
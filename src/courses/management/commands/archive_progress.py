@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand
+
+from courses.archive import BATCH_SIZE, run
+
+
+class Command(BaseCommand):
+    help = (
+        "Mueve el progreso de lecciones de las inscripciones inactivas a ArchivedProgress "
+        "(comprimido). Se restaura solo cuando el alumno vuelve al curso. Pensado para cron."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--inactive-days",
+            type=int,
+            default=None,
+            help="Días sin actividad ni inicio de sesión (default: PROGRESS_ARCHIVE_AFTER_DAYS)",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=BATCH_SIZE,
+            help=f"Inscripciones por lote (default: {BATCH_SIZE})",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Solo cuenta las inscripciones que se archivarían",
+        )
+
+    def handle(self, *args, **options):
+        enrollments, rows = run(
+            inactive_days=options["inactive_days"],
+            batch_size=options["batch_size"],
+            dry_run=options["dry_run"],
+        )
+        if options["dry_run"]:
+            self.stdout.write(f"Se archivarían {enrollments} inscripciones.")
+            return
+        self.stdout.write(
+            self.style.SUCCESS(f"{enrollments} inscripciones archivadas ({rows} filas de progreso).")
+        )
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+
+from courses.metadata import backfill
+from courses.models import Lesson
+
+
+class Command(BaseCommand):
+    help = "Calcula tamaño, tipo, SHA-256, duración y dimensiones de los adjuntos que no los tienen."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=8,
+            help="Archivos leídos en paralelo (default: 8)",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=200,
+            help="Lecciones por lote de escritura (default: 200)",
+        )
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            help="Recalcula también las lecciones que ya tienen metadatos",
+        )
+
+    def handle(self, *args, **options):
+        lessons = Lesson.objects.exclude(attachment="").exclude(attachment__isnull=True)
+        if not options["all"]:
+            lessons = lessons.filter(attachment_sha256="")
+        updated, failed = backfill(lessons, workers=options["workers"], batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Metadatos calculados para {updated} lecciones."))
+        if failed:
+            self.stdout.write(self.style.WARNING(f"{failed} archivos no se pudieron leer (ver logs)."))
@@ -0,0 +1,72 @@
+import random
+import statistics
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from courses.models import Course, Lesson
+from courses.ordering import reorder_lessons
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Mide la latencia y el número de consultas de reorder_lessons para "
+        "cursos de distintos tamaños. Los datos se crean en una transacción "
+        "que se revierte al terminar."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--sizes",
+            default="10,50,200,1000",
+            help="Cantidades de lecciones separadas por coma (default: 10,50,200,1000)",
+        )
+        parser.add_argument(
+            "--repeat",
+            type=int,
+            default=5,
+            help="Reordenamientos por tamaño (default: 5)",
+        )
+
+    def handle(self, *args, **options):
+        sizes = [int(size) for size in options["sizes"].split(",") if size.strip()]
+        self.stdout.write(f"{'lecciones':>10} {'consultas':>10} {'mediana ms':>12} {'máx ms':>10}")
+        try:
+            with transaction.atomic():
+                instructor = get_user_model().objects.create_user(
+                    username=f"bench-reorder-{time.time_ns()}"
+                )
+                for size in sizes:
+                    self._bench(instructor, size, options["repeat"])
+                raise _Rollback
+        except _Rollback:
+            pass
+
+    def _bench(self, instructor, size, repeat):
+        course = Course.objects.create(instructor=instructor, title="Benchmark", description="-")
+        Lesson.objects.bulk_create(
+            Lesson(course=course, title=f"Lección {index}", content_type="text", order=index)
+            for index in range(1, size + 1)
+        )
+        ids = list(Lesson.objects.filter(course=course).values_list("id", flat=True))
+
+        timings, queries = [], 0
+        for _ in range(repeat):
+            random.shuffle(ids)
+            payload = [{"id": pk, "order": index} for index, pk in enumerate(ids, start=1)]
+            with CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                reorder_lessons(course, payload)
+                timings.append((time.perf_counter() - started) * 1000)
+            queries = max(queries, len(captured))
+
+        self.stdout.write(
+            f"{size:>10} {queries:>10} {statistics.median(timings):>12.2f} {max(timings):>10.2f}"
+        )
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from courses.deduplication import deduplicate, queue
+
+
+class Command(BaseCommand):
+    help = "Worker que deduplica los archivos subidos directo al bucket (cola en Lesson.dedup_status)."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=None,
+            help="Archivos a la vez (default: DEDUP_CONCURRENCY)",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Procesa lo que esté disponible y termina",
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=5,
+            help="Segundos entre revisiones de la cola (default: 5)",
+        )
+
+    def handle(self, *args, **options):
+        done, failed = queue.run(
+            deduplicate,
+            concurrency=options["concurrency"],
+            once=options["once"],
+            poll_interval=options["poll_interval"],
+        )
+        self.stdout.write(self.style.SUCCESS(f"{done} archivos deduplicados, {failed} con error."))
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+
+from courses.deletion import run
+
+
+class Command(BaseCommand):
+    help = "Worker que borra por lotes los cursos marcados para eliminar (Course.deletion_requested_at)."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=None,
+            help="Filas por DELETE (default: COURSE_DELETION_BATCH_SIZE)",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Procesa los cursos marcados y termina",
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=5,
+            help="Segundos entre revisiones (default: 5)",
+        )
+
+    def handle(self, *args, **options):
+        deleted = run(
+            batch_size=options["batch_size"],
+            once=options["once"],
+            poll_interval=options["poll_interval"],
+        )
+        self.stdout.write(self.style.SUCCESS(f"{deleted} cursos eliminados."))
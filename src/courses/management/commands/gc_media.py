@@ -0,0 +1,48 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from courses.cleanup import enqueue, find_orphans, run
+
+
+class Command(BaseCommand):
+    help = (
+        "Busca en el storage los archivos que ninguna lección referencia (adjuntos, "
+        "HLS, variantes, blobs) y los borra en lotes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--min-age",
+            type=float,
+            default=48,
+            help="Horas desde la última modificación para considerar huérfano un archivo (default: 48)",
+        )
+        parser.add_argument(
+            "--page-size",
+            type=int,
+            default=1000,
+            help="Archivos del listado que se comparan por consulta (default: 1000)",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Solo lista los huérfanos, sin borrarlos",
+        )
+
+    def handle(self, *args, **options):
+        found = 0
+        for orphans in find_orphans(timedelta(hours=options["min_age"]), page_size=options["page_size"]):
+            found += len(orphans)
+            if options["dry_run"]:
+                for name in orphans:
+                    self.stdout.write(name)
+            else:
+                enqueue(orphans)
+        if options["dry_run"]:
+            self.stdout.write(f"Se borrarían {found} archivos huérfanos.")
+            return
+        deleted, failed = run(once=True)
+        self.stdout.write(
+            self.style.SUCCESS(f"{found} archivos huérfanos encontrados; {deleted} borrados, {failed} con error.")
+        )
@@ -0,0 +1,44 @@
+from functools import partial
+
+from django.core.management.base import BaseCommand
+
+from courses.images import generate, process_pool, queue
+
+
+class Command(BaseCommand):
+    help = "Worker que genera las variantes AVIF/WebP de las imágenes subidas (cola en Lesson.image_status)."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=None,
+            help="Imágenes a la vez (default: IMAGE_VARIANTS_CONCURRENCY)",
+        )
+        parser.add_argument(
+            "--processes",
+            type=int,
+            default=None,
+            help="Procesos que codifican (default: IMAGE_VARIANTS_PROCESSES)",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Procesa lo que esté disponible y termina",
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=5,
+            help="Segundos entre revisiones de la cola (default: 5)",
+        )
+
+    def handle(self, *args, **options):
+        with process_pool(options["processes"]) as pool:
+            done, failed = queue.run(
+                partial(generate, pool=pool),
+                concurrency=options["concurrency"],
+                once=options["once"],
+                poll_interval=options["poll_interval"],
+            )
+        self.stdout.write(self.style.SUCCESS(f"{done} imágenes procesadas, {failed} con error."))
@@ -0,0 +1,52 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from courses import partitioning
+
+
+class Command(BaseCommand):
+    help = (
+        "Convierte LessonProgress en una tabla particionada por hash de usuario (PostgreSQL) "
+        "sin detener la aplicación. Pasos, en orden: prepare, copy, swap y, al final, drop-old."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "step",
+            choices=["status", "prepare", "copy", "swap", "drop-old"],
+            help="Paso a ejecutar (status solo informa el estado)",
+        )
+        parser.add_argument(
+            "--partitions",
+            type=int,
+            default=None,
+            help="Número de particiones al preparar (default: LESSON_PROGRESS_PARTITIONS)",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=partitioning.BATCH_SIZE,
+            help=f"Rango de ids por lote al copiar (default: {partitioning.BATCH_SIZE})",
+        )
+
+    def handle(self, *args, **options):
+        step = options["step"]
+        try:
+            if step == "status":
+                state = "particionada" if partitioning.is_partitioned() else "sin particionar"
+                self.stdout.write(f"LessonProgress está {state}.")
+                return
+            if step == "prepare":
+                partitioning.prepare(options["partitions"])
+                message = "Tabla particionada creada; el trigger replica las escrituras. Siguiente paso: copy."
+            elif step == "copy":
+                copied = partitioning.copy(options["batch_size"])
+                message = f"{copied} filas copiadas. Siguiente paso: swap."
+            elif step == "swap":
+                partitioning.swap()
+                message = "LessonProgress ahora está particionada. La tabla anterior quedó como _old."
+            else:
+                partitioning.drop_old()
+                message = "Tabla anterior borrada."
+        except partitioning.PartitioningError as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(message))
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+
+from courses.cleanup import run
+
+
+class Command(BaseCommand):
+    help = "Worker que borra del storage, en lotes, los archivos anotados en StorageDeletion."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=None,
+            help="Archivos por lote, máximo 1000 (default: STORAGE_CLEANUP_BATCH_SIZE)",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Procesa lo que esté disponible y termina",
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=5,
+            help="Segundos entre revisiones de la cola (default: 5)",
+        )
+
+    def handle(self, *args, **options):
+        deleted, failed = run(
+            batch_size=options["batch_size"],
+            once=options["once"],
+            poll_interval=options["poll_interval"],
+        )
+        self.stdout.write(self.style.SUCCESS(f"{deleted} archivos borrados, {failed} con error."))
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from courses.counters import rebuild_counters
+from courses.models import Comment, Course, CourseRating, Enrollment, Lesson
+
+
+class Command(BaseCommand):
+    help = "Recalcula lesson_count, enrollment_count, comment_count y ratings de cada curso."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Cursos por sentencia UPDATE (default: 1000)",
+        )
+
+    def handle(self, *args, **options):
+        updated = rebuild_counters(
+            Course, Lesson, Enrollment, Comment, CourseRating,
+            batch_size=options["batch_size"],
+        )
+        self.stdout.write(self.style.SUCCESS(f"Contadores reconstruidos para {updated} cursos."))
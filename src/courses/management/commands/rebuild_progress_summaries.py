@@ -0,0 +1,25 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from courses.models import ArchivedProgress, Course, CourseProgressSummary, Enrollment, LessonProgress
+from courses.progress import rebuild_summaries
+
+
+class Command(BaseCommand):
+    help = "Reconstruye la tabla CourseProgressSummary por bloques de usuarios."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Usuarios por bloque/transacción (default: 500)",
+        )
+
+    def handle(self, *args, **options):
+        written = rebuild_summaries(
+            get_user_model(), Course, Enrollment, LessonProgress, CourseProgressSummary,
+            batch_size=options["batch_size"],
+            ArchivedProgress=ArchivedProgress,
+        )
+        self.stdout.write(self.style.SUCCESS(f"{written} resúmenes de progreso reconstruidos."))
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from courses.chunked_upload import staging_dir, sweep_staging
+
+
+class Command(BaseCommand):
+    help = "Borra las subidas por partes abandonadas (sin actividad reciente)."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--max-age",
+            type=int,
+            default=None,
+            help="Segundos sin actividad para considerar abandonada una subida (default: CHUNKED_UPLOAD_EXPIRES)",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Solo cuenta las subidas que se borrarían",
+        )
+
+    def handle(self, *args, **options):
+        removed = sweep_staging(max_age=options["max_age"], dry_run=options["dry_run"])
+        if options["dry_run"]:
+            self.stdout.write(f"Se borrarían {removed} subidas de {staging_dir()}.")
+        else:
+            self.stdout.write(self.style.SUCCESS(f"{removed} subidas abandonadas borradas."))
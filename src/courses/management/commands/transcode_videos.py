@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from courses.transcoding import queue, transcode
+
+
+class Command(BaseCommand):
+    help = "Worker que transcodifica a HLS los videos subidos (cola en Lesson.hls_status)."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=None,
+            help="Videos a la vez (default: HLS_CONCURRENCY)",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Procesa lo que esté disponible y termina",
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=5,
+            help="Segundos entre revisiones de la cola (default: 5)",
+        )
+
+    def handle(self, *args, **options):
+        done, failed = queue.run(
+            transcode,
+            concurrency=options["concurrency"],
+            once=options["once"],
+            poll_interval=options["poll_interval"],
+        )
+        self.stdout.write(self.style.SUCCESS(f"{done} videos transcodificados, {failed} con error."))
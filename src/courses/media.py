@@ -0,0 +1,213 @@
+"""
+Entrega de archivos de lecciones guardados en disco (sin cloud storage).
+
+- Con MEDIA_ACCEL_REDIRECT configurado, Django solo valida el acceso y
+  responde con X-Accel-Redirect: Nginx transfiere el archivo (con Range) y
+  el worker de gunicorn queda libre de inmediato.
+- Sin Nginx, serve_file() responde desde Python con soporte de Range
+  (uno o varios rangos), If-Range, ETag/Last-Modified y FileResponse, que
+  gunicorn envía con sendfile() cuando el archivo tiene descriptor.
+
+Las URLs versionadas (huella del adjunto, corrida de HLS o de variantes)
+nunca cambian de contenido y se cachean un año como inmutables; Nginx
+respeta el Cache-Control que pone Django junto al X-Accel-Redirect.
+"""
+import mimetypes
+import os
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.utils.crypto import get_random_string
+from django.utils.http import http_date, parse_http_date_safe
+from django.views.static import was_modified_since
+
+# Más rangos que esto en una petición se ignoran (se envía el archivo completo)
+MAX_RANGES = 16
+BLOCK_SIZE = 64 * 1024
+
+# "private": estas URLs no van firmadas, el acceso se valida en cada petición
+# con la sesión y la inscripción. Con "public" un CDN o proxy delante de Django
+# entregaría el archivo a cualquiera que tenga la URL. Lo que sí se cachea en
+# el CDN son los objetos del bucket (AWS_S3_OBJECT_PARAMETERS en settings)
+IMMUTABLE_CACHE_CONTROL = "private, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "private, no-cache"
+
+
+def accel_redirect_response(name):
+    """Delega la transferencia a la location interna de Nginx."""
+    prefix = settings.MEDIA_ACCEL_REDIRECT.rstrip("/")
+    response = HttpResponse(content_type=_content_type(name))
+    response["X-Accel-Redirect"] = f"{prefix}/{quote(name)}"
+    return response
+
+
+def set_cache_control(response, immutable):
+    """Cache-Control de una respuesta de media (inmutable solo si la URL es versionada)."""
+    response["Cache-Control"] = IMMUTABLE_CACHE_CONTROL if immutable else REVALIDATE_CACHE_CONTROL
+    return response
+
+
+def parse_range(header, size):
+    """
+    Interpreta "bytes=0-99,200-" y retorna [(inicio, fin_inclusivo), ...].
+    None si el encabezado no es válido (se ignora); [] si ningún rango es
+    satisfacible (416).
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or not spec:
+        return None
+    ranges = []
+    for part in spec.split(","):
+        start, sep, end = part.strip().partition("-")
+        if not sep:
+            return None
+        try:
+            if not start:
+                # Sufijo: los últimos N bytes
+                length = int(end)
+                if length <= 0:
+                    continue
+                ranges.append((max(size - length, 0), size - 1))
+                continue
+            start = int(start)
+            end = int(end) if end else None
+        except ValueError:
+            return None
+        if end is None:
+            end = size - 1
+        elif start > end:
+            return None
+        if start < size:
+            ranges.append((start, min(end, size - 1)))
+    if len(ranges) > MAX_RANGES:
+        return None
+    return ranges
+
+
+class _RangeFile:
+    """
+    Limita la lectura de un archivo abierto a `length` bytes desde su
+    posición actual. Conserva fileno() para que gunicorn use sendfile().
+    """
+
+    def __init__(self, file, length):
+        self.file = file
+        self.remaining = length
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b""
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def close(self):
+        self.file.close()
+
+
+def _content_type(path):
+    content_type, encoding = mimetypes.guess_type(path)
+    if encoding:
+        return "application/octet-stream"
+    return content_type or "application/octet-stream"
+
+
+def _etag(stat):
+    return f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+
+
+def _if_range_matches(value, etag, last_modified):
+    value = value.strip()
+    if value.startswith(('"', "W/")):
+        # Solo validadores fuertes sirven para If-Range
+        return value == etag
+    return parse_http_date_safe(value) == last_modified
+
+
+def serve_file(request, path, download_name=None):
+    """Responde con el archivo en `path` respetando Range e If-Range."""
+    stat = os.stat(path)
+    size = stat.st_size
+    content_type = _content_type(path)
+    etag = _etag(stat)
+    last_modified = int(stat.st_mtime)
+
+    if request.headers.get("If-None-Match") == etag or (
+        "If-None-Match" not in request.headers
+        and not was_modified_since(request.headers.get("If-Modified-Since"), last_modified)
+    ):
+        response = HttpResponseNotModified()
+        response["ETag"] = etag
+        return response
+
+    ranges = None
+    range_header = request.headers.get("Range")
+    if range_header and request.method == "GET":
+        if_range = request.headers.get("If-Range")
+        if if_range is None or _if_range_matches(if_range, etag, last_modified):
+            ranges = parse_range(range_header, size)
+
+    if ranges == []:
+        response = HttpResponse(status=416)
+        response["Content-Range"] = f"bytes */{size}"
+    elif not ranges:
+        response = FileResponse(open(path, "rb"), content_type=content_type)
+    elif len(ranges) == 1:
+        start, end = ranges[0]
+        file = open(path, "rb")
+        file.seek(start)
+        response = FileResponse(_RangeFile(file, end - start + 1), content_type=content_type, status=206)
+        response["Content-Length"] = str(end - start + 1)
+        response["Content-Range"] = f"bytes {start}-{end}/{size}"
+    else:
+        response = _multipart_response(path, ranges, size, content_type)
+
+    response["Accept-Ranges"] = "bytes"
+    response["ETag"] = etag
+    response["Last-Modified"] = http_date(last_modified)
+    if download_name:
+        response["Content-Disposition"] = f"inline; filename*=UTF-8''{quote(download_name)}"
+    return response
+
+
+def _multipart_response(path, ranges, size, content_type):
+    boundary = get_random_string(24)
+    headers = [
+        (
+            f"--{boundary}\r\nContent-Type: {content_type}\r\n"
+            f"Content-Range: bytes {start}-{end}/{size}\r\n\r\n"
+        ).encode()
+        for start, end in ranges
+    ]
+    closing = f"\r\n--{boundary}--\r\n".encode()
+    length = sum(len(header) + (end - start + 1) + 2 for header, (start, end) in zip(headers, ranges))
+    # El primer separador no lleva \r\n inicial, el cierre sí
+    length += len(closing) - 2
+
+    def stream():
+        with open(path, "rb") as file:
+            for index, (header, (start, end)) in enumerate(zip(headers, ranges)):
+                if index:
+                    yield b"\r\n"
+                yield header
+                file.seek(start)
+                remaining = end - start + 1
+                while remaining > 0:
+                    data = file.read(min(BLOCK_SIZE, remaining))
+                    if not data:
+                        break
+                    remaining -= len(data)
+                    yield data
+        yield closing
+
+    response = StreamingHttpResponse(
+        stream(), status=206, content_type=f"multipart/byteranges; boundary={boundary}"
+    )
+    response["Content-Length"] = str(length)
+    return response
@@ -0,0 +1,261 @@
+"""
+Metadatos de los adjuntos de lecciones: tamaño, tipo MIME, SHA-256 y, para
+imágenes y videos, dimensiones y duración.
+
+Se calculan una sola vez, al subir el archivo, leyéndolo en bloques, y se
+guardan en las columnas attachment_* de Lesson. Las páginas leen esas
+columnas y nunca preguntan al storage (en S3/OCI cada `attachment.size` es
+un HEAD).
+
+- Imágenes: ancho y alto salen del encabezado (PNG, GIF, JPEG, WebP).
+- Videos: duración y dimensiones con ffprobe (FFPROBE_BINARY) si está
+  instalado; si no, quedan vacías.
+
+Las lecciones anteriores se completan con el comando
+backfill_attachment_metadata.
+"""
+import hashlib
+import json
+import logging
+import mimetypes
+import shutil
+import struct
+import subprocess
+import tempfile
+
+from django.conf import settings
+
+logger = logging.getLogger("courses")
+
+FIELDS = (
+    "attachment_size",
+    "attachment_mime",
+    "attachment_sha256",
+    "attachment_duration",
+    "attachment_width",
+    "attachment_height",
+)
+
+# Bytes del inicio del archivo que se guardan para leer las dimensiones
+HEADER_SIZE = 64 * 1024
+CHUNK_SIZE = 1024 * 1024
+FFPROBE_TIMEOUT = 30
+
+
+def empty():
+    return {
+        "attachment_size": None,
+        "attachment_mime": "",
+        "attachment_sha256": "",
+        "attachment_duration": None,
+        "attachment_width": None,
+        "attachment_height": None,
+    }
+
+
+def apply(lesson, metadata):
+    """Copia los metadatos a la lección (no la guarda)."""
+    values = empty()
+    values.update(metadata or {})
+    for field in FIELDS:
+        setattr(lesson, field, values[field])
+
+
+def guess_mime(name):
+    return mimetypes.guess_type(name)[0] or "application/octet-stream"
+
+
+def image_dimensions(header):
+    """(ancho, alto) leídos del encabezado de PNG, GIF, JPEG o WebP; None si no se reconoce."""
+    try:
+        if header.startswith(b"\x89PNG\r\n\x1a\n"):
+            return struct.unpack(">II", header[16:24])
+        if header[:6] in (b"GIF87a", b"GIF89a"):
+            return struct.unpack("<HH", header[6:10])
+        if header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+            return _webp_dimensions(header)
+        if header[:2] == b"\xff\xd8":
+            return _jpeg_dimensions(header)
+    except struct.error:
+        pass
+    return None
+
+
+def _webp_dimensions(header):
+    chunk = header[12:16]
+    if chunk == b"VP8 ":
+        width, height = struct.unpack("<HH", header[26:30])
+        return width & 0x3FFF, height & 0x3FFF
+    if chunk == b"VP8L":
+        b0, b1, b2, b3 = header[21:25]
+        return 1 + (((b1 & 0x3F) << 8) | b0), 1 + (((b3 & 0x0F) << 10) | (b2 << 2) | ((b1 & 0xC0) >> 6))
+    if chunk == b"VP8X":
+        return 1 + int.from_bytes(header[24:27], "little"), 1 + int.from_bytes(header[27:30], "little")
+    return None
+
+
+def _jpeg_dimensions(header):
+    position = 2
+    while position + 9 < len(header):
+        if header[position] != 0xFF:
+            return None
+        marker = header[position + 1]
+        if marker == 0xFF:
+            # Byte de relleno
+            position += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD9:
+            position += 2
+            continue
+        # SOF0..SOF15 (C4, C8 y CC son otros segmentos)
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            height, width = struct.unpack(">HH", header[position + 5:position + 9])
+            return width, height
+        position += 2 + struct.unpack(">H", header[position + 2:position + 4])[0]
+    return None
+
+
+def ffprobe_available():
+    return shutil.which(getattr(settings, "FFPROBE_BINARY", "ffprobe")) is not None
+
+
+def probe_video(source):
+    """Duración (s) y dimensiones del primer stream de video con ffprobe. {} si no se puede."""
+    if not ffprobe_available():
+        return {}
+    command = [
+        getattr(settings, "FFPROBE_BINARY", "ffprobe"),
+        "-v", "error",
+        "-select_streams", "v:0",
+        "-show_entries", "stream=width,height:format=duration",
+        "-of", "json",
+        source,
+    ]
+    try:
+        result = subprocess.run(command, capture_output=True, timeout=FFPROBE_TIMEOUT, check=True)
+        data = json.loads(result.stdout)
+    except (OSError, subprocess.SubprocessError, ValueError) as e:
+        logger.warning(f"ffprobe no pudo leer {source}: {e}")
+        return {}
+    stream = (data.get("streams") or [{}])[0]
+    metadata = {}
+    try:
+        metadata["attachment_duration"] = round(float(data["format"]["duration"]), 3)
+    except (KeyError, TypeError, ValueError):
+        pass
+    if stream.get("width") and stream.get("height"):
+        metadata["attachment_width"] = int(stream["width"])
+        metadata["attachment_height"] = int(stream["height"])
+    return metadata
+
+
+def from_chunks(chunks, name, probe_source=None):
+    """
+    Calcula los metadatos recorriendo `chunks` una sola vez. Para videos,
+    `probe_source` (ruta o URL) es lo que se le pasa a ffprobe.
+    """
+    digest = hashlib.sha256()
+    size = 0
+    header = bytearray()
+    for chunk in chunks:
+        digest.update(chunk)
+        size += len(chunk)
+        if len(header) < HEADER_SIZE:
+            header += chunk[:HEADER_SIZE - len(header)]
+
+    mime = guess_mime(name)
+    metadata = empty()
+    metadata.update(attachment_size=size, attachment_mime=mime, attachment_sha256=digest.hexdigest())
+    if mime.startswith("image/"):
+        dimensions = image_dimensions(bytes(header))
+        if dimensions:
+            metadata["attachment_width"], metadata["attachment_height"] = dimensions
+    elif mime.startswith("video/") and probe_source:
+        metadata.update(probe_video(probe_source))
+    return metadata
+
+
+def from_file(file, name=None):
+    """Metadatos de un archivo subido al formulario (UploadedFile o File)."""
+    name = name or file.name
+    if hasattr(file, "temporary_file_path"):
+        metadata = from_chunks(file.chunks(CHUNK_SIZE), name, file.temporary_file_path())
+    elif guess_mime(name).startswith("video/") and ffprobe_available():
+        # Video chico que quedó en memoria: ffprobe necesita un archivo
+        with tempfile.NamedTemporaryFile() as copy:
+            def chunks():
+                for chunk in file.chunks(CHUNK_SIZE):
+                    copy.write(chunk)
+                    yield chunk
+                copy.flush()
+
+            metadata = from_chunks(chunks(), name, copy.name)
+    else:
+        metadata = from_chunks(file.chunks(CHUNK_SIZE), name)
+    file.seek(0)
+    return metadata
+
+
+def from_path(path, name):
+    """Metadatos de un archivo en disco."""
+    def chunks():
+        with open(path, "rb") as file:
+            while True:
+                chunk = file.read(CHUNK_SIZE)
+                if not chunk:
+                    return
+                yield chunk
+
+    return from_chunks(chunks(), name, path)
+
+
+def from_storage(name, storage):
+    """Metadatos leyendo el archivo desde el storage (local o bucket) en bloques."""
+    try:
+        probe_source = storage.path(name)
+    except NotImplementedError:
+        # En el bucket ffprobe lee solo lo que necesita por HTTP
+        probe_source = storage.url(name)
+    with storage.open(name, "rb") as file:
+        return from_chunks(file.chunks(CHUNK_SIZE), name, probe_source)
+
+
+def backfill(lessons, workers=8, batch_size=200):
+    """
+    Completa los metadatos de `lessons` leyendo cada archivo desde el
+    storage. Las lecturas van en paralelo (`workers` hilos, son I/O); las
+    escrituras se hacen en lote desde el hilo principal. Recorre por id,
+    así que un archivo que falla no se reintenta en la misma ejecución.
+    Retorna (actualizadas, fallidas).
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    from .models import Lesson
+
+    storage = Lesson._meta.get_field("attachment").storage
+
+    def read(lesson):
+        try:
+            return from_storage(lesson.attachment.name, storage)
+        except Exception as e:
+            logger.warning(f"No se pudieron leer los metadatos de {lesson.attachment.name}: {e}")
+            return None
+
+    updated = failed = 0
+    last_id = 0
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        while True:
+            batch = list(lessons.filter(pk__gt=last_id).order_by("pk").only("id", "attachment")[:batch_size])
+            if not batch:
+                break
+            last_id = batch[-1].pk
+            changed = []
+            for lesson, values in zip(batch, executor.map(read, batch)):
+                if values is None:
+                    failed += 1
+                    continue
+                apply(lesson, values)
+                changed.append(lesson)
+            Lesson.objects.bulk_update(changed, FIELDS)
+            updated += len(changed)
+    return updated, failed
@@ -0,0 +1,49 @@
+from django.db import migrations, models
+
+
+def populate_counters(apps, schema_editor):
+    from courses.counters import rebuild_counters
+
+    rebuild_counters(
+        apps.get_model("courses", "Course"),
+        apps.get_model("courses", "Lesson"),
+        apps.get_model("courses", "Enrollment"),
+        apps.get_model("courses", "Comment"),
+        apps.get_model("courses", "CourseRating"),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0005_alter_lesson_attachment'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='course',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='course',
+            name='enrollment_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='course',
+            name='lesson_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='course',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='course',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(populate_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,49 @@
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+class AddIndexOnPostgres(migrations.AddIndex):
+    """Los índices GIN solo existen en PostgreSQL; en SQLite se usa FTS5."""
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == "postgresql":
+            super().database_forwards(app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == "postgresql":
+            super().database_backwards(app_label, schema_editor, from_state, to_state)
+
+
+def build_search_index(apps, schema_editor):
+    from courses import search
+
+    search.create_search_index(schema_editor.connection)
+    # La configuración sin tildes llega en 0020, que vuelve a indexar
+    search.index_courses(connection=schema_editor.connection, config=search._dictionary())
+
+
+def drop_search_index(apps, schema_editor):
+    from courses import search
+
+    search.drop_search_index(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0006_course_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='course',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        AddIndexOnPostgres(
+            model_name='course',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='course_search_vector_gin'),
+        ),
+        migrations.RunPython(build_search_index, drop_search_index),
+    ]
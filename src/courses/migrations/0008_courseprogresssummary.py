@@ -0,0 +1,43 @@
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+def populate_summaries(apps, schema_editor):
+    from courses.progress import rebuild_summaries
+
+    rebuild_summaries(
+        apps.get_model(*settings.AUTH_USER_MODEL.split(".")),
+        apps.get_model("courses", "Course"),
+        apps.get_model("courses", "Enrollment"),
+        apps.get_model("courses", "LessonProgress"),
+        apps.get_model("courses", "CourseProgressSummary"),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0007_course_search_vector'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CourseProgressSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('completed_lessons', models.PositiveIntegerField(default=0)),
+                ('total_lessons', models.PositiveIntegerField(default=0)),
+                ('last_activity', models.DateTimeField(default=django.utils.timezone.now)),
+                ('course', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='progress_summaries', to='courses.course')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='progress_summaries', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ('-last_activity',),
+                'unique_together': {('user', 'course')},
+            },
+        ),
+        migrations.RunPython(populate_summaries, migrations.RunPython.noop),
+    ]
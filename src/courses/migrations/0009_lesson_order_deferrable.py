@@ -0,0 +1,50 @@
+from django.db import migrations
+
+LESSON_TABLE = "courses_lesson"
+CONSTRAINT = "courses_lesson_course_order_uniq"
+
+
+def _unique_together_name(schema_editor):
+    # Mismo nombre que Django genera para unique_together = ("course", "order")
+    return schema_editor._create_index_name(LESSON_TABLE, ["course_id", "order"], suffix="_uniq")
+
+
+def make_order_deferrable(apps, schema_editor):
+    """
+    En PostgreSQL reemplaza la restricción de unique_together por una
+    DEFERRABLE INITIALLY IMMEDIATE con las mismas columnas. El estado del
+    modelo no cambia, así que SQLite conserva su restricción normal.
+    """
+    connection = schema_editor.connection
+    if connection.vendor != "postgresql":
+        return
+    with connection.cursor() as cursor:
+        constraints = connection.introspection.get_constraints(cursor, LESSON_TABLE)
+    for name, info in constraints.items():
+        if info["unique"] and not info["primary_key"] and info["columns"] == ["course_id", "order"]:
+            schema_editor.execute(f'ALTER TABLE {LESSON_TABLE} DROP CONSTRAINT "{name}"')
+    schema_editor.execute(
+        f'ALTER TABLE {LESSON_TABLE} ADD CONSTRAINT "{CONSTRAINT}" '
+        f'UNIQUE (course_id, "order") DEFERRABLE INITIALLY IMMEDIATE'
+    )
+
+
+def make_order_immediate(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute(f'ALTER TABLE {LESSON_TABLE} DROP CONSTRAINT IF EXISTS "{CONSTRAINT}"')
+    schema_editor.execute(
+        f'ALTER TABLE {LESSON_TABLE} ADD CONSTRAINT "{_unique_together_name(schema_editor)}" '
+        f'UNIQUE (course_id, "order")'
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0008_courseprogresssummary'),
+    ]
+
+    operations = [
+        migrations.RunPython(make_order_deferrable, make_order_immediate),
+    ]
@@ -0,0 +1,42 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0009_lesson_order_deferrable'),
+    ]
+
+    # Las lecciones existentes se completan con backfill_attachment_metadata
+    operations = [
+        migrations.AddField(
+            model_name='lesson',
+            name='attachment_size',
+            field=models.BigIntegerField(blank=True, db_index=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='lesson',
+            name='attachment_mime',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='lesson',
+            name='attachment_sha256',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='lesson',
+            name='attachment_duration',
+            field=models.FloatField(blank=True, db_index=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='lesson',
+            name='attachment_width',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='lesson',
+            name='attachment_height',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+    ]
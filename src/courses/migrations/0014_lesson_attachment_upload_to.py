@@ -0,0 +1,17 @@
+import courses.attachments
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0013_lesson_image_variants'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='lesson',
+            name='attachment',
+            field=models.FileField(blank=True, help_text='Sube videos (MP4, WebM, MOV), imágenes (JPG, PNG, GIF) o documentos (PDF, DOC, ZIP)', null=True, upload_to=courses.attachments.attachment_upload_to),
+        ),
+    ]
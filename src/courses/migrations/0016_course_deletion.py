@@ -0,0 +1,26 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0015_storagedeletion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='course',
+            name='deletion_requested_at',
+            field=models.DateTimeField(blank=True, db_index=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='course',
+            name='deletion_total',
+            field=models.PositiveBigIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='course',
+            name='deletion_done',
+            field=models.PositiveBigIntegerField(default=0, editable=False),
+        ),
+    ]
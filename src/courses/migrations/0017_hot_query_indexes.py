@@ -0,0 +1,64 @@
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models.functions import Lower
+
+from courses.indexes import AddIndexConcurrentlyOnPostgres
+
+EMAIL_INDEX = models.Index(Lower("email"), name="auth_user_email_lower_idx")
+
+
+def _user_model(apps):
+    return apps.get_model(*settings.AUTH_USER_MODEL.split("."))
+
+
+def add_email_index(apps, schema_editor):
+    """Índice LOWER(email) para el login y el registro (courses.forms.users_with_email)."""
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.add_index(_user_model(apps), EMAIL_INDEX, concurrently=True)
+    else:
+        schema_editor.add_index(_user_model(apps), EMAIL_INDEX)
+
+
+def remove_email_index(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.remove_index(_user_model(apps), EMAIL_INDEX, concurrently=True)
+    else:
+        schema_editor.remove_index(_user_model(apps), EMAIL_INDEX)
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY no puede correr dentro de una transacción
+    atomic = False
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('courses', '0016_course_deletion'),
+    ]
+
+    operations = [
+        AddIndexConcurrentlyOnPostgres(
+            model_name='course',
+            index=models.Index(
+                condition=models.Q(('is_listed', True)),
+                fields=['-created_at', '-id'],
+                name='course_listed_recent_idx',
+            ),
+        ),
+        AddIndexConcurrentlyOnPostgres(
+            model_name='enrollment',
+            index=models.Index(fields=['user', '-enrolled_at'], name='enrollment_user_recent_idx'),
+        ),
+        AddIndexConcurrentlyOnPostgres(
+            model_name='lessonprogress',
+            index=models.Index(
+                condition=models.Q(('completed', True)),
+                fields=['user', 'lesson'],
+                name='progress_user_done_idx',
+            ),
+        ),
+        AddIndexConcurrentlyOnPostgres(
+            model_name='comment',
+            index=models.Index(fields=['course', '-created_at'], name='comment_course_recent_idx'),
+        ),
+        migrations.RunPython(add_email_index, remove_email_index),
+    ]
@@ -0,0 +1,62 @@
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+from courses.indexes import AddIndexConcurrentlyOnPostgres, RemoveIndexConcurrentlyOnPostgres
+
+BATCH_SIZE = 5000
+
+
+def backfill_course(apps, schema_editor):
+    """
+    Copia lesson.course_id en lotes por rango de id. La migración no es
+    atómica: cada UPDATE confirma por su cuenta y bloquea solo su lote.
+    """
+    Lesson = apps.get_model("courses", "Lesson")
+    LessonProgress = apps.get_model("courses", "LessonProgress")
+    course = Subquery(Lesson.objects.filter(pk=OuterRef("lesson_id")).values("course_id")[:1])
+    ids = LessonProgress.objects.order_by("pk").values_list("pk", flat=True)
+    last_id = 0
+    while True:
+        batch = list(ids.filter(pk__gt=last_id)[:BATCH_SIZE])
+        if not batch:
+            return
+        last_id = batch[-1]
+        LessonProgress.objects.filter(pk__gte=batch[0], pk__lte=last_id, course__isnull=True).update(course=course)
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('courses', '0017_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='lessonprogress',
+            name='course',
+            field=models.ForeignKey(
+                db_index=False,
+                editable=False,
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name='lesson_progress',
+                to='courses.course',
+            ),
+        ),
+        migrations.RunPython(backfill_course, migrations.RunPython.noop),
+        AddIndexConcurrentlyOnPostgres(
+            model_name='lessonprogress',
+            index=models.Index(fields=['user', 'course', 'completed'], name='progress_user_course_idx'),
+        ),
+        AddIndexConcurrentlyOnPostgres(
+            model_name='lessonprogress',
+            index=models.Index(fields=['course'], name='progress_course_idx'),
+        ),
+        # Lo cubre (user, course, completed)
+        RemoveIndexConcurrentlyOnPostgres(
+            model_name='lessonprogress',
+            name='progress_user_done_idx',
+        ),
+    ]
@@ -0,0 +1,22 @@
+from django.contrib.postgres.operations import UnaccentExtension
+from django.db import migrations
+
+
+def build_search_config(apps, schema_editor):
+    from courses import search
+
+    # Solo PostgreSQL: en SQLite FTS5 ya quita las tildes (remove_diacritics)
+    search.create_search_config(schema_editor.connection)
+    search.index_courses(connection=schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0019_archived_progress'),
+    ]
+
+    operations = [
+        UnaccentExtension(),
+        migrations.RunPython(build_search_config, migrations.RunPython.noop),
+    ]
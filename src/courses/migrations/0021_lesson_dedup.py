@@ -0,0 +1,35 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0020_search_unaccent'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='lesson',
+            name='dedup_status',
+            field=models.CharField(blank=True, choices=[('pending', 'Pendiente'), ('processing', 'Procesando'), ('ready', 'Lista'), ('failed', 'Fallida')], editable=False, max_length=12),
+        ),
+        migrations.AddField(
+            model_name='lesson',
+            name='dedup_attempts',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='lesson',
+            name='dedup_error',
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name='lesson',
+            name='dedup_available_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='lesson',
+            index=models.Index(fields=['dedup_status', 'dedup_available_at'], name='courses_lesson_dedup_queue_idx'),
+        ),
+    ]
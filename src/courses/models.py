@@ -1,19 +1,31 @@
+import posixpath
 import uuid
 
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
 from django.contrib.auth.models import User
 from django.utils import timezone
 from django.core.files.storage import default_storage
 from django.conf import settings
 
+from .attachments import attachment_upload_to
+from .jobs import STATUS_CHOICES as JOB_STATUS_CHOICES
+
 # Helper para obtener el storage correcto
 def get_file_storage():
     """Retorna el storage configurado en settings o el default"""
     if hasattr(settings, 'DEFAULT_FILE_STORAGE') and settings.DEFAULT_FILE_STORAGE:
         from django.utils.module_loading import import_string
         storage_class = import_string(settings.DEFAULT_FILE_STORAGE)
-        return storage_class()
-    return default_storage
+        storage = storage_class()
+    else:
+        storage = default_storage
+    if getattr(settings, "DEDUPLICATE_ATTACHMENTS", False):
+        # Un solo blob por contenido, con conteo de referencias (courses.storage)
+        from .storage import DeduplicatingStorage
+        return DeduplicatingStorage(storage)
+    return storage
 
 
 # =========================
@@ -41,33 +53,96 @@ class Course(models.Model):
 
     created_at = models.DateTimeField(auto_now_add=True)
 
+    # Contadores desnormalizados (mantenidos por courses.signals)
+    # Se reconstruyen con: python manage.py rebuild_course_counters
+    lesson_count = models.PositiveIntegerField(default=0, editable=False)
+    enrollment_count = models.PositiveIntegerField(default=0, editable=False)
+    comment_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_sum = models.PositiveIntegerField(default=0, editable=False)
+    rating_count = models.PositiveIntegerField(default=0, editable=False)
+
+    # Borrado en segundo plano (courses.deletion): marcado, el curso deja de
+    # verse y el worker borra sus filas por lotes; done/total es el avance
+    deletion_requested_at = models.DateTimeField(null=True, blank=True, editable=False, db_index=True)
+    deletion_total = models.PositiveBigIntegerField(default=0, editable=False)
+    deletion_done = models.PositiveBigIntegerField(default=0, editable=False)
+
+    # Índice de búsqueda en PostgreSQL (ver courses.search)
+    # En SQLite se usa la tabla FTS5 courses_course_fts
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    COUNTER_FIELDS = (
+        "lesson_count",
+        "enrollment_count",
+        "comment_count",
+        "rating_sum",
+        "rating_count",
+    )
+    # Campos que solo se actualizan con UPDATE directos, nunca desde save()
+    DERIVED_FIELDS = COUNTER_FIELDS + (
+        "search_vector",
+        "deletion_requested_at",
+        "deletion_total",
+        "deletion_done",
+    )
+
     class Meta:
         ordering = ("-created_at",)
+        indexes = [
+            GinIndex(fields=["search_vector"], name="course_search_vector_gin"),
+            # Catálogo: listados por fecha con desempate por id (KeysetPaginator)
+            models.Index(
+                fields=["-created_at", "-id"],
+                condition=models.Q(is_listed=True),
+                name="course_listed_recent_idx",
+            ),
+        ]
 
     def __str__(self):
         return self.title
 
+    def save(self, *args, **kwargs):
+        # Los contadores solo cambian con F(); al editar el curso no se
+        # deben sobrescribir con los valores (posiblemente viejos) en memoria
+        if not self._state.adding and kwargs.get("update_fields") is None:
+            kwargs["update_fields"] = [
+                field.name
+                for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.DERIVED_FIELDS
+            ]
+        super().save(*args, **kwargs)
+
     def get_absolute_url(self):
         from django.urls import reverse
         return reverse("courses:course_detail", kwargs={"identifier": self.identifier})
+
+    @property
+    def is_being_deleted(self):
+        return self.deletion_requested_at is not None
+
+    def get_deletion_percent(self):
+        """Avance del borrado en segundo plano (0-100)."""
+        if not self.deletion_total:
+            return 0
+        return min(100, round(self.deletion_done * 100 / self.deletion_total))
     
     def get_total_lessons(self):
         """Retorna el número total de lecciones del curso."""
-        return self.lessons.count()
+        return self.lesson_count
     
     def get_total_enrollments(self):
         """Retorna el número total de inscripciones."""
-        return self.enrollments.count()
+        return self.enrollment_count
     
     def get_average_rating(self):
         """Retorna el promedio de calificaciones (1-5 estrellas)."""
-        from django.db.models import Avg
-        avg = self.courserating_set.aggregate(Avg('rating'))['rating__avg']
-        return round(avg, 1) if avg else None
+        if not self.rating_count:
+            return None
+        return round(self.rating_sum / self.rating_count, 1)
     
     def get_total_comments(self):
         """Retorna el número total de comentarios."""
-        return self.comments.count()
+        return self.comment_count
 
 
 # =========================
@@ -103,15 +178,57 @@ class Lesson(models.Model):
     )
 
     attachment = models.FileField(
-        upload_to="lessons/%Y/%m/%d/",
+        upload_to=attachment_upload_to,  # lessons/%Y/%m/%d/<único>/<archivo>
         blank=True,
         null=True,
         storage=get_file_storage(),  # Usa el storage configurado en settings
         help_text="Sube videos (MP4, WebM, MOV), imágenes (JPG, PNG, GIF) o documentos (PDF, DOC, ZIP)"
     )
 
+    # Metadatos del adjunto, calculados al subirlo (courses.metadata).
+    # Las páginas usan estas columnas en lugar de preguntar al storage.
+    attachment_size = models.BigIntegerField(null=True, blank=True, editable=False, db_index=True)
+    attachment_mime = models.CharField(max_length=100, blank=True, editable=False, db_index=True)
+    attachment_sha256 = models.CharField(max_length=64, blank=True, editable=False, db_index=True)
+    attachment_duration = models.FloatField(null=True, blank=True, editable=False, db_index=True)
+    attachment_width = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    attachment_height = models.PositiveIntegerField(null=True, blank=True, editable=False)
+
+    # Transcodificación a HLS de los videos subidos (courses.transcoding).
+    # Estado de la cola: courses.jobs
+    hls_status = models.CharField(max_length=12, choices=JOB_STATUS_CHOICES, blank=True, editable=False)
+    hls_playlist = models.CharField(max_length=255, blank=True, editable=False)
+    hls_attempts = models.PositiveSmallIntegerField(default=0, editable=False)
+    hls_error = models.TextField(blank=True, editable=False)
+    hls_available_at = models.DateTimeField(null=True, blank=True, editable=False)
+
+    # Variantes AVIF/WebP de las imágenes subidas (courses.images):
+    # {"prefix": ..., "avif": [anchos], "webp": [anchos]} y un placeholder
+    # diminuto como data URI. Estado de la cola: courses.jobs
+    image_status = models.CharField(max_length=12, choices=JOB_STATUS_CHOICES, blank=True, editable=False)
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
+    image_placeholder = models.TextField(blank=True, editable=False)
+    image_attempts = models.PositiveSmallIntegerField(default=0, editable=False)
+    image_error = models.TextField(blank=True, editable=False)
+    image_available_at = models.DateTimeField(null=True, blank=True, editable=False)
+
+    # Deduplicación de los archivos subidos directo al bucket
+    # (courses.deduplication). Estado de la cola: courses.jobs
+    dedup_status = models.CharField(max_length=12, choices=JOB_STATUS_CHOICES, blank=True, editable=False)
+    dedup_attempts = models.PositiveSmallIntegerField(default=0, editable=False)
+    dedup_error = models.TextField(blank=True, editable=False)
+    dedup_available_at = models.DateTimeField(null=True, blank=True, editable=False)
+
     order = models.PositiveIntegerField()
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Archivo original para que courses.signals detecte cuando cambia
+        if "attachment" in field_names:
+            instance._loaded_attachment = instance.attachment.name or ""
+        return instance
+
     def __str__(self):
         return f"{self.course.title} - {self.title}"
 
@@ -127,6 +244,77 @@ class Lesson(models.Model):
         # Si ya es una URL de embed o otra plataforma, devolverla tal cual
         return self.video_url
 
+    def get_media_version(self):
+        """
+        Huella del archivo para la URL: cambia con cada reemplazo, así la
+        respuesta se puede cachear como inmutable.
+        """
+        if not self.attachment:
+            return ""
+        if self.attachment_sha256:
+            return self.attachment_sha256[:16]
+        # Los nombres no se reutilizan (attachment_upload_to, blobs por hash)
+        import hashlib
+        return hashlib.sha256(self.attachment.name.encode()).hexdigest()[:16]
+
+    def get_media_url(self):
+        """URL protegida y versionada del adjunto (valida la inscripción antes de servirlo)."""
+        if not self.attachment:
+            return ""
+        from django.urls import reverse
+        return reverse(
+            "courses:lesson_media_version",
+            kwargs={"identifier": self.course.identifier, "pk": self.pk, "version": self.get_media_version()},
+        )
+
+    def get_hls_version(self):
+        """Corrida de la transcodificación: cada una tiene su propio directorio."""
+        return posixpath.basename(posixpath.dirname(self.hls_playlist))
+
+    def get_hls_url(self):
+        """URL protegida del master playlist HLS ("" si aún no está listo)."""
+        if self.hls_status != "ready" or not self.hls_playlist:
+            return ""
+        from django.urls import reverse
+        return reverse(
+            "courses:lesson_hls",
+            kwargs={
+                "identifier": self.course.identifier,
+                "pk": self.pk,
+                "version": self.get_hls_version(),
+                "name": "master.m3u8",
+            },
+        )
+
+    def get_image_sources(self):
+        """
+        [(tipo MIME, srcset)] de las variantes listas, del formato más
+        liviano al más pesado, para los <source> de un <picture>.
+        """
+        if self.image_status != "ready" or not self.image_variants:
+            return []
+        from django.urls import reverse
+        from .images import FORMATS, MIME_TYPES
+        sources = []
+        for format in FORMATS:
+            srcset = ", ".join(
+                reverse(
+                    "courses:lesson_image_variant",
+                    kwargs={
+                        "identifier": self.course.identifier,
+                        "pk": self.pk,
+                        "version": posixpath.basename(self.image_variants["prefix"]),
+                        "width": width,
+                        "format": format,
+                    },
+                )
+                + f" {width}w"
+                for width in self.image_variants.get(format, [])
+            )
+            if srcset:
+                sources.append((MIME_TYPES[format], srcset))
+        return sources
+
     def get_file_name(self):
         """Obtiene el nombre del archivo sin la ruta."""
         if self.attachment:
@@ -137,19 +325,17 @@ class Lesson(models.Model):
         """Verifica si el attachment es un archivo de video."""
         if not self.attachment:
             return False
+        if self.attachment_mime:
+            return self.attachment_mime.startswith("video/")
         video_extensions = ['.mp4', '.webm', '.mov', '.avi', '.mkv', '.m4v']
         file_name = self.attachment.name.lower()
         return any(file_name.endswith(ext) for ext in video_extensions)
     
     def get_file_size_mb(self):
-        """Retorna el tamaño del archivo en MB."""
-        if not self.attachment:
-            return None
-        try:
-            size_bytes = self.attachment.size
-            return round(size_bytes / (1024 * 1024), 2)
-        except (AttributeError, OSError):
+        """Retorna el tamaño del archivo en MB (None si aún no se calculó)."""
+        if not self.attachment or self.attachment_size is None:
             return None
+        return round(self.attachment_size / (1024 * 1024), 2)
     
     def get_content_preview(self):
         """Retorna un preview del contenido según el tipo."""
@@ -163,7 +349,14 @@ class Lesson(models.Model):
 
     class Meta:
         ordering = ("order", "id")
+        # En PostgreSQL la restricción es DEFERRABLE (ver courses.ordering)
         unique_together = ("course", "order")
+        indexes = [
+            # Cola de transcodificación: pendientes por disponibilidad
+            models.Index(fields=["hls_status", "hls_available_at"], name="courses_lesson_hls_queue_idx"),
+            models.Index(fields=["image_status", "image_available_at"], name="courses_lesson_image_queue_idx"),
+            models.Index(fields=["dedup_status", "dedup_available_at"], name="courses_lesson_dedup_queue_idx"),
+        ]
 
 
 # =========================
@@ -183,10 +376,15 @@ class Enrollment(models.Model):
     )
 
     enrolled_at = models.DateTimeField(auto_now_add=True)
+    # El progreso de lecciones está en ArchivedProgress (courses.archive)
+    progress_archived = models.BooleanField(default=False, editable=False)
 
     class Meta:
         unique_together = ("user", "course")
         ordering = ("-enrolled_at",)
+        indexes = [
+            models.Index(fields=["user", "-enrolled_at"], name="enrollment_user_recent_idx"),
+        ]
 
     def __str__(self):
         return f"{self.user.username} -> {self.course.title}"
@@ -206,6 +404,18 @@ class LessonProgress(models.Model):
         on_delete=models.CASCADE
     )
 
+    # Copia de lesson.course_id: el progreso de un curso se lee sin unir
+    # con Lesson. Se asigna en save() (y en los bulk_create de heartbeat).
+    # El índice simple se crea en la migración, sin bloquear la tabla
+    course = models.ForeignKey(
+        Course,
+        on_delete=models.CASCADE,
+        related_name="lesson_progress",
+        null=True,
+        editable=False,
+        db_index=False,
+    )
+
     completed = models.BooleanField(default=False)
     completed_at = models.DateTimeField(null=True, blank=True)
 
@@ -219,6 +429,24 @@ class LessonProgress(models.Model):
     class Meta:
         unique_together = ("user", "lesson")
         ordering = ("lesson",)
+        indexes = [
+            # Progreso y lecciones completadas de un usuario por curso
+            models.Index(fields=["user", "course", "completed"], name="progress_user_course_idx"),
+            models.Index(fields=["course"], name="progress_course_idx"),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Estado original para que courses.signals detecte cambios de "completed"
+        if "completed" in field_names:
+            instance._loaded_completed = instance.completed
+        return instance
+
+    def save(self, *args, **kwargs):
+        if self.course_id is None and self.lesson_id is not None:
+            self.course_id = self.lesson.course_id
+        super().save(*args, **kwargs)
 
     def mark_completed(self):
         """
@@ -281,3 +509,113 @@ class Comment(models.Model):
 
     class Meta:
         ordering = ("-created_at",)
+        indexes = [
+            models.Index(fields=["course", "-created_at"], name="comment_course_recent_idx"),
+        ]
+
+
+# =========================
+# ArchivedProgress (progreso frío)
+# =========================
+class ArchivedProgress(models.Model):
+    """
+    Progreso de lecciones de una inscripción inactiva, comprimido en una
+    sola fila por usuario y curso (ver courses.archive).
+    """
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name="+",
+    )
+    course = models.ForeignKey(
+        Course,
+        on_delete=models.CASCADE,
+        related_name="+",
+    )
+    data = models.BinaryField()
+    lesson_count = models.PositiveIntegerField(default=0)
+    # Lecciones completadas dentro de `data`: los resúmenes las cuentan sin descomprimir
+    completed_count = models.PositiveIntegerField(default=0)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ("user", "course")
+
+    def __str__(self):
+        return f"{self.user_id} - {self.course_id}: {self.lesson_count} lecciones archivadas"
+
+
+# =========================
+# CourseProgressSummary (resumen por usuario y curso)
+# =========================
+class CourseProgressSummary(models.Model):
+    """
+    Progreso agregado de un usuario en un curso. Se mantiene desde
+    courses.signals y se reconstruye con `rebuild_progress_summaries`.
+    """
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name="progress_summaries"
+    )
+
+    course = models.ForeignKey(
+        Course,
+        on_delete=models.CASCADE,
+        related_name="progress_summaries"
+    )
+
+    completed_lessons = models.PositiveIntegerField(default=0)
+    total_lessons = models.PositiveIntegerField(default=0)
+    last_activity = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        unique_together = ("user", "course")
+        ordering = ("-last_activity",)
+
+    def __str__(self):
+        return f"{self.user.username} - {self.course.title}: {self.completed_lessons}/{self.total_lessons}"
+
+    @property
+    def progress_percent(self):
+        if not self.total_lessons:
+            return 0
+        completed = min(self.completed_lessons, self.total_lessons)
+        return round((completed / self.total_lessons) * 100, 2)
+
+
+# =========================
+# AttachmentBlob (adjuntos deduplicados)
+# =========================
+class AttachmentBlob(models.Model):
+    """
+    Un archivo guardado una sola vez por contenido (courses.storage).
+    ref_count es cuántas lecciones lo usan; en cero se borra.
+    """
+    key = models.CharField(max_length=100, unique=True)
+    sha256 = models.CharField(max_length=64, db_index=True)
+    size = models.BigIntegerField()
+    ref_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.key} ({self.ref_count})"
+
+
+# =========================
+# StorageDeletion (borrados pendientes)
+# =========================
+class StorageDeletion(models.Model):
+    """
+    Archivo (o prefijo, con is_prefix) pendiente de borrar del storage.
+    Lo procesa en lotes courses.cleanup.
+    """
+    name = models.CharField(max_length=1024, unique=True)
+    is_prefix = models.BooleanField(default=False)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    available_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    def __str__(self):
+        return self.name + ("/*" if self.is_prefix else "")
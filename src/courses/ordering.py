@@ -0,0 +1,84 @@
+"""
+Reordenamiento de lecciones en un número constante de sentencias.
+
+El orden nuevo se aplica con un único UPDATE ... CASE id WHEN. En PostgreSQL la
+restricción única (course, order) es DEFERRABLE (migración 0009), así que se
+difiere hasta el COMMIT; en otros motores primero se desplazan las lecciones
+afectadas fuera del rango en uso (un UPDATE más) para no chocar fila a fila.
+"""
+from itertools import chain
+
+from django.db import connection, transaction
+from django.db.models import F
+
+from . import caching
+from .models import Lesson
+
+# Nombre de la restricción diferible creada en PostgreSQL
+LESSON_ORDER_CONSTRAINT = "courses_lesson_course_order_uniq"
+
+
+class ReorderError(ValueError):
+    """El orden enviado no es una permutación válida de las lecciones del curso."""
+
+
+def _parse(lesson_orders):
+    """Convierte [{"id": .., "order": ..}, ...] en {lesson_id: order}."""
+    new_orders = {}
+    for item in lesson_orders:
+        try:
+            lesson_id, order = int(item["id"]), int(item["order"])
+        except (KeyError, TypeError, ValueError):
+            raise ReorderError("Cada lección debe incluir id y order numéricos")
+        if lesson_id in new_orders:
+            raise ReorderError("Una lección aparece más de una vez")
+        new_orders[lesson_id] = order
+    if sorted(new_orders.values()) != list(range(1, len(new_orders) + 1)):
+        raise ReorderError("Los órdenes deben ser 1, 2, 3… sin repetir ni saltar valores")
+    return new_orders
+
+
+def reorder_lessons(course, lesson_orders):
+    """
+    Aplica el nuevo orden a todas las lecciones del curso.
+    Retorna cuántas lecciones cambiaron de posición.
+    """
+    new_orders = _parse(lesson_orders)
+
+    with transaction.atomic():
+        current = dict(
+            Lesson.objects.select_for_update()
+            .filter(course=course)
+            .values_list("id", "order")
+        )
+        if set(current) != set(new_orders):
+            raise ReorderError("El nuevo orden debe incluir todas las lecciones del curso exactamente una vez")
+
+        changed = {pk: order for pk, order in new_orders.items() if current[pk] != order}
+        if not changed:
+            return 0
+
+        lessons = Lesson.objects.filter(course=course, id__in=changed)
+        if connection.vendor == "postgresql":
+            with connection.cursor() as cursor:
+                cursor.execute(f"SET CONSTRAINTS {connection.ops.quote_name(LESSON_ORDER_CONSTRAINT)} DEFERRED")
+        else:
+            offset = max(max(current.values()), len(new_orders)) + 1
+            lessons.update(order=F("order") + offset)
+
+        # CASE escrito a mano: construir cientos de When() en el ORM cuesta
+        # más que la propia sentencia
+        table = connection.ops.quote_name(Lesson._meta.db_table)
+        column = connection.ops.quote_name("order")
+        ids = ", ".join(["%s"] * len(changed))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"UPDATE {table} SET {column} = CASE id "
+                + "WHEN %s THEN %s " * len(changed)
+                + f"END WHERE course_id = %s AND id IN ({ids})",
+                [*chain.from_iterable(changed.items()), course.pk, *changed],
+            )
+
+    # update() no dispara post_save: se invalida el caché del curso a mano
+    caching.invalidate_course(course.pk, catalog=False)
+    return len(changed)
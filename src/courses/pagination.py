@@ -0,0 +1,104 @@
+"""
+Paginación por cursor (keyset) para el catálogo.
+
+En lugar de OFFSET n, cada página filtra por la última fila vista:
+(created_at, id) < (cursor_created_at, cursor_id). Así la página 500
+cuesta lo mismo que la primera. El cursor es opaco y va firmado.
+"""
+from django.core import signing
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+CURSOR_SALT = "courses.catalog-cursor"
+
+
+class KeysetPage:
+    keyset = True
+
+    def __init__(self, object_list, paginator, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class KeysetPaginator:
+    """
+    Pagina un queryset ordenado de forma descendente por (created_at, id).
+    `count` no se calcula aquí: se recibe ya cacheado para no hacer COUNT(*).
+    """
+
+    def __init__(self, queryset, per_page, count=None):
+        self.queryset = queryset.order_by("-created_at", "-id")
+        self.per_page = per_page
+        self.count = count
+
+    @staticmethod
+    def encode_cursor(course, direction):
+        return signing.dumps(
+            {"c": course.created_at.isoformat(), "i": course.pk, "d": direction},
+            salt=CURSOR_SALT,
+            compress=True,
+        )
+
+    @staticmethod
+    def decode_cursor(cursor):
+        """Retorna (created_at, id, dirección) o None si el cursor no es válido."""
+        try:
+            data = signing.loads(cursor, salt=CURSOR_SALT)
+            created_at = parse_datetime(data["c"])
+            if created_at is None or data["d"] not in ("next", "prev"):
+                return None
+            return created_at, int(data["i"]), data["d"]
+        except (signing.BadSignature, KeyError, TypeError, ValueError):
+            return None
+
+    def page(self, cursor=None):
+        position = self.decode_cursor(cursor) if cursor else None
+        if position is None:
+            rows = list(self.queryset[: self.per_page + 1])
+            has_more, has_before = len(rows) > self.per_page, False
+            rows = rows[: self.per_page]
+        else:
+            created_at, pk, direction = position
+            if direction == "next":
+                rows = list(
+                    self.queryset.filter(
+                        Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk)
+                    )[: self.per_page + 1]
+                )
+                has_more, has_before = len(rows) > self.per_page, True
+                rows = rows[: self.per_page]
+            else:
+                # Hacia atrás: orden ascendente y luego se invierte
+                rows = list(
+                    self.queryset.filter(
+                        Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=pk)
+                    ).order_by("created_at", "id")[: self.per_page + 1]
+                )
+                has_before, has_more = len(rows) > self.per_page, True
+                rows = rows[: self.per_page][::-1]
+
+        if not rows:
+            return KeysetPage(rows, self)
+        return KeysetPage(
+            rows,
+            self,
+            next_cursor=self.encode_cursor(rows[-1], "next") if has_more else None,
+            previous_cursor=self.encode_cursor(rows[0], "prev") if has_before else None,
+        )
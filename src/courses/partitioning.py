@@ -0,0 +1,256 @@
+"""
+Particionado de LessonProgress por hash de usuario (solo PostgreSQL).
+
+Convertir en línea una tabla grande en particionada no se puede con un
+ALTER TABLE, así que el comando `partition_lesson_progress` lo hace por
+pasos, con la aplicación funcionando:
+
+1. prepare(): crea la tabla particionada "<tabla>_p" (PARTITION BY HASH
+   (user_id), LESSON_PROGRESS_PARTITIONS particiones) con las mismas
+   columnas, llaves foráneas e índices, y un trigger en la tabla actual que
+   replica en ella cada INSERT/UPDATE/DELETE.
+2. copy(): copia las filas existentes en lotes por rango de id (INSERT ...
+   ON CONFLICT DO NOTHING: lo que el trigger ya escribió es más nuevo).
+   Se puede cortar y volver a correr.
+3. swap(): en una transacción corta con la tabla bloqueada, quita el
+   trigger, borra de la particionada las filas que ya no existen en la
+   actual (un lote de copy puede reinsertar una fila borrada mientras
+   corría, después de que el trigger borró su copia), renombra la tabla
+   actual a "<tabla>_old" y la particionada al nombre original, y le da
+   una secuencia propia para los id.
+4. drop_old(): borra "<tabla>_old" cuando ya no haga falta volver atrás.
+
+La llave primaria de la tabla particionada es (id, user_id): PostgreSQL
+exige que incluya la columna de partición. Django sigue usando solo id
+(único por la secuencia). Las consultas por usuario leen una sola
+partición; las que van solo por id revisan el índice de cada una.
+
+Después del cambio, las migraciones que creen índices en LessonProgress no
+pueden usar CREATE INDEX CONCURRENTLY sobre la tabla padre.
+"""
+import logging
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from .models import LessonProgress
+
+logger = logging.getLogger("courses")
+
+BATCH_SIZE = 10000
+PARTITION_KEY = "user_id"
+
+
+class PartitioningError(Exception):
+    pass
+
+
+def _table():
+    return LessonProgress._meta.db_table
+
+
+def partitioned_table():
+    return f"{_table()}_p"
+
+
+def old_table():
+    return f"{_table()}_old"
+
+
+def _trigger():
+    return f"{_table()}_mirror"
+
+
+def _sequence():
+    return f"{partitioned_table()}_id_seq"
+
+
+def _q(name):
+    return connection.ops.quote_name(name)
+
+
+def _columns():
+    return [field.column for field in LessonProgress._meta.local_concrete_fields]
+
+
+def _check_vendor():
+    if connection.vendor != "postgresql":
+        raise PartitioningError("El particionado de LessonProgress solo está disponible en PostgreSQL.")
+
+
+def _exists(table):
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT to_regclass(%s) IS NOT NULL", [table])
+        return cursor.fetchone()[0]
+
+
+def is_partitioned():
+    """True si la tabla de LessonProgress ya es la particionada."""
+    if connection.vendor != "postgresql":
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s))", [_table()]
+        )
+        return cursor.fetchone()[0]
+
+
+def _index_sql(index, table, name):
+    columns = ", ".join(
+        f"{_q(LessonProgress._meta.get_field(field.lstrip('-')).column)}{' DESC' if field.startswith('-') else ''}"
+        for field in index.fields
+    )
+    return f"CREATE INDEX {_q(name)} ON {_q(table)} ({columns})"
+
+
+def _mirror_function_sql(table, target):
+    columns = _columns()
+    column_list = ", ".join(_q(column) for column in columns)
+    values = ", ".join(f"NEW.{_q(column)}" for column in columns)
+    updates = ", ".join(f"{_q(column)} = EXCLUDED.{_q(column)}" for column in columns if column != "id")
+    return f"""
+        CREATE OR REPLACE FUNCTION {_q(_trigger())}() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'DELETE' THEN
+                DELETE FROM {_q(target)} WHERE id = OLD.id AND {PARTITION_KEY} = OLD.{PARTITION_KEY};
+                RETURN OLD;
+            END IF;
+            INSERT INTO {_q(target)} ({column_list}) VALUES ({values})
+            ON CONFLICT (id, {PARTITION_KEY}) DO UPDATE SET {updates};
+            RETURN NEW;
+        END
+        $$ LANGUAGE plpgsql
+    """
+
+
+def prepare(partitions=None):
+    """Crea la tabla particionada y el trigger de réplica (idempotente)."""
+    _check_vendor()
+    if is_partitioned():
+        raise PartitioningError("LessonProgress ya está particionada.")
+    partitions = partitions or getattr(settings, "LESSON_PROGRESS_PARTITIONS", 16)
+    table, target = _table(), partitioned_table()
+    with transaction.atomic(), connection.cursor() as cursor:
+        if not _exists(target):
+            # LIKE copia tipos, NOT NULL, CHECK y defaults, pero no la identidad de id
+            cursor.execute(
+                f"CREATE TABLE {_q(target)} (LIKE {_q(table)} INCLUDING DEFAULTS INCLUDING CONSTRAINTS) "
+                f"PARTITION BY HASH ({PARTITION_KEY})"
+            )
+            for remainder in range(partitions):
+                cursor.execute(
+                    f"CREATE TABLE {_q(f'{target}{remainder}')} PARTITION OF {_q(target)} "
+                    f"FOR VALUES WITH (MODULUS {partitions}, REMAINDER {remainder})"
+                )
+            # Con la tabla vacía, las llaves e índices se crean al instante
+            cursor.execute(f"ALTER TABLE {_q(target)} ADD PRIMARY KEY (id, {PARTITION_KEY})")
+            for fields in LessonProgress._meta.unique_together:
+                columns = ", ".join(_q(LessonProgress._meta.get_field(field).column) for field in fields)
+                cursor.execute(f"ALTER TABLE {_q(target)} ADD UNIQUE ({columns})")
+            for field in LessonProgress._meta.local_concrete_fields:
+                if field.is_relation:
+                    cursor.execute(
+                        f"ALTER TABLE {_q(target)} ADD FOREIGN KEY ({_q(field.column)}) "
+                        f"REFERENCES {_q(field.related_model._meta.db_table)} ({_q(field.target_field.column)}) "
+                        f"DEFERRABLE INITIALLY DEFERRED"
+                    )
+            for index in LessonProgress._meta.indexes:
+                cursor.execute(_index_sql(index, target, f"{index.name}_p"))
+            for field in LessonProgress._meta.local_concrete_fields:
+                if field.is_relation and field.db_index:
+                    # Los índices automáticos de las llaves foráneas (borrados en
+                    # cascada de lecciones, courses.deletion) no están en _meta.indexes
+                    cursor.execute(
+                        f"CREATE INDEX {_q(f'{target}_{field.column}_idx')} ON {_q(target)} ({_q(field.column)})"
+                    )
+            cursor.execute(f"CREATE SEQUENCE {_q(_sequence())} OWNED BY {_q(target)}.id")
+        cursor.execute(_mirror_function_sql(table, target))
+        cursor.execute(f"DROP TRIGGER IF EXISTS {_q(_trigger())} ON {_q(table)}")
+        cursor.execute(
+            f"CREATE TRIGGER {_q(_trigger())} AFTER INSERT OR UPDATE OR DELETE ON {_q(table)} "
+            f"FOR EACH ROW EXECUTE FUNCTION {_q(_trigger())}()"
+        )
+    logger.info(f"Tabla particionada {target} lista ({partitions} particiones)")
+
+
+def copy(batch_size=BATCH_SIZE):
+    """Copia las filas existentes a la tabla particionada. Retorna las copiadas."""
+    _check_vendor()
+    table, target = _table(), partitioned_table()
+    if not _exists(target):
+        raise PartitioningError("Falta preparar la tabla particionada (--prepare).")
+    column_list = ", ".join(_q(column) for column in _columns())
+    copied = 0
+    last_id = 0
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT max(id) FROM {_q(table)}")
+        max_id = cursor.fetchone()[0] or 0
+        while last_id < max_id:
+            # Cada lote en su propia transacción (autocommit)
+            cursor.execute(
+                f"INSERT INTO {_q(target)} ({column_list}) "
+                f"SELECT {column_list} FROM {_q(table)} WHERE id > %s AND id <= %s "
+                f"ON CONFLICT DO NOTHING",
+                [last_id, last_id + batch_size],
+            )
+            copied += cursor.rowcount
+            last_id += batch_size
+    return copied
+
+
+def missing_rows():
+    """Filas de la tabla actual que aún no están en la particionada."""
+    table, target = _table(), partitioned_table()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT count(*) FROM {_q(table)} o WHERE NOT EXISTS "
+            f"(SELECT 1 FROM {_q(target)} n WHERE n.id = o.id AND n.{PARTITION_KEY} = o.{PARTITION_KEY})"
+        )
+        return cursor.fetchone()[0]
+
+
+def _delete_stale(cursor):
+    """Borra de la tabla particionada las filas que ya no existen en la actual."""
+    table, target = _table(), partitioned_table()
+    cursor.execute(
+        f"DELETE FROM {_q(target)} n WHERE NOT EXISTS "
+        f"(SELECT 1 FROM {_q(table)} o WHERE o.id = n.id AND o.{PARTITION_KEY} = n.{PARTITION_KEY})"
+    )
+    return cursor.rowcount
+
+
+def swap():
+    """Pone la tabla particionada en lugar de la actual (bloqueo breve)."""
+    _check_vendor()
+    table, target, old = _table(), partitioned_table(), old_table()
+    if not _exists(target):
+        raise PartitioningError("Falta preparar la tabla particionada (--prepare).")
+    if missing_rows():
+        raise PartitioningError("La copia no está completa (--copy).")
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f"LOCK TABLE {_q(table)} IN ACCESS EXCLUSIVE MODE")
+        cursor.execute(f"DROP TRIGGER {_q(_trigger())} ON {_q(table)}")
+        cursor.execute(f"DROP FUNCTION {_q(_trigger())}()")
+        stale = _delete_stale(cursor)
+        if stale:
+            logger.info(f"{stale} filas borradas durante la copia quitadas de {target}")
+        cursor.execute(f"ALTER TABLE {_q(table)} RENAME TO {_q(old)}")
+        for index in LessonProgress._meta.indexes:
+            # Los nombres de los índices del modelo pasan a la tabla nueva
+            cursor.execute(f"ALTER INDEX {_q(index.name)} RENAME TO {_q(f'{index.name}_old')}")
+            cursor.execute(f"ALTER INDEX {_q(f'{index.name}_p')} RENAME TO {_q(index.name)}")
+        cursor.execute(f"ALTER TABLE {_q(target)} RENAME TO {_q(table)}")
+        cursor.execute(
+            f"SELECT setval(%s, (SELECT COALESCE(max(id), 0) + 1 FROM {_q(old)}), false)", [_sequence()]
+        )
+        cursor.execute(f"ALTER TABLE {_q(table)} ALTER COLUMN id SET DEFAULT nextval(%s::regclass)", [_sequence()])
+    logger.info(f"{table} ahora está particionada por {PARTITION_KEY}")
+
+
+def drop_old():
+    """Borra la tabla anterior al particionado."""
+    _check_vendor()
+    if not is_partitioned():
+        raise PartitioningError("LessonProgress todavía no está particionada.")
+    with connection.cursor() as cursor:
+        cursor.execute(f"DROP TABLE IF EXISTS {_q(old_table())}")
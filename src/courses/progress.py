@@ -0,0 +1,141 @@
+"""
+Mantenimiento incremental de CourseProgressSummary.
+
+Las funciones de este módulo se llaman desde courses.signals; el comando
+`rebuild_progress_summaries` usa `rebuild_summaries` para recalcular todo.
+"""
+from django.db import transaction
+from django.db.models import Count, F, Max, Q
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from . import archive
+from .models import ArchivedProgress, Course, CourseProgressSummary, Lesson, LessonProgress
+
+
+def _add(field, delta):
+    # Nunca bajar de 0 aunque el resumen se haya desviado
+    return F(field) + delta if delta >= 0 else Greatest(F(field) + delta, 0)
+
+
+def ensure_summary(user_id, course_id):
+    """Crea el resumen (calculado desde LessonProgress y el archivo) si todavía no existe."""
+    summary = CourseProgressSummary.objects.filter(user_id=user_id, course_id=course_id).first()
+    if summary:
+        return summary
+    completed = LessonProgress.objects.filter(user_id=user_id, course_id=course_id, completed=True).count()
+    completed += (
+        ArchivedProgress.objects.filter(user_id=user_id, course_id=course_id)
+        .values_list("completed_count", flat=True)
+        .first()
+        or 0
+    )
+    total = Course.objects.filter(pk=course_id).values_list("lesson_count", flat=True).first() or 0
+    summary, _ = CourseProgressSummary.objects.get_or_create(
+        user_id=user_id,
+        course_id=course_id,
+        defaults={"completed_lessons": completed, "total_lessons": total},
+    )
+    return summary
+
+
+def record_completion_change(user_id, lesson_id, delta, course_id=None):
+    """Suma o resta una lección completada al resumen del curso."""
+    if course_id is None:
+        course_id = Lesson.objects.filter(pk=lesson_id).values_list("course_id", flat=True).first()
+    updated = CourseProgressSummary.objects.filter(user_id=user_id, course_id=course_id).update(
+        completed_lessons=_add("completed_lessons", delta),
+        last_activity=timezone.now(),
+    )
+    if not updated:
+        # Primer progreso sin inscripción previa (instructor o staff)
+        ensure_summary(user_id, course_id)
+
+
+def lesson_added(course_id):
+    CourseProgressSummary.objects.filter(course_id=course_id).update(
+        total_lessons=_add("total_lessons", 1)
+    )
+
+
+def lesson_removed(lesson):
+    """Se llama antes de borrar la lección (su progreso aún existe)."""
+    summaries = CourseProgressSummary.objects.filter(course_id=lesson.course_id)
+    # El progreso archivado también pierde la lección (rehydrate ya no la restauraría)
+    archived_completed = archive.remove_lesson(lesson)
+    summaries.filter(
+        Q(user_id__in=LessonProgress.objects.filter(lesson=lesson, completed=True).values("user_id"))
+        | Q(user_id__in=archived_completed)
+    ).update(completed_lessons=_add("completed_lessons", -1))
+    summaries.update(total_lessons=_add("total_lessons", -1))
+
+
+def rebuild_summaries(
+    User, Course, Enrollment, LessonProgress, CourseProgressSummary, batch_size=500, ArchivedProgress=None
+):
+    """
+    Reconstruye los resúmenes por bloques de usuarios (un bloque por transacción).
+    Recibe los modelos para poder usarse también desde migraciones (las
+    anteriores a 0019 no tienen ArchivedProgress). Retorna el número de
+    resúmenes escritos.
+    """
+    user_ids = User.objects.order_by("pk").values_list("pk", flat=True)
+    # Las migraciones anteriores a 0018 no tienen LessonProgress.course
+    course_field = "course_id" if any(
+        field.name == "course" for field in LessonProgress._meta.get_fields()
+    ) else "lesson__course_id"
+    written = 0
+    last_id = 0
+    while True:
+        batch = list(user_ids.filter(pk__gt=last_id)[:batch_size])
+        if not batch:
+            return written
+        first_id, last_id = batch[0], batch[-1]
+        in_batch = {"user_id__gte": first_id, "user_id__lte": last_id}
+
+        completed = {
+            (user_id, course_id): (total, last_completed)
+            for user_id, course_id, total, last_completed in (
+                LessonProgress.objects.filter(completed=True, **in_batch)
+                .values_list("user_id", course_field)
+                .annotate(total=Count("id"), last_completed=Max("completed_at"))
+                .order_by()
+            )
+        }
+        if ArchivedProgress is not None:
+            # El progreso archivado sigue contando (courses.archive)
+            for user_id, course_id, archived_completed in ArchivedProgress.objects.filter(
+                completed_count__gt=0, **in_batch
+            ).values_list("user_id", "course_id", "completed_count"):
+                total, last_completed = completed.get((user_id, course_id), (0, None))
+                completed[(user_id, course_id)] = (total + archived_completed, last_completed)
+        enrolled = dict(
+            ((user_id, course_id), enrolled_at)
+            for user_id, course_id, enrolled_at in Enrollment.objects.filter(**in_batch).values_list(
+                "user_id", "course_id", "enrolled_at"
+            )
+        )
+        keys = set(completed) | set(enrolled)
+        totals = dict(
+            Course.objects.filter(pk__in={course_id for _, course_id in keys}).values_list(
+                "pk", "lesson_count"
+            )
+        )
+        now = timezone.now()
+        summaries = []
+        for user_id, course_id in keys:
+            total_completed, last_completed = completed.get((user_id, course_id), (0, None))
+            summaries.append(
+                CourseProgressSummary(
+                    user_id=user_id,
+                    course_id=course_id,
+                    completed_lessons=total_completed,
+                    total_lessons=totals.get(course_id, 0),
+                    last_activity=last_completed or enrolled.get((user_id, course_id)) or now,
+                )
+            )
+
+        with transaction.atomic():
+            CourseProgressSummary.objects.filter(**in_batch).delete()
+            CourseProgressSummary.objects.bulk_create(summaries, batch_size=1000)
+        written += len(summaries)
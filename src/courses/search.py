@@ -0,0 +1,215 @@
+"""
+Búsqueda de texto completo para el catálogo de cursos.
+
+- PostgreSQL: columna tsvector `Course.search_vector` con índice GIN y
+  la configuración "<COURSE_SEARCH_CONFIG>_unaccent" (diccionario en
+  español precedido de unaccent, así "programacion" encuentra
+  "programación" igual que en SQLite). Pesos: título A, descripción B,
+  nombre del instructor D.
+- SQLite (DJANGO_USE_SQLITE=1): tabla virtual FTS5 `courses_course_fts`
+  con rowid = id del curso.
+
+Ambos índices se mantienen desde courses.signals al guardar un curso o al
+cambiar el nombre del instructor.
+"""
+import re
+
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connection as default_connection
+from django.db.models import F, Q
+from django.db.models.expressions import RawSQL
+
+COURSE_TABLE = "courses_course"
+USER_TABLE = "auth_user"
+FTS_TABLE = "courses_course_fts"
+
+# Máximo de palabras que se toman de la búsqueda
+MAX_TERMS = 8
+
+
+def _dictionary():
+    return getattr(settings, "COURSE_SEARCH_CONFIG", "spanish")
+
+
+def _config():
+    return f"{_dictionary()}_unaccent"
+
+
+def _terms(text):
+    return re.findall(r"\w+", text.lower())[:MAX_TERMS]
+
+
+def _pg_query(terms, weight=""):
+    # Búsqueda por prefijo para que funcione mientras el usuario escribe
+    return " & ".join(f"{term}:*{weight}" for term in terms)
+
+
+def _fts5_query(terms, column=None):
+    query = " ".join(f'"{term}"*' for term in terms)
+    return f"{column} : ({query})" if column else query
+
+
+def search_courses(queryset, search="", instructor="", connection=None):
+    """Filtra (y ordena por relevancia) el queryset de cursos."""
+    connection = connection or default_connection
+    search_terms = _terms(search)
+    instructor_terms = _terms(instructor)
+    if not search_terms and not instructor_terms:
+        return queryset
+
+    if connection.vendor == "postgresql":
+        if instructor_terms:
+            queryset = queryset.filter(
+                search_vector=SearchQuery(
+                    _pg_query(instructor_terms, weight="D"), config=_config(), search_type="raw"
+                )
+            )
+        if search_terms:
+            query = SearchQuery(_pg_query(search_terms), config=_config(), search_type="raw")
+            queryset = (
+                queryset.filter(search_vector=query)
+                .annotate(rank=SearchRank(F("search_vector"), query))
+                .order_by("-rank", "-created_at")
+            )
+        return queryset
+
+    if connection.vendor == "sqlite":
+        match_sql = f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s"
+        if instructor_terms:
+            queryset = queryset.filter(
+                id__in=RawSQL(match_sql, [_fts5_query(instructor_terms, column="instructor")])
+            )
+        if search_terms:
+            match = _fts5_query(search_terms)
+            queryset = (
+                queryset.filter(id__in=RawSQL(match_sql, [match]))
+                .annotate(
+                    # bm25(): menor es más relevante
+                    rank=RawSQL(
+                        f"SELECT bm25({FTS_TABLE}) FROM {FTS_TABLE} "
+                        f"WHERE {FTS_TABLE} MATCH %s AND rowid = {COURSE_TABLE}.id",
+                        [match],
+                    )
+                )
+                .order_by("rank", "-created_at")
+            )
+        return queryset
+
+    # Otros motores: búsqueda simple por icontains
+    for term in search_terms:
+        queryset = queryset.filter(
+            Q(title__icontains=term)
+            | Q(description__icontains=term)
+            | Q(instructor__first_name__icontains=term)
+            | Q(instructor__last_name__icontains=term)
+            | Q(instructor__username__icontains=term)
+        )
+    for term in instructor_terms:
+        queryset = queryset.filter(
+            Q(instructor__first_name__icontains=term)
+            | Q(instructor__last_name__icontains=term)
+            | Q(instructor__username__icontains=term)
+        )
+    return queryset
+
+
+def create_search_config(connection=None):
+    """
+    Crea en PostgreSQL la configuración de texto sin tildes (requiere la
+    extensión unaccent). No hace nada si ya existe.
+    """
+    connection = connection or default_connection
+    if connection.vendor != "postgresql":
+        return
+    quote = connection.ops.quote_name
+    dictionary = _dictionary()
+    stemmer = "simple" if dictionary == "simple" else f"{dictionary}_stem"
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_ts_config WHERE cfgname = %s", [_config()])
+        if cursor.fetchone():
+            return
+        cursor.execute(f"CREATE TEXT SEARCH CONFIGURATION {quote(_config())} (COPY = {quote(dictionary)})")
+        cursor.execute(
+            f"ALTER TEXT SEARCH CONFIGURATION {quote(_config())} "
+            f"ALTER MAPPING FOR hword, hword_part, word WITH unaccent, {quote(stemmer)}"
+        )
+
+
+def create_search_index(connection=None):
+    """Crea la tabla FTS5 en SQLite (en PostgreSQL la columna viene del modelo)."""
+    connection = connection or default_connection
+    if connection.vendor != "sqlite":
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+            "title, description, instructor, tokenize='unicode61 remove_diacritics 2')"
+        )
+
+
+def drop_search_index(connection=None):
+    connection = connection or default_connection
+    if connection.vendor != "sqlite":
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+
+
+def index_courses(course_ids=None, instructor_id=None, connection=None, config=None):
+    """
+    Recalcula el índice de los cursos indicados (por id o por instructor).
+    Sin argumentos reindexa todo el catálogo en una sola sentencia.
+    `config` solo lo cambian las migraciones anteriores a la configuración
+    sin tildes.
+    """
+    connection = connection or default_connection
+    conditions, params = [], []
+    if course_ids is not None:
+        if not course_ids:
+            return
+        conditions.append("c.id IN (%s)" % ", ".join(["%s"] * len(course_ids)))
+        params.extend(course_ids)
+    if instructor_id is not None:
+        conditions.append("c.instructor_id = %s")
+        params.append(instructor_id)
+    where = " AND ".join(conditions) or "1 = 1"
+
+    with connection.cursor() as cursor:
+        if connection.vendor == "postgresql":
+            config = config or _config()
+            cursor.execute(
+                f"""
+                UPDATE {COURSE_TABLE} AS c SET search_vector =
+                    setweight(to_tsvector(%s::regconfig, coalesce(c.title, '')), 'A') ||
+                    setweight(to_tsvector(%s::regconfig, coalesce(c.description, '')), 'B') ||
+                    setweight(to_tsvector(%s::regconfig,
+                        concat_ws(' ', u.first_name, u.last_name, u.username)), 'D')
+                FROM {USER_TABLE} AS u
+                WHERE u.id = c.instructor_id AND {where}
+                """,
+                [config, config, config, *params],
+            )
+        elif connection.vendor == "sqlite":
+            cursor.execute(
+                f"""
+                INSERT OR REPLACE INTO {FTS_TABLE} (rowid, title, description, instructor)
+                SELECT c.id, c.title, c.description,
+                       u.first_name || ' ' || u.last_name || ' ' || u.username
+                FROM {COURSE_TABLE} AS c JOIN {USER_TABLE} AS u ON u.id = c.instructor_id
+                WHERE {where}
+                """,
+                params,
+            )
+
+
+def remove_courses(course_ids, connection=None):
+    """Quita cursos borrados de la tabla FTS5 (en PostgreSQL se borra con la fila)."""
+    connection = connection or default_connection
+    if connection.vendor != "sqlite" or not course_ids:
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"DELETE FROM {FTS_TABLE} WHERE rowid IN (%s)" % ", ".join(["%s"] * len(course_ids)),
+            list(course_ids),
+        )
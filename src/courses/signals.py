@@ -0,0 +1,212 @@
+"""
+Mantiene los datos derivados: contadores e índice de búsqueda de Course,
+los resúmenes de progreso (CourseProgressSummary), las versiones del caché
+y el caché de inscripciones por usuario (courses.access).
+
+Cada alta o baja de Lesson, Enrollment, Comment y CourseRating ajusta el
+contador con una expresión F() (un UPDATE atómico, sin leer la fila).
+Las operaciones masivas (bulk_create, QuerySet.update/delete sin señales)
+no pasan por aquí: para corregir desvíos usar `rebuild_course_counters`.
+
+Al borrar una lección se libera su adjunto (con deduplicación, resta una
+referencia al blob) y sus archivos quedan en la cola de borrado
+(courses.cleanup), dentro de la misma transacción. Cuando una lección
+de video recibe un archivo nuevo se pone en la cola de HLS
+(courses.transcoding); una de imagen, en la de variantes (courses.images).
+"""
+from django.contrib.auth import get_user_model
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from . import access, caching, cleanup, images, progress, search, transcoding
+from .models import Comment, Course, CourseRating, Enrollment, Lesson, LessonProgress
+
+# Campos del usuario que forman parte del índice de búsqueda
+INSTRUCTOR_SEARCH_FIELDS = {"first_name", "last_name", "username"}
+
+COUNTED_MODELS = {
+    Lesson: "lesson_count",
+    Enrollment: "enrollment_count",
+    Comment: "comment_count",
+}
+
+
+def _adjust(course_id, **deltas):
+    values = {}
+    for field, delta in deltas.items():
+        # Nunca bajar de 0 aunque el contador se haya desviado
+        values[field] = F(field) + delta if delta >= 0 else Greatest(F(field) + delta, 0)
+    Course.objects.filter(pk=course_id).update(**values)
+
+
+def _is_course_cascade(origin):
+    """True si el borrado viene en cascada desde el propio curso."""
+    return isinstance(origin, Course) or getattr(origin, "model", None) is Course
+
+
+def increment_course_counter(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        _adjust(instance.course_id, **{COUNTED_MODELS[sender]: 1})
+
+
+def decrement_course_counter(sender, instance, origin=None, **kwargs):
+    if not _is_course_cascade(origin):
+        _adjust(instance.course_id, **{COUNTED_MODELS[sender]: -1})
+
+
+# Conectar por modelo: un receptor sin sender impide el borrado rápido
+# (fast delete) de cualquier modelo en las cascadas
+for counted_model in COUNTED_MODELS:
+    post_save.connect(increment_course_counter, sender=counted_model)
+    post_delete.connect(decrement_course_counter, sender=counted_model)
+
+
+@receiver(pre_save, sender=CourseRating)
+def remember_previous_rating(sender, instance, raw=False, **kwargs):
+    instance._previous_rating = None
+    if not raw and not instance._state.adding and instance.pk:
+        instance._previous_rating = (
+            CourseRating.objects.filter(pk=instance.pk)
+            .values_list("rating", flat=True)
+            .first()
+        )
+
+
+@receiver(post_save, sender=CourseRating)
+def update_rating_counters(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        _adjust(instance.course_id, rating_sum=instance.rating, rating_count=1)
+    elif instance._previous_rating is not None and instance._previous_rating != instance.rating:
+        _adjust(instance.course_id, rating_sum=instance.rating - instance._previous_rating)
+
+
+@receiver(post_delete, sender=CourseRating)
+def remove_rating_counters(sender, instance, origin=None, **kwargs):
+    if not _is_course_cascade(origin):
+        _adjust(instance.course_id, rating_sum=-instance.rating, rating_count=-1)
+
+
+@receiver(post_save, sender=Course)
+def index_course(sender, instance, raw=False, **kwargs):
+    if not raw:
+        search.index_courses(course_ids=[instance.pk])
+
+
+@receiver(post_delete, sender=Course)
+def unindex_course(sender, instance, **kwargs):
+    search.remove_courses([instance.pk])
+
+
+@receiver(post_save, sender=get_user_model())
+def reindex_instructor_courses(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    # Los logins guardan solo last_login; no hace falta reindexar
+    if raw or created:
+        return
+    if update_fields is not None and not INSTRUCTOR_SEARCH_FIELDS.intersection(update_fields):
+        return
+    search.index_courses(instructor_id=instance.pk)
+    # El nombre del instructor aparece en las tarjetas y en el detalle
+    for course_id in Course.objects.filter(instructor_id=instance.pk).values_list("pk", flat=True):
+        caching.invalidate_course(course_id)
+
+
+@receiver(post_save, sender=get_user_model())
+def invalidate_commented_courses(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    # El fragmento de comentarios muestra el nombre de cada autor
+    if raw or created:
+        return
+    if update_fields is not None and not INSTRUCTOR_SEARCH_FIELDS.intersection(update_fields):
+        return
+    course_ids = Comment.objects.filter(user_id=instance.pk).values_list("course_id", flat=True).distinct()
+    for course_id in course_ids:
+        caching.invalidate_course(course_id, catalog=False)
+
+
+@receiver(post_save, sender=Enrollment)
+def create_progress_summary(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        progress.ensure_summary(instance.user_id, instance.course_id)
+
+
+@receiver(post_save, sender=Enrollment)
+@receiver(post_delete, sender=Enrollment)
+def invalidate_enrolled_courses(sender, instance, created=True, raw=False, **kwargs):
+    if created and not raw:
+        access.invalidate_enrollments(instance.user_id)
+
+
+@receiver(post_save, sender=LessonProgress)
+def update_progress_summary(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, "_loaded_completed", False)
+    if instance.completed != previous:
+        progress.record_completion_change(
+            instance.user_id, instance.lesson_id, 1 if instance.completed else -1, course_id=instance.course_id
+        )
+    instance._loaded_completed = instance.completed
+
+
+@receiver(post_save, sender=Lesson)
+def add_lesson_to_summaries(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        progress.lesson_added(instance.course_id)
+
+
+@receiver(pre_delete, sender=Lesson)
+def remove_lesson_from_summaries(sender, instance, origin=None, **kwargs):
+    if not _is_course_cascade(origin):
+        progress.lesson_removed(instance)
+
+
+@receiver(post_save, sender=Lesson)
+def schedule_media_processing(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    name = instance.attachment.name if instance.attachment else ""
+    changed = created or name != instance.__dict__.get("_loaded_attachment", name)
+    if instance.content_type == "video" and name:
+        if changed or not instance.hls_status:
+            transcoding.enqueue(instance)
+    elif instance.hls_status:
+        transcoding.discard(instance)
+    if instance.content_type == "image" and name:
+        if changed or not instance.image_status:
+            images.enqueue(instance)
+    elif instance.image_status:
+        images.discard(instance)
+    instance._loaded_attachment = name
+
+
+@receiver(post_delete, sender=Lesson)
+def release_attachment(sender, instance, **kwargs):
+    if not instance.attachment:
+        return
+    # En la misma transacción que el borrado; el worker borra el archivo
+    cleanup.release(instance.attachment.storage, instance.attachment.name)
+    if instance.hls_playlist:
+        transcoding.discard_output(instance)
+    if instance.image_variants:
+        images.discard_output(instance)
+
+
+def invalidate_course_cache(sender, instance, **kwargs):
+    if kwargs.get("raw"):
+        return
+    if sender is Course:
+        caching.invalidate_course(instance.pk)
+    elif sender is Enrollment and not kwargs.get("created", True):
+        # Guardar una inscripción existente no cambia nada visible
+        return
+    else:
+        # Los comentarios no aparecen en las tarjetas del catálogo
+        caching.invalidate_course(instance.course_id, catalog=sender is not Comment)
+
+
+for cached_model in (Course, Lesson, Comment, Enrollment):
+    post_save.connect(invalidate_course_cache, sender=cached_model)
+    post_delete.connect(invalidate_course_cache, sender=cached_model)
@@ -0,0 +1,221 @@
+"""
+Storage de adjuntos con deduplicación por contenido (DEDUPLICATE_ATTACHMENTS).
+
+Envuelve al storage configurado (disco o bucket). Cada archivo se guarda una
+sola vez como blob, bajo su SHA-256:
+
+    blobs/ab/ab12…ef.pdf
+
+y Lesson.attachment guarda "<blob>/<nombre original>", así que
+get_file_name() y la descarga conservan el nombre que subió el instructor.
+El storage traduce ese nombre al blob en cada operación (sin consultas).
+
+AttachmentBlob lleva cuántas lecciones apuntan a cada blob:
+- save() calcula el hash leyendo el archivo en bloques; si el blob ya existe
+  solo suma una referencia y no sube nada.
+- adopt() hace lo mismo con un archivo que ya está en el storage envuelto
+  (subida por partes o directa al bucket) y cuyo hash ya se conoce: lo
+  mueve al blob, o lo anota para borrarlo si el blob ya existía. LessonForm
+  lo llama al guardar la lección con el token de la subida; para las
+  subidas directas al bucket lo llama courses.deduplication.
+- delete() resta una referencia y borra el blob cuando llega a cero.
+  release() hace lo mismo pero deja el borrado a courses.cleanup.
+
+Las referencias se suman en la transacción en la que se guarda la lección
+(LessonForm.save): si el guardado falla, no quedan referencias de más.
+
+Los nombres que no empiezan con "blobs/" (archivos anteriores a la
+deduplicación) pasan sin cambios al storage envuelto.
+"""
+import hashlib
+import os
+import posixpath
+
+from django.core.files import File
+from django.core.files.storage import Storage
+from django.core.files.utils import validate_file_name
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils.deconstruct import deconstructible
+
+BLOB_PREFIX = "blobs/"
+CHUNK_SIZE = 1024 * 1024
+
+
+@deconstructible(path="courses.storage.DeduplicatingStorage")
+class DeduplicatingStorage(Storage):
+    def __init__(self, storage):
+        self.storage = storage
+
+    def is_blob(self, name):
+        return name.startswith(BLOB_PREFIX)
+
+    def blob_name(self, name):
+        """Nombre real en el storage envuelto."""
+        return posixpath.dirname(name) if self.is_blob(name) else name
+
+    def _blob_key(self, digest, name):
+        extension = posixpath.splitext(name)[1].lower()
+        return f"{BLOB_PREFIX}{digest[:2]}/{digest}{extension}"
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, "chunks"):
+            content = File(content, name)
+        validate_file_name(name, allow_relative_path=True)
+
+        digest = hashlib.sha256()
+        content.seek(0)
+        for chunk in content.chunks(CHUNK_SIZE):
+            digest.update(chunk)
+        key = self._blob_key(digest.hexdigest(), name)
+
+        def upload():
+            content.seek(0)
+            self.storage.save(key, content)
+
+        self._add_reference(key, digest.hexdigest(), content.size, upload)
+        return self._blob_file_name(key, name, max_length)
+
+    def adopt(self, name, digest, size, max_length=None):
+        """
+        Registra como blob el archivo `name`, ya guardado en el storage
+        envuelto, con SHA-256 `digest`. Retorna el nombre para
+        Lesson.attachment.
+        """
+        from . import cleanup
+
+        if self.is_blob(name):
+            return name
+        key = self._blob_key(digest, name)
+        moved = []
+
+        def upload():
+            self._move(name, key)
+            moved.append(name)
+
+        self._add_reference(key, digest, size, upload)
+        if not moved:
+            # El contenido ya tenía blob: la copia subida sobra
+            cleanup.enqueue([name])
+        return self._blob_file_name(key, name, max_length)
+
+    def _move(self, name, key):
+        try:
+            source, target = self.storage.path(name), self.storage.path(key)
+        except NotImplementedError:
+            # En el bucket: copia y el original va a la cola de borrado
+            from . import cleanup
+
+            with self.storage.open(name, "rb") as file:
+                self.storage.save(key, file)
+            cleanup.enqueue([name])
+            return
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.replace(source, target)
+
+    def _blob_file_name(self, key, name, max_length):
+        filename = posixpath.basename(name)
+        if max_length is not None:
+            # El nombre original se recorta (conservando la extensión) para caber en la columna
+            stem, extension = posixpath.splitext(filename)
+            stem = stem[: max(max_length - len(key) - 1 - len(extension), 1)]
+            filename = stem + extension
+        return f"{key}/{filename}"
+
+    def _add_reference(self, key, digest, size, upload):
+        from .models import AttachmentBlob, StorageDeletion
+
+        if AttachmentBlob.objects.filter(key=key).update(ref_count=F("ref_count") + 1):
+            return
+        # Primera copia de este contenido. Si su borrado estaba pendiente
+        # (courses.cleanup) se cancela; si el worker lo está borrando, esto
+        # espera a que termine y el blob se vuelve a subir.
+        StorageDeletion.objects.filter(name=key).delete()
+        # Si el objeto ya está (p. ej. una subida anterior que no llegó a
+        # registrarse) es idéntico: no se sube.
+        if not self.storage.exists(key):
+            upload()
+        try:
+            with transaction.atomic():
+                AttachmentBlob.objects.create(key=key, sha256=digest, size=size, ref_count=1)
+        except IntegrityError:
+            # Otra subida del mismo contenido lo registró primero
+            AttachmentBlob.objects.filter(key=key).update(ref_count=F("ref_count") + 1)
+
+    def release(self, name):
+        """
+        Resta una referencia. Retorna lo que hay que borrar del storage
+        envuelto: el blob si llegó a cero (o `name` si no es un blob), o None.
+        """
+        from .models import AttachmentBlob
+
+        if not self.is_blob(name):
+            return name
+        key = self.blob_name(name)
+        with transaction.atomic():
+            blob = AttachmentBlob.objects.select_for_update().filter(key=key).first()
+            if blob is None:
+                return None
+            if blob.ref_count > 1:
+                AttachmentBlob.objects.filter(pk=blob.pk).update(ref_count=F("ref_count") - 1)
+                return None
+            blob.delete()
+            return key
+
+    def delete(self, name):
+        with transaction.atomic():
+            name = self.release(name)
+            if name:
+                # Con la fila bloqueada: una subida concurrente del mismo contenido
+                # espera y, al no encontrar el blob, lo vuelve a subir
+                self.storage.delete(name)
+
+    def get_available_name(self, name, max_length=None):
+        # El nombre final lo decide el hash; no hace falta preguntar si existe
+        return name
+
+    def _open(self, name, mode="rb"):
+        return self.storage.open(self.blob_name(name), mode)
+
+    def exists(self, name):
+        return self.storage.exists(self.blob_name(name))
+
+    def size(self, name):
+        return self.storage.size(self.blob_name(name))
+
+    def url(self, name):
+        return self.storage.url(self.blob_name(name))
+
+    def path(self, name):
+        return self.storage.path(self.blob_name(name))
+
+    def get_modified_time(self, name):
+        return self.storage.get_modified_time(self.blob_name(name))
+
+    def get_created_time(self, name):
+        return self.storage.get_created_time(self.blob_name(name))
+
+    def get_accessed_time(self, name):
+        return self.storage.get_accessed_time(self.blob_name(name))
+
+    def listdir(self, path):
+        return self.storage.listdir(path)
+
+
+def stored_name(storage, name):
+    """Nombre del archivo en el storage de base (el blob si hay deduplicación)."""
+    if isinstance(storage, DeduplicatingStorage):
+        return storage.blob_name(name)
+    return name
+
+
+def base_storage(storage):
+    """
+    Storage de base, para archivos derivados (HLS, variantes) que no se
+    deduplican ni cuentan referencias.
+    """
+    if isinstance(storage, DeduplicatingStorage):
+        return storage.storage
+    return storage
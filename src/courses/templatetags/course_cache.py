@@ -0,0 +1,42 @@
+from django import template
+
+from courses import caching
+
+register = template.Library()
+
+
+class CourseFragmentNode(template.Node):
+    def __init__(self, nodelist, name, course):
+        self.nodelist = nodelist
+        self.name = name
+        self.course = course
+
+    def render(self, context):
+        if not caching.enabled():
+            return self.nodelist.render(context)
+        key = caching.fragment_key(self.name.resolve(context), self.course.resolve(context))
+        content = caching.get_entry(key, kind="fragment")
+        if content is None:
+            content = self.nodelist.render(context)
+            caching.set_entry(key, content)
+        return content
+
+
+@register.tag
+def coursefragment(parser, token):
+    """
+    Cachea un bloque que solo depende del curso (no del usuario).
+
+        {% coursefragment "comments" course %} ... {% endcoursefragment %}
+
+    La llave incluye la versión del curso, que se invalida al cambiar el
+    curso, sus lecciones, comentarios o inscripciones.
+    """
+    bits = token.split_contents()
+    if len(bits) != 3:
+        raise template.TemplateSyntaxError(
+            f"'{bits[0]}' requiere dos argumentos: nombre y curso."
+        )
+    nodelist = parser.parse(("endcoursefragment",))
+    parser.delete_first_token()
+    return CourseFragmentNode(nodelist, parser.compile_filter(bits[1]), parser.compile_filter(bits[2]))
@@ -1,9 +1,48 @@
+import base64
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+from contextlib import contextmanager
+from functools import partial
+from io import BytesIO
+from io import StringIO
+from unittest import mock, skipUnless
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.db import IntegrityError, connection
+from django.db.models.signals import post_init, post_save
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 
-from .forms import LessonForm
-from .models import Course, Enrollment, Lesson, LessonProgress
+from .forms import LessonForm, users_with_email
+from . import archive, chunked_upload, cleanup, database, deduplication, deletion, direct_upload, images, metadata, transcoding
+from .counters import rebuild_counters
+from .heartbeat import position_buffer
+from .ordering import reorder_lessons
+from .progress import rebuild_summaries
+from .storage import DeduplicatingStorage
+from .models import (
+    ArchivedProgress,
+    AttachmentBlob,
+    Comment,
+    Course,
+    CourseProgressSummary,
+    CourseRating,
+    Enrollment,
+    Lesson,
+    LessonProgress,
+    StorageDeletion,
+)
 
 
 User = get_user_model()
@@ -218,3 +257,1678 @@ class CoursePlatformTests(TestCase):
         self.assertEqual(response.status_code, 200)
         dashboard_courses = response.context["dashboard_courses"]
         self.assertEqual(dashboard_courses[0]["progress_percent"], 50.0)
+
+
+class LessonHeartbeatTests(TestCase):
+    def setUp(self):
+        self.instructor = User.objects.create_user(username="teacher", password="pass1234")
+        self.student = User.objects.create_user(username="student", password="pass1234")
+        self.course = Course.objects.create(
+            instructor=self.instructor,
+            title="Video Básico",
+            description="Curso con videos.",
+        )
+        self.lesson = Lesson.objects.create(
+            course=self.course,
+            title="Intro",
+            content_type="video",
+            video_url="https://example.com/video",
+            order=1,
+        )
+        Enrollment.objects.create(user=self.student, course=self.course)
+        self.progress = LessonProgress.objects.create(user=self.student, lesson=self.lesson)
+        self.url = reverse(
+            "courses:lesson_heartbeat", args=[self.course.identifier, self.lesson.id]
+        )
+        self.client.login(username="student", password="pass1234")
+        self.addCleanup(position_buffer.flush)
+
+    @override_settings(PROGRESS_HEARTBEAT_FLUSH_INTERVAL=0)
+    def test_heartbeat_is_buffered_and_coalesced(self):
+        for position in (5, 10, 15):
+            response = self.client.post(self.url, {"position": position})
+            self.assertEqual(response.status_code, 204)
+
+        self.progress.refresh_from_db()
+        self.assertEqual(self.progress.last_position_seconds, 0)
+        self.assertEqual(position_buffer.pending_count(), 1)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(position_buffer.flush(), 1)
+        self.progress.refresh_from_db()
+        self.assertEqual(self.progress.last_position_seconds, 15)
+
+    @override_settings(PROGRESS_HEARTBEAT_FLUSH_INTERVAL=0)
+    def test_heartbeat_rejects_invalid_position(self):
+        for position in ("abc", "-1", "inf", "nan", "1e25"):
+            response = self.client.post(self.url, {"position": position})
+            self.assertEqual(response.status_code, 400)
+        self.assertEqual(position_buffer.pending_count(), 0)
+
+    @override_settings(PROGRESS_HEARTBEAT_FLUSH_INTERVAL=0)
+    def test_legacy_position_update_ignores_invalid_positions(self):
+        url = reverse("courses:lesson_progress", args=[self.course.identifier, self.lesson.id])
+        for position in ("inf", "-5", "1e25"):
+            response = self.client.post(url, {"action": "update_position", "position": position})
+            self.assertEqual(response.status_code, 302)
+        self.assertEqual(position_buffer.pending_count(), 0)
+        self.client.post(url, {"action": "update_position", "position": "12.5"})
+        self.assertEqual(position_buffer.pending_count(), 1)
+
+    @override_settings(PROGRESS_HEARTBEAT_FLUSH_INTERVAL=0)
+    def test_flush_isolates_invalid_positions(self):
+        other = User.objects.create_user(username="other", password="pass1234")
+        Enrollment.objects.create(user=other, course=self.course)
+        position_buffer.record(self.student.id, self.lesson.id, 10**25)
+        position_buffer.record(other.id, self.lesson.id, 30)
+        self.assertEqual(position_buffer.flush(), 1)
+        self.assertEqual(position_buffer.pending_count(), 0)
+        self.assertEqual(LessonProgress.objects.get(user=other).last_position_seconds, 30)
+
+    @override_settings(PROGRESS_HEARTBEAT_FLUSH_INTERVAL=0)
+    def test_flush_creates_missing_rows_only_with_access(self):
+        self.progress.delete()
+        outsider = User.objects.create_user(username="outsider", password="pass1234")
+        position_buffer.record(self.student.id, self.lesson.id, 30)
+        position_buffer.record(outsider.id, self.lesson.id, 60)
+        self.assertEqual(position_buffer.flush(), 1)
+        progress = LessonProgress.objects.get(user=self.student, lesson=self.lesson)
+        self.assertEqual((progress.last_position_seconds, progress.course_id), (30, self.course.id))
+        self.assertFalse(LessonProgress.objects.filter(user=outsider).exists())
+
+    @override_settings(PROGRESS_HEARTBEAT_FLUSH_INTERVAL=0)
+    def test_shutdown_flushes_pending_positions(self):
+        position_buffer.record(self.student.id, self.lesson.id, 42)
+        position_buffer.shutdown()
+        self.progress.refresh_from_db()
+        self.assertEqual(self.progress.last_position_seconds, 42)
+
+
+class LessonNavigationTests(TestCase):
+    LESSONS = 40
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.instructor = User.objects.create_user(username="teacher", password="pass1234")
+        cls.student = User.objects.create_user(username="student", password="pass1234")
+        cls.course = Course.objects.create(
+            instructor=cls.instructor,
+            title="Curso largo",
+            description="Muchas lecciones.",
+        )
+        Lesson.objects.bulk_create(
+            Lesson(course=cls.course, title=f"Lección {index}", content_type="text", order=index * 10)
+            for index in range(1, cls.LESSONS + 1)
+        )
+        cls.lessons = list(cls.course.lessons.all())
+        Enrollment.objects.create(user=cls.student, course=cls.course)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.student)
+
+    def _get(self, lesson):
+        return self.client.get(reverse("courses:lesson_detail", args=[self.course.identifier, lesson.id]))
+
+    def test_neighbours(self):
+        response = self._get(self.lessons[10])
+        self.assertEqual(response.context["previous_lesson"].id, self.lessons[9].id)
+        self.assertEqual(response.context["next_lesson"].id, self.lessons[11].id)
+        self.assertIsNone(self._get(self.lessons[0]).context["previous_lesson"])
+        self.assertIsNone(self._get(self.lessons[-1]).context["next_lesson"])
+
+    def test_viewing_does_not_write_progress(self):
+        response = self._get(self.lessons[0])
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.context["progress"].completed)
+        self.assertFalse(LessonProgress.objects.exists())
+
+    def test_cost_does_not_depend_on_position(self):
+        self._get(self.lessons[1])  # Carga el caché de inscripciones
+        counts = []
+        for lesson in (self.lessons[0], self.lessons[-2]):
+            with CaptureQueriesContext(connection) as captured:
+                self._get(lesson)
+            counts.append(len(captured))
+        self.assertEqual(counts[0], counts[1])
+
+
+class CourseAccessTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.instructor = User.objects.create_user(username="teacher", password="pass1234")
+        self.student = User.objects.create_user(username="student", password="pass1234")
+        self.course = Course.objects.create(
+            instructor=self.instructor,
+            title="Acceso",
+            description="Curso para probar el acceso.",
+        )
+        self.lesson = Lesson.objects.create(
+            course=self.course, title="Intro", content_type="text", order=1
+        )
+        self.lesson_url = reverse("courses:lesson_detail", args=[self.course.identifier, self.lesson.id])
+        self.client.force_login(self.student)
+
+    def test_enroll_and_unenroll_invalidate_cached_access(self):
+        self.assertEqual(self.client.get(self.lesson_url).status_code, 403)
+        self.client.post(reverse("courses:course_enroll", args=[self.course.identifier]))
+        self.assertEqual(self.client.get(self.lesson_url).status_code, 200)
+        self.client.post(reverse("courses:course_unenroll", args=[self.course.identifier]))
+        self.assertEqual(self.client.get(self.lesson_url).status_code, 403)
+
+    def _enrollment_queried(self):
+        with CaptureQueriesContext(connection) as captured:
+            self.client.get(self.lesson_url)
+        return any("courses_enrollment" in query["sql"] for query in captured)
+
+    def test_enrollment_lookup_is_cached_in_a_shared_cache(self):
+        Enrollment.objects.create(user=self.student, course=self.course)
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        shared = {
+            "default": {
+                "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+                "LOCATION": cache_dir.name,
+            }
+        }
+        with override_settings(CACHES=shared):
+            self.client.get(self.lesson_url)
+            self.assertFalse(self._enrollment_queried())
+
+    def test_enrollment_lookup_is_not_cached_per_process(self):
+        # locmem: otro worker no vería la invalidación
+        Enrollment.objects.create(user=self.student, course=self.course)
+        self.client.get(self.lesson_url)
+        self.assertTrue(self._enrollment_queried())
+
+    def test_instructor_can_manage(self):
+        self.client.force_login(self.instructor)
+        response = self.client.get(reverse("courses:course_detail", args=[self.course.identifier]))
+        self.assertTrue(response.context["can_manage_course"])
+        self.assertFalse(response.context["is_enrolled"])
+
+
+class LessonMediaTests(TestCase):
+    CONTENT = bytes(range(256)) * 4
+
+    def setUp(self):
+        cache.clear()
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media_root.name, USE_CLOUD_STORAGE=False)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.instructor = User.objects.create_user(username="teacher", password="pass1234")
+        self.student = User.objects.create_user(username="student", password="pass1234")
+        self.course = Course.objects.create(
+            instructor=self.instructor, title="Media", description="Curso con video."
+        )
+        self.lesson = Lesson(course=self.course, title="Video", content_type="video", order=1)
+        self.lesson.attachment.save("clase.mp4", ContentFile(self.CONTENT))
+        self.url = reverse("courses:lesson_media", args=[self.course.identifier, self.lesson.id])
+        Enrollment.objects.create(user=self.student, course=self.course)
+        self.client.force_login(self.student)
+
+    def _body(self, response):
+        return b"".join(response.streaming_content)
+
+    def test_requires_enrollment(self):
+        outsider = User.objects.create_user(username="outsider", password="pass1234")
+        self.client.force_login(outsider)
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+
+    def test_full_and_single_range(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Accept-Ranges"], "bytes")
+        self.assertEqual(self._body(response), self.CONTENT)
+
+        response = self.client.get(self.url, HTTP_RANGE="bytes=10-19")
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response["Content-Range"], f"bytes 10-19/{len(self.CONTENT)}")
+        self.assertEqual(self._body(response), self.CONTENT[10:20])
+
+        response = self.client.get(self.url, HTTP_RANGE="bytes=-5")
+        self.assertEqual(self._body(response), self.CONTENT[-5:])
+
+    def test_multiple_ranges(self):
+        response = self.client.get(self.url, HTTP_RANGE="bytes=0-3,100-103")
+        self.assertEqual(response.status_code, 206)
+        self.assertTrue(response["Content-Type"].startswith("multipart/byteranges"))
+        body = self._body(response)
+        self.assertEqual(int(response["Content-Length"]), len(body))
+        self.assertIn(self.CONTENT[0:4], body)
+        self.assertIn(self.CONTENT[100:104], body)
+
+    def test_if_range_and_unsatisfiable(self):
+        etag = self.client.get(self.url)["ETag"]
+        response = self.client.get(self.url, HTTP_RANGE="bytes=0-9", HTTP_IF_RANGE=etag)
+        self.assertEqual(response.status_code, 206)
+        response = self.client.get(self.url, HTTP_RANGE="bytes=0-9", HTTP_IF_RANGE='"otro"')
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(self.url, HTTP_RANGE="bytes=5000-")
+        self.assertEqual(response.status_code, 416)
+
+    @override_settings(MEDIA_ACCEL_REDIRECT="/protected-media/")
+    def test_accel_redirect(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["X-Accel-Redirect"], f"/protected-media/{self.lesson.attachment.name}")
+        self.assertEqual(response.content, b"")
+
+    def test_versioned_url_is_immutable_and_changes_with_the_file(self):
+        first_url = self.lesson.get_media_url()
+        response = self.client.get(first_url)
+        self.assertEqual(self._body(response), self.CONTENT)
+        self.assertEqual(response["Cache-Control"], "private, max-age=31536000, immutable")
+        self.assertEqual(self.client.get(self.url)["Cache-Control"], "private, no-cache")
+
+        old_name = self.lesson.attachment.name
+        self.lesson.attachment.save("clase.mp4", ContentFile(b"otro video"))
+        # Mismo nombre subido, pero en otro directorio: nunca se reutiliza
+        self.assertNotEqual(self.lesson.attachment.name, old_name)
+        second_url = self.lesson.get_media_url()
+        self.assertNotEqual(second_url, first_url)
+        self.assertRedirects(self.client.get(first_url), second_url, fetch_redirect_response=False)
+        self.assertEqual(self._body(self.client.get(second_url)), b"otro video")
+
+
+@override_settings(
+    USE_CLOUD_STORAGE=True,
+    DIRECT_UPLOADS=True,
+    DIRECT_UPLOAD_PART_SIZE=5 * 1024 * 1024,
+    AWS_STORAGE_BUCKET_NAME="cursos",
+    AWS_ACCESS_KEY_ID="local",
+    AWS_SECRET_ACCESS_KEY="local-secret",
+    AWS_S3_REGION_NAME="us-east-1",
+    AWS_S3_ENDPOINT_URL="http://localhost:9000",
+)
+class DirectUploadTests(TestCase):
+    SIZE = 12 * 1024 * 1024
+
+    def setUp(self):
+        from botocore.stub import Stubber
+
+        direct_upload.s3_client.cache_clear()
+        self.addCleanup(direct_upload.s3_client.cache_clear)
+        self.stubber = Stubber(direct_upload.s3_client())
+        self.stubber.activate()
+        self.addCleanup(self.stubber.deactivate)
+
+        self.instructor = User.objects.create_user(username="teacher", password="pass1234")
+        self.course = Course.objects.create(
+            instructor=self.instructor, title="Subidas", description="Curso con videos."
+        )
+        self.client.force_login(self.instructor)
+
+    def _post(self, name, payload):
+        return self.client.post(
+            reverse(f"courses:{name}", args=[self.course.identifier]),
+            json.dumps(payload),
+            content_type="application/json",
+        )
+
+    def _start(self):
+        self.stubber.add_response("create_multipart_upload", {"UploadId": "upload-1"})
+        response = self._post(
+            "lesson_upload_start",
+            {"filename": "clase 1.mp4", "size": self.SIZE, "content_type": "video"},
+        )
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    MP4_HEADER = b"\x00\x00\x00\x18ftypmp42\x00\x00\x00\x00mp42isom"
+
+    def _complete(self, upload, content_length, rejected=False, header=MP4_HEADER):
+        from botocore.response import StreamingBody
+
+        self.stubber.add_response("complete_multipart_upload", {})
+        self.stubber.add_response(
+            "head_object", {"ContentLength": content_length, "ContentType": "video/mp4"}
+        )
+        self.stubber.add_response("get_object", {"Body": StreamingBody(BytesIO(header), len(header))})
+        if rejected:
+            self.stubber.add_response("delete_object", {})
+        parts = [{"part_number": part["part_number"], "etag": f'"etag-{part["part_number"]}"'} for part in upload["parts"]]
+        return self._post("lesson_upload_complete", {"token": upload["token"], "parts": parts})
+
+    def test_start_returns_presigned_part_urls(self):
+        upload = self._start()
+        self.assertEqual(len(upload["parts"]), 3)
+        self.assertIn("partNumber=1", upload["parts"][0]["url"])
+        self.assertIn("uploadId=upload-1", upload["parts"][0]["url"])
+        self.assertTrue(upload["parts"][0]["url"].startswith("http://localhost:9000/cursos/lessons/"))
+
+    def test_rejects_oversized_declaration(self):
+        response = self._post(
+            "lesson_upload_start",
+            {"filename": "clase.mp4", "size": 500 * 1024 * 1024, "content_type": "video"},
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_complete_attaches_through_form(self):
+        upload = self._start()
+        response = self._complete(upload, self.SIZE)
+        self.assertEqual(response.status_code, 200)
+        self.client.post(
+            reverse("courses:lesson_create", args=[self.course.identifier]),
+            {"title": "Video", "content_type": "video", "uploaded_attachment": response.json()["attachment"]},
+        )
+        lesson = Lesson.objects.get(course=self.course)
+        self.assertTrue(lesson.attachment.name.startswith("lessons/"))
+        self.assertTrue(lesson.attachment.name.endswith("/clase_1.mp4"))
+        self.stubber.assert_no_pending_responses()
+
+    def test_size_mismatch_deletes_object(self):
+        upload = self._start()
+        response = self._complete(upload, self.SIZE + 1, rejected=True)
+        self.assertEqual(response.status_code, 400)
+        self.stubber.assert_no_pending_responses()
+
+    def test_content_mismatch_deletes_object(self):
+        upload = self._start()
+        response = self._complete(upload, self.SIZE, rejected=True, header=b"<!DOCTYPE html><script>")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()["error"], "El contenido del archivo no corresponde a su tipo.")
+        self.stubber.assert_no_pending_responses()
+
+
+class ChunkedUploadTests(TestCase):
+    CONTENT = os.urandom(2500)
+
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        settings_override = override_settings(
+            MEDIA_ROOT=media_root.name, USE_CLOUD_STORAGE=False, CHUNKED_UPLOAD_CHUNK_SIZE=1000
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.instructor = User.objects.create_user(username="teacher", password="pass1234")
+        self.course = Course.objects.create(
+            instructor=self.instructor, title="Subidas", description="Curso con videos."
+        )
+        self.client.force_login(self.instructor)
+
+    def _create(self):
+        response = self.client.post(
+            reverse("courses:lesson_chunked_upload_create", args=[self.course.identifier]),
+            json.dumps({"filename": "clase 1.mp4", "size": len(self.CONTENT), "content_type": "video"}),
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 201)
+        return response["Location"]
+
+    def _patch(self, url, offset, data=None, checksum=None):
+        data = self.CONTENT[offset:offset + 1000] if data is None else data
+        if checksum is None:
+            checksum = "sha256 " + base64.b64encode(hashlib.sha256(data).digest()).decode()
+        return self.client.generic(
+            "PATCH", url, data, content_type="application/offset+octet-stream",
+            headers={"Upload-Offset": str(offset), "Upload-Checksum": checksum},
+        )
+
+    def test_resume_and_attach_through_form(self):
+        url = self._create()
+        self.assertEqual(self._patch(url, 0)["Upload-Offset"], "1000")
+
+        # Reintento de un chunk ya confirmado: el servidor indica desde dónde seguir
+        response = self._patch(url, 0)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response["Upload-Offset"], "1000")
+
+        response = self.client.head(url)
+        self.assertEqual(response["Upload-Offset"], "1000")
+        self.assertEqual(response["Upload-Length"], str(len(self.CONTENT)))
+
+        self.assertEqual(self._patch(url, 1000).status_code, 204)
+        response = self._patch(url, 2000)
+        self.assertEqual(response.status_code, 200)
+
+        self.client.post(
+            reverse("courses:lesson_create", args=[self.course.identifier]),
+            {"title": "Video", "content_type": "video", "uploaded_attachment": response.json()["attachment"]},
+        )
+        lesson = Lesson.objects.get(course=self.course)
+        self.assertTrue(lesson.attachment.name.endswith("/clase_1.mp4"))
+        with lesson.attachment.open("rb") as attachment:
+            self.assertEqual(attachment.read(), self.CONTENT)
+        self.assertEqual(lesson.attachment_size, len(self.CONTENT))
+        self.assertEqual(lesson.attachment_sha256, hashlib.sha256(self.CONTENT).hexdigest())
+        self.assertEqual(os.listdir(chunked_upload.staging_dir()), [])
+
+    def test_checksum_mismatch_discards_chunk(self):
+        url = self._create()
+        response = self._patch(url, 0, checksum="sha256 " + base64.b64encode(b"x" * 32).decode())
+        self.assertEqual(response.status_code, 460)
+        self.assertEqual(self.client.head(url)["Upload-Offset"], "0")
+
+    def test_other_users_cannot_patch(self):
+        url = self._create()
+        other = User.objects.create_user(username="other", password="pass1234", is_staff=True)
+        self.client.force_login(other)
+        self.assertEqual(self._patch(url, 0).status_code, 404)
+
+    def test_sweep_removes_stale_uploads(self):
+        stale = self._create().rstrip("/").rsplit("/", 1)[1].replace("-", "")
+        self._create()
+        old = time.time() - 2 * 24 * 60 * 60
+        for path in chunked_upload._paths(stale):
+            os.utime(path, (old, old))
+
+        out = StringIO()
+        call_command("sweep_upload_staging", stdout=out)
+        self.assertIn("1 subidas", out.getvalue())
+        self.assertEqual(len(os.listdir(chunked_upload.staging_dir())), 2)
+
+
+class AttachmentMetadataTests(TestCase):
+    # Encabezado PNG de 640x480 (IHDR)
+    PNG = b"\x89PNG\r\n\x1a\n" + b"\x00\x00\x00\rIHDR" + (640).to_bytes(4, "big") + (480).to_bytes(4, "big") + b"\x08\x02\x00\x00\x00" + b"\x00" * 100
+
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media_root.name, USE_CLOUD_STORAGE=False)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.instructor = User.objects.create_user(username="teacher", password="pass1234")
+        self.course = Course.objects.create(
+            instructor=self.instructor, title="Metadatos", description="Curso con imágenes."
+        )
+
+    def test_image_dimensions_from_header(self):
+        gif = b"GIF89a" + (32).to_bytes(2, "little") + (16).to_bytes(2, "little") + b"\x00" * 20
+        # SOI, APP0 de 16 bytes y SOF0 con alto 200 y ancho 300
+        jpeg = b"\xff\xd8\xff\xe0\x00\x10" + b"\x00" * 14 + b"\xff\xc0\x00\x11\x08\x00\xc8\x01\x2c" + b"\x00" * 10
+        self.assertEqual(metadata.image_dimensions(self.PNG), (640, 480))
+        self.assertEqual(metadata.image_dimensions(gif), (32, 16))
+        self.assertEqual(metadata.image_dimensions(jpeg), (300, 200))
+        self.assertIsNone(metadata.image_dimensions(b"%PDF-1.4"))
+
+    def test_form_upload_stores_metadata_and_pages_skip_storage(self):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+
+        self.client.force_login(self.instructor)
+        self.client.post(
+            reverse("courses:lesson_create", args=[self.course.identifier]),
+            {"title": "Diagrama", "content_type": "image", "attachment": SimpleUploadedFile("diagrama.png", self.PNG)},
+        )
+        lesson = Lesson.objects.get(course=self.course)
+        self.assertEqual(lesson.attachment_size, len(self.PNG))
+        self.assertEqual(lesson.attachment_mime, "image/png")
+        self.assertEqual(lesson.attachment_sha256, hashlib.sha256(self.PNG).hexdigest())
+        self.assertEqual((lesson.attachment_width, lesson.attachment_height), (640, 480))
+
+        # Sin el archivo en disco la página se arma igual: solo usa las columnas
+        lesson.attachment.storage.delete(lesson.attachment.name)
+        response = self.client.get(reverse("courses:lesson_update", args=[self.course.identifier, lesson.pk]))
+        self.assertContains(response, "(129\xa0bytes)")
+        response = self.client.get(reverse("courses:lesson_detail", args=[self.course.identifier, lesson.pk]))
+        self.assertContains(response, 'width="640" height="480"')
+
+    def test_backfill_command(self):
+        lesson = Lesson(course=self.course, title="Imagen", content_type="image", order=1)
+        lesson.attachment.save("antigua.png", ContentFile(self.PNG))
+        self.assertIsNone(lesson.attachment_size)
+
+        out = StringIO()
+        call_command("backfill_attachment_metadata", "--workers", "2", stdout=out)
+        self.assertIn("1 lecciones", out.getvalue())
+        lesson.refresh_from_db()
+        self.assertEqual(lesson.attachment_sha256, hashlib.sha256(self.PNG).hexdigest())
+        self.assertEqual(lesson.attachment_width, 640)
+
+
+class DeduplicatingStorageTests(TestCase):
+    PDF = b"%PDF-1.4 guia del curso" * 50
+
+    def setUp(self):
+        from django.core.files.storage import FileSystemStorage
+
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        self.media_root = media_root.name
+        settings_override = override_settings(MEDIA_ROOT=media_root.name, USE_CLOUD_STORAGE=False)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        # El storage del campo se fija al importar el modelo: se cambia aquí
+        field = Lesson._meta.get_field("attachment")
+        self.addCleanup(setattr, field, "storage", field.storage)
+        field.storage = DeduplicatingStorage(FileSystemStorage(location=media_root.name))
+
+        self.instructor = User.objects.create_user(username="teacher", password="pass1234")
+        self.courses = [
+            Course.objects.create(instructor=self.instructor, title=f"Curso {n}", description="Curso con guía.")
+            for n in range(2)
+        ]
+        self.client.force_login(self.instructor)
+
+    def _upload(self, course, content, filename="guía.pdf"):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+
+        self.client.post(
+            reverse("courses:lesson_create", args=[course.identifier]),
+            {"title": "Guía", "content_type": "file", "attachment": SimpleUploadedFile(filename, content)},
+        )
+        return Lesson.objects.filter(course=course).latest("id")
+
+    def _blob_files(self):
+        return [name for _, _, names in os.walk(os.path.join(self.media_root, "blobs")) for name in names]
+
+    def test_same_content_is_stored_once_and_reference_counted(self):
+        first = self._upload(self.courses[0], self.PDF)
+        second = self._upload(self.courses[1], self.PDF)
+        self.assertEqual(first.attachment.name, second.attachment.name)
+        self.assertEqual(first.get_file_name(), "guía.pdf")
+        self.assertEqual(AttachmentBlob.objects.get().ref_count, 2)
+        self.assertEqual(len(self._blob_files()), 1)
+
+        response = self.client.get(reverse("courses:lesson_media", args=[self.courses[0].identifier, first.pk]))
+        self.assertEqual(b"".join(response.streaming_content), self.PDF)
+
+        # Reemplazar el archivo de una lección solo resta una referencia
+        from django.core.files.uploadedfile import SimpleUploadedFile
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(
+                reverse("courses:lesson_update", args=[self.courses[0].identifier, first.pk]),
+                {"title": "Guía", "content_type": "file", "order": 1, "attachment": SimpleUploadedFile("v2.pdf", b"%PDF-1.4 v2")},
+            )
+        self.assertEqual(AttachmentBlob.objects.get(key=second.attachment.name.rsplit("/", 1)[0]).ref_count, 1)
+        self.assertEqual(len(self._blob_files()), 2)
+
+        # Al borrar la última lección que lo usa se borra el blob
+        self.client.post(reverse("courses:lesson_delete", args=[self.courses[1].identifier, second.pk]))
+        self.assertFalse(Lesson.objects.filter(pk=second.pk).exists())
+        self.assertEqual(AttachmentBlob.objects.count(), 1)
+        # El archivo se borra en el worker, no en el request
+        self.assertEqual(len(self._blob_files()), 2)
+        cleanup.run(once=True)
+        self.assertEqual(len(self._blob_files()), 1)
+
+    def test_reuploading_same_file_keeps_one_reference(self):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+
+        lesson = self._upload(self.courses[0], self.PDF)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(
+                reverse("courses:lesson_update", args=[self.courses[0].identifier, lesson.pk]),
+                {"title": "Guía", "content_type": "file", "order": 1, "attachment": SimpleUploadedFile("guía.pdf", self.PDF)},
+            )
+        self.assertEqual(AttachmentBlob.objects.get().ref_count, 1)
+        self.assertEqual(len(self._blob_files()), 1)
+
+
+    def test_release_and_enqueue_commit_together(self):
+        lesson = self._upload(self.courses[0], self.PDF)
+        with mock.patch.object(cleanup, "enqueue", side_effect=IntegrityError("falla")):
+            with self.assertRaises(IntegrityError):
+                cleanup.release(lesson.attachment.storage, lesson.attachment.name)
+        # Sin la deletion anotada, el blob sigue registrado
+        self.assertEqual(AttachmentBlob.objects.get().ref_count, 1)
+
+    def _chunked_upload(self, course, content, filename="guía.pdf"):
+        response = self.client.post(
+            reverse("courses:lesson_chunked_upload_create", args=[course.identifier]),
+            json.dumps({"filename": filename, "size": len(content), "content_type": "file"}),
+            content_type="application/json",
+        )
+        response = self.client.generic(
+            "PATCH", response["Location"], content, content_type="application/offset+octet-stream",
+            headers={"Upload-Offset": "0"},
+        )
+        self.client.post(
+            reverse("courses:lesson_create", args=[course.identifier]),
+            {"title": "Guía", "content_type": "file", "uploaded_attachment": response.json()["attachment"]},
+        )
+        return Lesson.objects.filter(course=course).latest("id")
+
+    def test_chunked_uploads_are_deduplicated(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            first = self._chunked_upload(self.courses[0], self.PDF)
+            second = self._chunked_upload(self.courses[1], self.PDF)
+        self.assertTrue(first.attachment.name.startswith("blobs/"))
+        self.assertEqual(first.attachment.name, second.attachment.name)
+        self.assertEqual(AttachmentBlob.objects.get().ref_count, 2)
+        with first.attachment.open("rb") as attachment:
+            self.assertEqual(attachment.read(), self.PDF)
+
+        # La segunda copia subida sobra y queda en la cola de borrado
+        cleanup.run(once=True)
+        self.assertEqual(len(self._blob_files()), 1)
+        lesson_files = [name for _, _, names in os.walk(os.path.join(self.media_root, "lessons")) for name in names]
+        self.assertEqual(lesson_files, [])
+
+    def _direct_upload(self, course, content, filename="guía.pdf"):
+        """Como courses.direct_upload: el archivo ya está en el storage y el token no trae hash."""
+        from .attachments import new_attachment_name, sign_attachment
+
+        name = new_attachment_name(filename)
+        Lesson._meta.get_field("attachment").storage.storage.save(name, ContentFile(content))
+        token = sign_attachment(course, name, "file", {"attachment_size": len(content)})
+        self.client.post(
+            reverse("courses:lesson_create", args=[course.identifier]),
+            {"title": "Guía", "content_type": "file", "uploaded_attachment": token},
+        )
+        return Lesson.objects.filter(course=course).latest("id")
+
+    def test_direct_uploads_are_deduplicated_in_the_background(self):
+        first = self._direct_upload(self.courses[0], self.PDF)
+        second = self._direct_upload(self.courses[1], self.PDF)
+        # El guardado no lee el archivo: queda en cola
+        self.assertFalse(first.attachment.name.startswith("blobs/"))
+        self.assertEqual((first.dedup_status, second.dedup_status), ("pending", "pending"))
+        self.assertFalse(AttachmentBlob.objects.exists())
+
+        for lesson_id in deduplication.queue.claim(5):
+            self.assertTrue(deduplication.queue.run_job(deduplication.deduplicate, lesson_id))
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertTrue(first.attachment.name.startswith("blobs/"))
+        self.assertEqual(first.attachment.name, second.attachment.name)
+        self.assertEqual(first.attachment_sha256, hashlib.sha256(self.PDF).hexdigest())
+        self.assertEqual(AttachmentBlob.objects.get().ref_count, 2)
+        cleanup.run(once=True)
+        self.assertEqual(len(self._blob_files()), 1)
+        with first.attachment.open("rb") as attachment:
+            self.assertEqual(attachment.read(), self.PDF)
+
+    def test_background_deduplication_skips_replaced_files(self):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+
+        lesson = self._direct_upload(self.courses[0], self.PDF)
+        [lesson_id] = deduplication.queue.claim(1)
+        self.client.post(
+            reverse("courses:lesson_update", args=[self.courses[0].identifier, lesson.pk]),
+            {"title": "Guía", "content_type": "file", "order": 1, "attachment": SimpleUploadedFile("v2.pdf", b"%PDF-1.4 v2")},
+        )
+        self.assertTrue(deduplication.queue.run_job(deduplication.deduplicate, lesson_id))
+        lesson.refresh_from_db()
+        self.assertEqual(lesson.dedup_status, "ready")
+        self.assertEqual(AttachmentBlob.objects.get().ref_count, 1)
+
+    def test_failed_save_does_not_leak_a_reference(self):
+        def fail(sender, **kwargs):
+            raise IntegrityError("guardado fallido")
+
+        post_save.connect(fail, sender=Lesson)
+        self.addCleanup(post_save.disconnect, fail, sender=Lesson)
+        with self.assertRaises(IntegrityError):
+            self._upload(self.courses[0], self.PDF)
+        self.assertFalse(AttachmentBlob.objects.exists())
+
+
+class HLSTranscodingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media_root.name, USE_CLOUD_STORAGE=False)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.instructor = User.objects.create_user(username="teacher", password="pass1234")
+        self.course = Course.objects.create(
+            instructor=self.instructor, title="Videos", description="Curso con videos."
+        )
+        self.lesson = Lesson(course=self.course, title="Clase", content_type="video", order=1)
+        self.lesson.attachment.save("clase.mp4", ContentFile(b"no es un video"))
+        self.client.force_login(self.instructor)
+
+    def test_upload_enqueues_and_saving_again_does_not(self):
+        self.lesson.refresh_from_db()
+        self.assertEqual(self.lesson.hls_status, "pending")
+        Lesson.objects.filter(pk=self.lesson.pk).update(hls_status="failed")
+        self.lesson.refresh_from_db()
+        self.lesson.title = "Clase 1"
+        self.lesson.save()
+        self.assertEqual(Lesson.objects.get(pk=self.lesson.pk).hls_status, "failed")
+
+    def test_claim_is_exclusive_until_lease_expires(self):
+        self.assertEqual(transcoding.queue.claim(5), [self.lesson.pk])
+        self.assertEqual(transcoding.queue.claim(5), [])
+        Lesson.objects.filter(pk=self.lesson.pk).update(hls_available_at=timezone.now())
+        self.assertEqual(transcoding.queue.claim(5), [self.lesson.pk])
+        self.assertEqual(Lesson.objects.get(pk=self.lesson.pk).hls_attempts, 2)
+
+    @override_settings(FFMPEG_BINARY="/nonexistent/ffmpeg", HLS_MAX_ATTEMPTS=2, HLS_RETRY_DELAY=0)
+    def test_failures_are_retried_then_marked_failed(self):
+        for expected in ("pending", "failed"):
+            [lesson_id] = transcoding.queue.claim(1)
+            self.assertFalse(transcoding.queue.run_job(transcoding.transcode, lesson_id))
+            lesson = Lesson.objects.get(pk=lesson_id)
+            self.assertEqual(lesson.hls_status, expected)
+            self.assertIn("ffmpeg", lesson.hls_error)
+        self.assertEqual(transcoding.queue.claim(1), [])
+
+    def test_player_uses_master_playlist(self):
+        storage = self.lesson.attachment.storage
+        prefix = transcoding.output_prefix(self.lesson)
+        storage.save(f"{prefix}/master.m3u8", ContentFile(b"#EXTM3U\nv0/index.m3u8\n"))
+        storage.save(f"{prefix}/v0/index.m3u8", ContentFile(b"#EXTM3U\nseg_0000.ts\n"))
+        Lesson.objects.filter(pk=self.lesson.pk).update(hls_status="ready", hls_playlist=f"{prefix}/master.m3u8")
+
+        response = self.client.get(reverse("courses:lesson_detail", args=[self.course.identifier, self.lesson.pk]))
+        version = os.path.basename(prefix)
+        master_url = reverse("courses:lesson_hls", args=[self.course.identifier, self.lesson.pk, version, "master.m3u8"])
+        self.assertContains(response, f'data-hls="{master_url}"')
+        self.assertContains(response, 'type="application/vnd.apple.mpegurl"')
+        # hls.js se sirve como static, no desde un CDN
+        self.assertContains(response, f"'{settings.STATIC_URL}vendor/hls.js/hls.min.js'")
+
+        response = self.client.get(
+            reverse("courses:lesson_hls", args=[self.course.identifier, self.lesson.pk, version, "v0/index.m3u8"])
+        )
+        self.assertEqual(response["Content-Type"], "application/vnd.apple.mpegurl")
+        self.assertEqual(b"".join(response.streaming_content), b"#EXTM3U\nseg_0000.ts\n")
+        for name in ("../../clase.mp4", "../otra/master.m3u8"):
+            response = self.client.get(
+                reverse("courses:lesson_hls", args=[self.course.identifier, self.lesson.pk, version, name])
+            )
+            self.assertEqual(response.status_code, 404)
+
+    @skipUnless(shutil.which("ffmpeg"), "ffmpeg no está instalado")
+    def test_transcodes_ladder(self):
+        source = os.path.join(tempfile.mkdtemp(dir=settings.MEDIA_ROOT), "fuente.mp4")
+        subprocess.run(
+            [
+                "ffmpeg", "-v", "error", "-f", "lavfi", "-i", "testsrc=size=854x480:rate=24",
+                "-f", "lavfi", "-i", "sine", "-t", "2", "-pix_fmt", "yuv420p", source,
+            ],
+            check=True,
+        )
+        with open(source, "rb") as file:
+            self.lesson.attachment.save("clase.mp4", ContentFile(file.read()))
+        [lesson_id] = transcoding.queue.claim(1)
+        self.assertTrue(transcoding.queue.run_job(transcoding.transcode, lesson_id))
+
+        lesson = Lesson.objects.get(pk=lesson_id)
+        self.assertEqual(lesson.hls_status, "ready")
+        with lesson.attachment.storage.open(lesson.hls_playlist) as master:
+            playlist = master.read().decode()
+        # 480p y 360p (no se escala hacia arriba)
+        self.assertEqual(playlist.count("#EXT-X-STREAM-INF"), 2)
+
+
+class ImageVariantTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media_root.name, USE_CLOUD_STORAGE=False)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.instructor = User.objects.create_user(username="teacher", password="pass1234")
+        self.course = Course.objects.create(
+            instructor=self.instructor, title="Imágenes", description="Curso con imágenes."
+        )
+        self.lesson = Lesson(course=self.course, title="Diagrama", content_type="image", order=1)
+        self.lesson.attachment.save("diagrama.png", ContentFile(self.png(800, 400)))
+        self.client.force_login(self.instructor)
+
+    def png(self, width, height):
+        from PIL import Image
+
+        output = BytesIO()
+        Image.new("RGB", (width, height), (30, 90, 200)).save(output, format="PNG")
+        return output.getvalue()
+
+    def test_generates_variants_in_process_pool(self):
+        self.assertEqual(Lesson.objects.get(pk=self.lesson.pk).image_status, "pending")
+        [lesson_id] = images.queue.claim(1)
+        with images.process_pool(1) as pool:
+            self.assertTrue(images.queue.run_job(partial(images.generate, pool=pool), lesson_id))
+
+        lesson = Lesson.objects.get(pk=lesson_id)
+        self.assertEqual(lesson.image_status, "ready")
+        # No se escala hacia arriba: el mayor ancho es el original
+        self.assertEqual(lesson.image_variants["avif"], [320, 640, 800])
+        self.assertEqual(lesson.image_variants["webp"], [320, 640, 800])
+        self.assertTrue(lesson.image_placeholder.startswith("data:image/webp;base64,"))
+        storage = lesson.attachment.storage
+        self.assertTrue(storage.exists(images.variant_name(lesson.image_variants, "avif", 320)))
+
+    def test_detail_uses_srcset_and_replacing_the_image_discards_variants(self):
+        [lesson_id] = images.queue.claim(1)
+        self.assertTrue(images.queue.run_job(images.generate, lesson_id))
+        lesson = Lesson.objects.get(pk=lesson_id)
+
+        response = self.client.get(reverse("courses:lesson_detail", args=[self.course.identifier, lesson.pk]))
+        version = os.path.basename(lesson.image_variants["prefix"])
+        variant_url = reverse(
+            "courses:lesson_image_variant", args=[self.course.identifier, lesson.pk, version, 320, "avif"]
+        )
+        self.assertContains(response, f"{variant_url} 320w")
+        self.assertContains(response, 'type="image/webp"')
+        self.assertContains(response, 'loading="lazy"')
+        self.assertContains(response, "data:image/webp;base64,")
+
+        response = self.client.get(variant_url)
+        self.assertEqual(response["Content-Type"], "image/avif")
+        response = self.client.get(
+            reverse("courses:lesson_image_variant", args=[self.course.identifier, lesson.pk, version, 1920, "avif"])
+        )
+        self.assertEqual(response.status_code, 404)
+
+        old_variant = images.variant_name(lesson.image_variants, "webp", 640)
+        lesson.attachment.save("otro.png", ContentFile(self.png(300, 300)))
+        lesson.refresh_from_db()
+        self.assertEqual((lesson.image_status, lesson.image_variants), ("pending", {}))
+        cleanup.run(once=True)
+        self.assertFalse(lesson.attachment.storage.exists(old_variant))
+
+
+class StorageCleanupTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media_root.name, USE_CLOUD_STORAGE=False)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.instructor = User.objects.create_user(username="teacher", password="pass1234")
+        self.course = Course.objects.create(
+            instructor=self.instructor, title="Archivos", description="Curso con archivos."
+        )
+        self.lesson = Lesson(course=self.course, title="Guía", content_type="file", order=1)
+        self.lesson.attachment.save("guia.pdf", ContentFile(b"%PDF-1.4"))
+        self.storage = self.lesson.attachment.storage
+        self.client.force_login(self.instructor)
+
+    def test_course_delete_queues_files_for_the_worker(self):
+        name = self.lesson.attachment.name
+        self.client.post(reverse("courses:course_delete", args=[self.course.identifier]))
+        call_command("delete_courses", "--once", stdout=StringIO())
+        self.assertFalse(Course.objects.filter(pk=self.course.pk).exists())
+        self.assertTrue(self.storage.exists(name))
+        self.assertTrue(StorageDeletion.objects.filter(name=name).exists())
+
+        call_command("process_storage_deletions", "--once", stdout=StringIO())
+        self.assertFalse(self.storage.exists(name))
+        self.assertFalse(StorageDeletion.objects.exists())
+
+    def test_gc_media_reclaims_old_orphans_only(self):
+        orphan = self.storage.save("lessons/2020/01/01/abc/huerfano.pdf", ContentFile(b"x"))
+        recent = self.storage.save("lessons/2020/01/01/def/reciente.pdf", ContentFile(b"y"))
+        old = time.time() - 3 * 24 * 60 * 60
+        for name in (orphan, self.lesson.attachment.name):
+            os.utime(self.storage.path(name), (old, old))
+
+        out = StringIO()
+        call_command("gc_media", "--dry-run", stdout=out)
+        self.assertIn(orphan, out.getvalue())
+        self.assertNotIn(self.lesson.attachment.name, out.getvalue())
+        self.assertTrue(self.storage.exists(orphan))
+
+        call_command("gc_media", stdout=StringIO())
+        self.assertFalse(self.storage.exists(orphan))
+        self.assertTrue(self.storage.exists(recent))
+        self.assertTrue(self.storage.exists(self.lesson.attachment.name))
+
+    @override_settings(
+        USE_CLOUD_STORAGE=True,
+        AWS_STORAGE_BUCKET_NAME="cursos",
+        AWS_ACCESS_KEY_ID="local",
+        AWS_SECRET_ACCESS_KEY="local-secret",
+        AWS_S3_REGION_NAME="us-east-1",
+        AWS_S3_ENDPOINT_URL="http://localhost:9000",
+    )
+    def test_bucket_deletes_in_one_call_and_retries_failures(self):
+        from botocore.stub import Stubber
+
+        direct_upload.s3_client.cache_clear()
+        self.addCleanup(direct_upload.s3_client.cache_clear)
+        stubber = Stubber(direct_upload.s3_client())
+        stubber.activate()
+        self.addCleanup(stubber.deactivate)
+        stubber.add_response(
+            "delete_objects",
+            {"Errors": [{"Key": "lessons/b.pdf", "Code": "InternalError", "Message": "reintentar"}]},
+            {
+                "Bucket": "cursos",
+                "Delete": {"Objects": [{"Key": "lessons/a.pdf"}, {"Key": "lessons/b.pdf"}], "Quiet": True},
+            },
+        )
+        StorageDeletion.objects.all().delete()
+        cleanup.enqueue(["lessons/a.pdf", "lessons/b.pdf"])
+
+        self.assertEqual(cleanup.process_batch(), (2, 1, 1))
+        stubber.assert_no_pending_responses()
+        failed = StorageDeletion.objects.get()
+        self.assertEqual((failed.name, failed.attempts), ("lessons/b.pdf", 1))
+        self.assertGreater(failed.available_at, timezone.now())
+
+
+class CourseDeletionTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.instructor = User.objects.create_user(username="teacher", password="pass1234")
+        self.student = User.objects.create_user(username="student", password="pass1234")
+        self.course = Course.objects.create(instructor=self.instructor, title="Curso a borrar")
+        Enrollment.objects.create(user=self.student, course=self.course)
+        for order in range(1, 4):
+            lesson = Lesson.objects.create(
+                course=self.course, title=f"Lección {order}", content_type="text", text_content="x", order=order
+            )
+            LessonProgress.objects.create(user=self.student, lesson=lesson, completed=True)
+        Comment.objects.create(user=self.student, course=self.course, content="Gracias")
+        self.course.refresh_from_db()
+        self.client.force_login(self.instructor)
+
+    def test_delete_hides_course_and_shows_progress(self):
+        detail_url = reverse("courses:course_detail", args=[self.course.identifier])
+        response = self.client.post(reverse("courses:course_delete", args=[self.course.identifier]))
+        self.assertRedirects(response, reverse("courses:dashboard"))
+
+        self.course.refresh_from_db()
+        self.assertTrue(self.course.is_being_deleted)
+        self.assertFalse(self.course.is_listed)
+        self.assertEqual(self.course.deletion_total, 9)
+        self.assertEqual(self.client.get(detail_url).status_code, 404)
+        self.client.force_login(self.student)
+        self.assertNotContains(self.client.get(reverse("courses:dashboard")), "Curso a borrar")
+
+        self.client.force_login(self.instructor)
+        self.assertEqual(deletion.delete_batch(self.course.pk, batch_size=2), 2)
+        self.assertContains(self.client.get(reverse("courses:dashboard")), "Eliminando… 22%")
+
+    def test_worker_deletes_in_batches_and_resumes(self):
+        deletion.request_deletion(self.course)
+        self.assertEqual(deletion.delete_batch(self.course.pk, batch_size=2), 2)
+        # Otro worker (o el mismo al reiniciar) sigue desde lo que falta
+        self.assertEqual(deletion.delete_course(self.course.pk, batch_size=2), 7)
+
+        self.assertFalse(Course.objects.filter(pk=self.course.pk).exists())
+        self.assertFalse(Lesson.objects.exists())
+        self.assertFalse(LessonProgress.objects.exists())
+        self.assertFalse(Enrollment.objects.exists())
+        self.assertFalse(Comment.objects.exists())
+
+    def test_unmarked_courses_are_not_touched(self):
+        self.assertIsNone(deletion.delete_batch(self.course.pk))
+        out = StringIO()
+        call_command("delete_courses", "--once", stdout=out)
+        self.assertIn("0 cursos eliminados", out.getvalue())
+        self.assertEqual(Lesson.objects.filter(course=self.course).count(), 3)
+
+
+@override_settings(DATABASE_REPLICA="replica", COURSE_CACHE_TIMEOUT=0)
+class ReplicaRoutingTests(TransactionTestCase):
+    # Dos bases distintas: lo que solo está en "replica" delata de dónde se leyó
+    databases = {"default", "replica"}
+
+    def setUp(self):
+        database._replica_health.update(healthy=True, checked_at=None)
+        self.addCleanup(database._replica_health.update, healthy=True, checked_at=None)
+        instructor = User.objects.create_user(username="teacher", password="pass1234")
+        self.course = Course.objects.create(instructor=instructor, title="Curso en el primario")
+        replica_instructor = User.objects.using("replica").create(username="teacher")
+        Course.objects.using("replica").create(instructor=replica_instructor, title="Curso en la réplica")
+        self.student = User.objects.create_user(username="student", password="pass1234")
+
+    def test_read_views_use_replica_until_the_user_writes(self):
+        response = self.client.get(reverse("courses:course_list"))
+        self.assertContains(response, "Curso en la réplica")
+        self.assertNotIn(database.PIN_COOKIE, response.cookies)
+
+        self.client.force_login(self.student)
+        response = self.client.post(reverse("courses:course_enroll", args=[self.course.identifier]))
+        self.assertIn(database.PIN_COOKIE, response.cookies)
+        self.assertGreaterEqual(response.cookies[database.PIN_COOKIE]["max-age"], settings.REPLICA_MAX_LAG)
+        self.assertTrue(Enrollment.objects.filter(user=self.student, course=self.course).exists())
+        self.assertFalse(Enrollment.objects.using("replica").exists())
+
+        response = self.client.get(reverse("courses:course_list"))
+        self.assertContains(response, "Curso en el primario")
+        self.assertNotContains(response, "Curso en la réplica")
+
+    @override_settings(REPLICA_PIN_SECONDS=10, REPLICA_MAX_LAG=30, REPLICA_HEALTH_INTERVAL=5)
+    def test_pin_outlasts_the_tolerated_lag(self):
+        self.assertEqual(database.pin_seconds(), 35)
+
+    def test_unhealthy_replica_falls_back_to_primary(self):
+        database.mark_replica_down()
+        response = self.client.get(reverse("courses:course_list"))
+        self.assertContains(response, "Curso en el primario")
+        self.assertNotContains(response, "Curso en la réplica")
+
+
+class CourseCounterTests(TestCase):
+    def setUp(self):
+        self.instructor = User.objects.create_user(username="teacher", password="pass1234")
+        self.student = User.objects.create_user(username="student", password="pass1234")
+        self.course = Course.objects.create(
+            instructor=self.instructor,
+            title="Contadores",
+            description="Curso para contadores.",
+        )
+
+    def test_counters_follow_creates_and_deletes(self):
+        lesson = Lesson.objects.create(
+            course=self.course, title="Uno", content_type="text", text_content="x", order=1
+        )
+        enrollment = Enrollment.objects.create(user=self.student, course=self.course)
+        Comment.objects.create(user=self.student, course=self.course, content="Muy buen curso")
+        rating = CourseRating.objects.create(user=self.student, course=self.course, rating=4)
+
+        self.course.refresh_from_db()
+        self.assertEqual(self.course.lesson_count, 1)
+        self.assertEqual(self.course.enrollment_count, 1)
+        self.assertEqual(self.course.comment_count, 1)
+        self.assertEqual(self.course.get_average_rating(), 4.0)
+
+        rating.rating = 2
+        rating.save()
+        self.course.refresh_from_db()
+        self.assertEqual(self.course.rating_sum, 2)
+
+        lesson.delete()
+        enrollment.delete()
+        rating.delete()
+        self.course.refresh_from_db()
+        self.assertEqual(self.course.lesson_count, 0)
+        self.assertEqual(self.course.enrollment_count, 0)
+        self.assertIsNone(self.course.get_average_rating())
+
+    def test_course_save_does_not_overwrite_counters(self):
+        stale = Course.objects.get(pk=self.course.pk)
+        Enrollment.objects.create(user=self.student, course=self.course)
+        stale.title = "Contadores editados"
+        stale.save()
+        self.course.refresh_from_db()
+        self.assertEqual(self.course.enrollment_count, 1)
+
+    def test_rebuild_command_fixes_drift(self):
+        Enrollment.objects.create(user=self.student, course=self.course)
+        Course.objects.filter(pk=self.course.pk).update(enrollment_count=7, lesson_count=3)
+        call_command("rebuild_course_counters", stdout=StringIO())
+        self.course.refresh_from_db()
+        self.assertEqual(self.course.enrollment_count, 1)
+        self.assertEqual(self.course.lesson_count, 0)
+
+
+class CourseSearchTests(TestCase):
+    def setUp(self):
+        self.instructor = User.objects.create_user(
+            username="teacher", password="pass1234", first_name="Ana", last_name="Pérez"
+        )
+        self.python = Course.objects.create(
+            instructor=self.instructor,
+            title="Programación en Python",
+            description="Aprende programación desde cero.",
+        )
+        self.cocina = Course.objects.create(
+            instructor=self.instructor,
+            title="Cocina mexicana",
+            description="Recetas tradicionales y un poco de python.",
+        )
+
+    def _search(self, **params):
+        response = self.client.get(reverse("courses:course_list"), params)
+        return list(response.context["courses"])
+
+    def test_search_matches_prefix_without_accents_and_ranks_title_first(self):
+        self.assertEqual(self._search(q="programacion"), [self.python])
+        self.assertEqual(self._search(q="pyth"), [self.python, self.cocina])
+
+    def test_index_follows_course_and_instructor_changes(self):
+        self.cocina.title = "Cocina italiana"
+        self.cocina.save()
+        self.assertEqual(self._search(q="italiana"), [self.cocina])
+
+        self.instructor.last_name = "Gómez"
+        self.instructor.save()
+        self.assertEqual(len(self._search(instructor="gomez")), 2)
+        self.assertEqual(self._search(instructor="perez"), [])
+
+
+    @skipUnless(connection.vendor == "postgresql", "configuración de texto de PostgreSQL")
+    def test_postgresql_search_ignores_accents(self):
+        from . import search
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT to_tsvector(%s::regconfig, 'Programación') @@ to_tsquery(%s::regconfig, 'programacion:*')",
+                [search._config(), search._config()],
+            )
+            self.assertTrue(cursor.fetchone()[0])
+        self.assertEqual(self._search(q="programacion"), [self.python])
+        self.assertEqual(len(self._search(instructor="perez")), 2)
+
+class QueryBudgetTests(TestCase):
+    """
+    Presupuesto de consultas y filas por vista con un volumen realista.
+    Si una vista vuelve a cargar relaciones completas (prefetch, N+1), falla.
+    """
+
+    COURSES = 30
+    LESSONS_PER_COURSE = 20
+    STUDENTS = 40
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.instructor = User.objects.create_user(username="teacher", password="pass1234")
+        cls.students = User.objects.bulk_create(
+            [User(username=f"student{i}", password="!") for i in range(cls.STUDENTS)]
+        )
+        courses = Course.objects.bulk_create(
+            [
+                Course(
+                    instructor=cls.instructor,
+                    title=f"Curso {i}",
+                    description="Descripción de prueba para el curso.",
+                )
+                for i in range(cls.COURSES)
+            ]
+        )
+        lessons = Lesson.objects.bulk_create(
+            [
+                Lesson(course=course, title=f"Lección {n}", content_type="text", order=n)
+                for course in courses
+                for n in range(1, cls.LESSONS_PER_COURSE + 1)
+            ]
+        )
+        Enrollment.objects.bulk_create(
+            [Enrollment(user=student, course=course) for student in cls.students for course in courses]
+        )
+        cls.student = cls.students[0]
+        LessonProgress.objects.bulk_create(
+            [
+                LessonProgress(user=cls.student, lesson=lesson, course_id=lesson.course_id, completed=True)
+                for lesson in lessons[::2]
+            ]
+        )
+        rebuild_counters(Course, Lesson, Enrollment, Comment, CourseRating)
+        rebuild_summaries(User, Course, Enrollment, LessonProgress, CourseProgressSummary)
+        cls.course = courses[0]
+
+    def setUp(self):
+        cache.clear()
+
+    @contextmanager
+    def assertQueryBudget(self, queries, max_rows):
+        """Número exacto de consultas y máximo de instancias de modelo cargadas."""
+        loaded = []
+
+        def count_instance(sender, **kwargs):
+            loaded.append(sender)
+
+        post_init.connect(count_instance)
+        try:
+            with self.assertNumQueries(queries):
+                yield
+        finally:
+            post_init.disconnect(count_instance)
+        self.assertLessEqual(
+            len(loaded), max_rows, f"Se cargaron {len(loaded)} filas (máximo {max_rows})"
+        )
+
+    def _get(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_course_list_anonymous(self):
+        # per_page + 1 filas: la extra indica si hay página siguiente
+        with self.assertQueryBudget(queries=3, max_rows=14):
+            self._get(reverse("courses:course_list"))
+
+    def test_course_list_authenticated(self):
+        self.client.force_login(self.student)
+        with self.assertQueryBudget(queries=6, max_rows=16):
+            self._get(reverse("courses:course_list"))
+
+    def test_course_detail_enrolled(self):
+        self.client.force_login(self.student)
+        with self.assertQueryBudget(queries=7, max_rows=40):
+            self._get(reverse("courses:course_detail", args=[self.course.identifier]))
+
+    def test_dashboard(self):
+        self.client.force_login(self.student)
+        with self.assertQueryBudget(queries=4, max_rows=100):
+            response = self._get(reverse("courses:dashboard"))
+        self.assertEqual(len(response.context["dashboard_courses"]), self.COURSES)
+        self.assertEqual(response.context["dashboard_courses"][0]["progress_percent"], 50.0)
+
+
+class QueryPlanTests(TestCase):
+    """Las consultas frecuentes usan los índices de 0017 y 0018 (EXPLAIN)."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = User.objects.bulk_create(
+            User(username=f"user{index}", email=f"User{index}@Example.com") for index in range(50)
+        )
+        cls.course = None
+        for index, user in enumerate(cls.users[:10]):
+            course = Course.objects.create(instructor=user, title=f"Curso {index}", is_listed=index % 3 != 0)
+            lesson = Lesson.objects.create(course=course, title="Intro", content_type="text", text_content="x", order=1)
+            cls.course = cls.course or course
+            Enrollment.objects.bulk_create(Enrollment(user=student, course=course) for student in cls.users[10:])
+            Comment.objects.bulk_create(Comment(user=student, course=course, content="Hola") for student in cls.users[10:20])
+            LessonProgress.objects.bulk_create(
+                LessonProgress(user=student, lesson=lesson, course=course, completed=position % 2 == 0)
+                for position, student in enumerate(cls.users[10:])
+            )
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+
+    def assertUsesIndex(self, queryset, index):
+        if connection.vendor == "postgresql":
+            with connection.cursor() as cursor:
+                # Con pocas filas el planificador preferiría leer la tabla entera
+                cursor.execute("SET LOCAL enable_seqscan = off")
+        plan = queryset.explain()
+        self.assertIn(index, plan, plan)
+
+    def test_catalog_uses_partial_listed_index(self):
+        self.assertUsesIndex(
+            Course.objects.filter(is_listed=True).order_by("-created_at", "-id")[:7], "course_listed_recent_idx"
+        )
+
+    def test_per_user_and_per_course_listings_use_composite_indexes(self):
+        student = self.users[20]
+        self.assertUsesIndex(student.enrollments.all(), "enrollment_user_recent_idx")
+        self.assertUsesIndex(self.course.comments.all(), "comment_course_recent_idx")
+        self.assertUsesIndex(
+            LessonProgress.objects.filter(user=student, course=self.course, completed=True),
+            "progress_user_course_idx",
+        )
+
+    def test_email_lookup_uses_functional_index(self):
+        self.assertUsesIndex(users_with_email("user7@example.COM"), "auth_user_email_lower_idx")
+        self.assertEqual(users_with_email("user7@example.COM").get(), self.users[7])
+
+
+class CatalogPaginationTests(TestCase):
+    COURSES = 14
+
+    @classmethod
+    def setUpTestData(cls):
+        instructor = User.objects.create_user(username="teacher", password="pass1234")
+        Course.objects.bulk_create(
+            Course(instructor=instructor, title=f"Curso {index}", description="Paginación.")
+            for index in range(cls.COURSES)
+        )
+        # Mismo created_at para todos: el desempate por id debe mantener el orden
+        Course.objects.update(created_at=Course.objects.first().created_at)
+
+    def setUp(self):
+        cache.clear()
+
+    def _collect(self, response):
+        return [course.pk for course in response.context["courses"]]
+
+    def test_walks_forward_and_back_with_cursors(self):
+        url = reverse("courses:course_list")
+        first = self.client.get(url)
+        page = first.context["page_obj"]
+        self.assertTrue(page.keyset)
+        self.assertFalse(page.has_previous())
+        self.assertEqual(page.paginator.count, self.COURSES)
+
+        seen = self._collect(first)
+        response = first
+        while response.context["page_obj"].has_next():
+            response = self.client.get(url, {"cursor": response.context["page_obj"].next_cursor})
+            seen.extend(self._collect(response))
+        expected = list(Course.objects.order_by("-created_at", "-id").values_list("pk", flat=True))
+        self.assertEqual(seen, expected)
+
+        back = self.client.get(url, {"cursor": response.context["page_obj"].previous_cursor})
+        self.assertEqual(self._collect(back), expected[6:12])
+
+    def test_invalid_cursor_returns_first_page(self):
+        response = self.client.get(reverse("courses:course_list"), {"cursor": "manipulado"})
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.context["page_obj"].has_previous())
+        self.assertEqual(len(response.context["courses"]), 6)
+
+    def test_totals_are_cached(self):
+        url = reverse("courses:course_list")
+        cursor = self.client.get(url).context["page_obj"].next_cursor
+        with override_settings(COURSE_CACHE_TIMEOUT=0):
+            # Solo la consulta de la página: sin COUNT(*)
+            with self.assertNumQueries(1):
+                self.client.get(url, {"cursor": cursor})
+
+    def test_instructor_filter_counts_filtered_courses(self):
+        other = User.objects.create_user(username="otra", first_name="Otra", password="pass1234")
+        Course.objects.create(instructor=other, title="Curso de otra", description="Filtro.")
+        response = self.client.get(reverse("courses:course_list"), {"instructor": "otra"})
+        self.assertEqual(response.context["page_obj"].paginator.count, 1)
+        self.assertEqual(self.client.get(reverse("courses:course_list")).context["page_obj"].paginator.count, 15)
+
+    @override_settings(CATALOG_PAGINATION="offset")
+    def test_offset_pagination_still_available(self):
+        response = self.client.get(reverse("courses:course_list"), {"page": 2})
+        self.assertEqual(response.context["page_obj"].number, 2)
+
+
+class LessonReorderTests(TestCase):
+    def setUp(self):
+        self.instructor = User.objects.create_user(username="teacher", password="pass1234")
+        self.course = Course.objects.create(
+            instructor=self.instructor,
+            title="Reordenar",
+            description="Curso para reordenar lecciones.",
+        )
+        self.url = reverse("courses:lesson_reorder", args=[self.course.identifier])
+        self.client.force_login(self.instructor)
+
+    def _lessons(self, count, course=None):
+        course = course or self.course
+        Lesson.objects.bulk_create(
+            Lesson(course=course, title=f"Lección {index}", content_type="text", order=index)
+            for index in range(1, count + 1)
+        )
+        return list(Lesson.objects.filter(course=course).values_list("id", flat=True))
+
+    def _post(self, lesson_orders):
+        return self.client.post(
+            self.url, json.dumps({"lesson_orders": lesson_orders}), content_type="application/json"
+        )
+
+    def test_reverses_lessons(self):
+        ids = self._lessons(5)
+        response = self._post([{"id": pk, "order": index} for index, pk in enumerate(reversed(ids), start=1)])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(self.course.lessons.values_list("id", flat=True)), ids[::-1])
+
+    def test_rejects_non_permutations(self):
+        ids = self._lessons(3)
+        other = Course.objects.create(instructor=self.instructor, title="Otro", description="-")
+        foreign = self._lessons(1, course=other)
+        invalid = [
+            [{"id": ids[0], "order": 1}, {"id": ids[1], "order": 1}, {"id": ids[2], "order": 2}],
+            [{"id": ids[0], "order": 1}, {"id": ids[1], "order": 2}],
+            [{"id": ids[0], "order": 1}, {"id": ids[0], "order": 2}, {"id": ids[2], "order": 3}],
+            [{"id": ids[0], "order": 1}, {"id": ids[1], "order": 2}, {"id": foreign[0], "order": 3}],
+            [{"id": ids[0], "order": 0}, {"id": ids[1], "order": 1}, {"id": ids[2], "order": 2}],
+            [{"id": ids[0]}, {"id": ids[1], "order": 2}, {"id": ids[2], "order": 3}],
+        ]
+        for lesson_orders in invalid:
+            with self.subTest(lesson_orders=lesson_orders):
+                self.assertEqual(self._post(lesson_orders).status_code, 400)
+        self.assertEqual(list(self.course.lessons.values_list("order", flat=True)), [1, 2, 3])
+
+    def test_query_count_is_constant(self):
+        # Benchmark completo: python manage.py benchmark_lesson_reorder
+        counts = []
+        for size in (5, 200):
+            course = Course.objects.create(instructor=self.instructor, title=f"Tamaño {size}", description="-")
+            ids = self._lessons(size, course=course)
+            payload = [{"id": pk, "order": index} for index, pk in enumerate(reversed(ids), start=1)]
+            with CaptureQueriesContext(connection) as captured:
+                reorder_lessons(course, payload)
+            counts.append(len(captured))
+            self.assertEqual(list(course.lessons.values_list("id", flat=True)), ids[::-1])
+        self.assertEqual(counts[0], counts[1])
+
+
+class CourseProgressSummaryTests(TestCase):
+    def setUp(self):
+        self.instructor = User.objects.create_user(username="teacher", password="pass1234")
+        self.student = User.objects.create_user(username="student", password="pass1234")
+        self.course = Course.objects.create(
+            instructor=self.instructor,
+            title="Resumen",
+            description="Curso para el resumen de progreso.",
+        )
+        self.lessons = [
+            Lesson.objects.create(
+                course=self.course, title=f"L{n}", content_type="text", text_content="x", order=n
+            )
+            for n in (1, 2, 3, 4)
+        ]
+        Enrollment.objects.create(user=self.student, course=self.course)
+        self.client.login(username="student", password="pass1234")
+
+    def _summary(self):
+        return CourseProgressSummary.objects.get(user=self.student, course=self.course)
+
+    def _post_progress(self, lesson, action):
+        self.client.post(
+            reverse("courses:lesson_progress", args=[self.course.identifier, lesson.id]),
+            {"action": action},
+        )
+
+    def test_summary_follows_complete_and_uncomplete(self):
+        self.assertEqual(self._summary().total_lessons, 4)
+        self._post_progress(self.lessons[0], "complete")
+        self._post_progress(self.lessons[1], "complete")
+        self._post_progress(self.lessons[1], "complete")
+        self.assertEqual(self._summary().completed_lessons, 2)
+        self._post_progress(self.lessons[0], "uncomplete")
+        self.assertEqual(self._summary().completed_lessons, 1)
+        self.assertEqual(self._summary().progress_percent, 25.0)
+
+    def test_summary_follows_lesson_add_and_delete(self):
+        self._post_progress(self.lessons[0], "complete")
+        Lesson.objects.create(
+            course=self.course, title="L5", content_type="text", text_content="x", order=5
+        )
+        self.assertEqual(self._summary().total_lessons, 5)
+        self.lessons[0].delete()
+        summary = self._summary()
+        self.assertEqual((summary.completed_lessons, summary.total_lessons), (0, 4))
+
+    def test_progress_rows_carry_their_course(self):
+        self._post_progress(self.lessons[0], "complete")
+        progress = LessonProgress.objects.get(user=self.student, lesson=self.lessons[0])
+        self.assertEqual(progress.course_id, self.course.id)
+
+        # El detalle del curso lee el progreso sin unir con Lesson
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse("courses:course_detail", args=[self.course.identifier]))
+        progress_queries = [query["sql"] for query in queries if "courses_lessonprogress" in query["sql"]]
+        self.assertEqual(len(progress_queries), 1)
+        self.assertNotIn("courses_lesson\"", progress_queries[0])
+
+    def test_rebuild_command_recomputes_summaries(self):
+        self._post_progress(self.lessons[0], "complete")
+        CourseProgressSummary.objects.all().delete()
+        call_command("rebuild_progress_summaries", "--batch-size=1", stdout=StringIO())
+        summary = self._summary()
+        self.assertEqual((summary.completed_lessons, summary.total_lessons), (1, 4))
+
+
+class ProgressArchiveTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.instructor = User.objects.create_user(username="teacher", password="pass1234")
+        self.student = User.objects.create_user(username="student", password="pass1234")
+        self.course = Course.objects.create(instructor=self.instructor, title="Curso olvidado")
+        self.lessons = [
+            Lesson.objects.create(course=self.course, title=f"L{n}", content_type="text", text_content="x", order=n)
+            for n in (1, 2, 3)
+        ]
+        Enrollment.objects.create(user=self.student, course=self.course)
+        for lesson in self.lessons[:2]:
+            LessonProgress.objects.create(user=self.student, lesson=lesson).mark_completed()
+        LessonProgress.objects.create(user=self.student, lesson=self.lessons[2], last_position_seconds=42)
+        long_ago = timezone.now() - timezone.timedelta(days=400)
+        Enrollment.objects.update(enrolled_at=long_ago)
+        CourseProgressSummary.objects.update(last_activity=long_ago)
+
+    def test_inactive_progress_is_archived_and_restored_on_return(self):
+        out = StringIO()
+        call_command("archive_progress", stdout=out)
+        self.assertIn("1 inscripciones archivadas (3 filas", out.getvalue())
+        self.assertFalse(LessonProgress.objects.exists())
+        self.assertTrue(Enrollment.objects.get().progress_archived)
+        self.assertEqual(ArchivedProgress.objects.get().lesson_count, 3)
+        # El panel sigue mostrando el avance sin restaurar nada
+        self.assertEqual(CourseProgressSummary.objects.get().completed_lessons, 2)
+
+        self.client.force_login(self.student)
+        response = self.client.get(reverse("courses:course_detail", args=[self.course.identifier]))
+        self.assertEqual(len([p for p in response.context["lesson_progress_map"].values() if p.completed]), 2)
+        self.assertFalse(ArchivedProgress.objects.exists())
+        self.assertFalse(Enrollment.objects.get().progress_archived)
+        restored = LessonProgress.objects.get(lesson=self.lessons[2])
+        self.assertEqual((restored.last_position_seconds, restored.course_id), (42, self.course.id))
+
+    def test_restore_skips_lessons_deleted_while_archived(self):
+        archive.run()
+        self.lessons[0].delete()
+        self.assertEqual(archive.rehydrate(self.student.id, self.course.id), 2)
+        self.assertEqual(LessonProgress.objects.filter(user=self.student).count(), 2)
+
+    def test_summaries_keep_counting_archived_progress(self):
+        archive.run()
+        call_command("rebuild_progress_summaries", stdout=StringIO())
+        self.assertEqual(CourseProgressSummary.objects.get().completed_lessons, 2)
+
+        # Borrar una lección completada mientras está archivada
+        self.lessons[0].delete()
+        summary = CourseProgressSummary.objects.get()
+        self.assertEqual((summary.completed_lessons, summary.total_lessons), (1, 2))
+        archived = ArchivedProgress.objects.get()
+        self.assertEqual((archived.lesson_count, archived.completed_count), (2, 1))
+        call_command("rebuild_progress_summaries", stdout=StringIO())
+        self.assertEqual(CourseProgressSummary.objects.get().completed_lessons, 1)
+
+    @override_settings(PROGRESS_HEARTBEAT_FLUSH_INTERVAL=0)
+    def test_heartbeat_restores_archived_progress_before_creating_rows(self):
+        archive.run()
+        self.addCleanup(position_buffer.flush)
+        position_buffer.record(self.student.id, self.lessons[0].id, 90)
+        position_buffer.record(self.student.id, self.lessons[2].id, 120)
+        self.assertEqual(position_buffer.flush(), 2)
+
+        self.assertFalse(ArchivedProgress.objects.exists())
+        self.assertFalse(Enrollment.objects.get().progress_archived)
+        self.assertEqual(LessonProgress.objects.filter(user=self.student).count(), 3)
+        self.assertEqual(LessonProgress.objects.filter(user=self.student, completed=True).count(), 2)
+        first = LessonProgress.objects.get(lesson=self.lessons[0])
+        self.assertEqual((first.completed, first.last_position_seconds), (True, 90))
+        self.assertEqual(LessonProgress.objects.get(lesson=self.lessons[2]).last_position_seconds, 120)
+
+    def test_recently_active_learners_are_not_archived(self):
+        User.objects.filter(pk=self.student.pk).update(last_login=timezone.now())
+        out = StringIO()
+        call_command("archive_progress", "--dry-run", stdout=out)
+        self.assertIn("Se archivarían 0 inscripciones", out.getvalue())
+
+
+@skipUnless(connection.vendor == "postgresql", "el particionado es solo para PostgreSQL")
+class LessonProgressPartitioningTests(TestCase):
+    def test_online_conversion_keeps_rows_and_writes(self):
+        from . import partitioning
+
+        instructor = User.objects.create_user(username="teacher", password="pass1234")
+        students = [User.objects.create_user(username=f"student{n}", password="pass1234") for n in range(4)]
+        course = Course.objects.create(instructor=instructor, title="Particionado")
+        lessons = [
+            Lesson.objects.create(course=course, title=f"L{n}", content_type="text", text_content="x", order=n)
+            for n in (1, 2)
+        ]
+        LessonProgress.objects.create(user=students[0], lesson=lessons[0])
+
+        partitioning.prepare(partitions=4)
+        # Escrituras durante la copia: las replica el trigger
+        LessonProgress.objects.create(user=students[1], lesson=lessons[0])
+        LessonProgress.objects.filter(user=students[0]).update(last_position_seconds=10)
+        self.assertEqual(partitioning.copy(batch_size=1), 1)
+        self.assertEqual(partitioning.missing_rows(), 0)
+        # Un lote de copy que reinsertó una fila borrada mientras corría
+        stale = LessonProgress.objects.create(user=students[3], lesson=lessons[1])
+        with connection.cursor() as cursor:
+            cursor.execute(f"ALTER TABLE {LessonProgress._meta.db_table} DISABLE TRIGGER USER")
+            stale.delete()
+            cursor.execute(f"ALTER TABLE {LessonProgress._meta.db_table} ENABLE TRIGGER USER")
+        partitioning.swap()
+
+        self.assertTrue(partitioning.is_partitioned())
+        self.assertEqual(LessonProgress.objects.get(user=students[0]).last_position_seconds, 10)
+        created = LessonProgress.objects.create(user=students[2], lesson=lessons[1])
+        self.assertGreater(created.pk, LessonProgress.objects.get(user=students[1]).pk)
+        self.assertEqual(LessonProgress.objects.count(), 3)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT indexdef FROM pg_indexes WHERE tablename = %s", [LessonProgress._meta.db_table]
+            )
+            indexes = [row[0] for row in cursor.fetchall()]
+        self.assertTrue(any(index.endswith("(lesson_id)") for index in indexes))
+
+
+class CourseCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.instructor = User.objects.create_user(
+            username="teacher", password="pass1234", is_staff=True
+        )
+        self.student = User.objects.create_user(username="student", password="pass1234")
+        self.course = Course.objects.create(
+            instructor=self.instructor,
+            title="Curso cacheado",
+            description="Curso para probar el caché.",
+        )
+        self.detail_url = reverse("courses:course_detail", args=[self.course.identifier])
+
+    def test_anonymous_pages_are_served_from_cache(self):
+        self.client.get(reverse("courses:course_list"))
+        self.client.get(self.detail_url)
+        with self.assertNumQueries(0):
+            self.assertContains(self.client.get(reverse("courses:course_list")), "Curso cacheado")
+            self.assertContains(self.client.get(self.detail_url), "Curso cacheado")
+
+    def test_changes_invalidate_course_pages_and_fragments(self):
+        self.client.get(self.detail_url)
+        Lesson.objects.create(
+            course=self.course, title="Lección nueva", content_type="text", text_content="x", order=1
+        )
+        Comment.objects.create(user=self.instructor, course=self.course, content="Comentario nuevo")
+        response = self.client.get(self.detail_url)
+        self.assertContains(response, "Lección nueva")
+        self.assertContains(response, "Comentario nuevo")
+
+        self.course.title = "Curso renombrado"
+        self.course.save()
+        self.assertContains(self.client.get(reverse("courses:course_list")), "Curso renombrado")
+
+    def test_commenter_rename_invalidates_comments_fragment(self):
+        Comment.objects.create(user=self.student, course=self.course, content="Muy bueno")
+        self.assertContains(self.client.get(self.detail_url), "student")
+        self.student.first_name, self.student.last_name = "Lucía", "Ramos"
+        self.student.save()
+        self.assertContains(self.client.get(self.detail_url), "Lucía Ramos")
+
+    def test_fragments_skip_per_user_parts_and_stats_are_exposed(self):
+        Enrollment.objects.create(user=self.student, course=self.course)
+        self.client.login(username="student", password="pass1234")
+        self.client.get(self.detail_url)
+        response = self.client.get(self.detail_url)
+        self.assertTrue(response.context["is_enrolled"])
+
+        self.client.login(username="teacher", password="pass1234")
+        stats = self.client.get(reverse("courses:cache_stats")).json()
+        self.assertGreaterEqual(stats["fragment"]["hits"], 1)
+        self.assertGreaterEqual(stats["fragment"]["misses"], 1)
+
+    def test_cache_stats_requires_staff(self):
+        self.client.login(username="student", password="pass1234")
+        response = self.client.get(reverse("courses:cache_stats"))
+        self.assertEqual(response.status_code, 403)
+
+    def test_db_stats_reports_connection_settings_for_staff(self):
+        self.client.login(username="student", password="pass1234")
+        self.assertEqual(self.client.get(reverse("courses:db_stats")).status_code, 403)
+
+        self.instructor.is_staff = True
+        self.instructor.save()
+        self.client.login(username="teacher", password="pass1234")
+        stats = self.client.get(reverse("courses:db_stats")).json()
+        self.assertEqual(stats["pid"], os.getpid())
+        default = stats["databases"]["default"]
+        self.assertEqual(default["vendor"], connection.vendor)
+        self.assertIn("health_checks", default)
+        if connection.vendor != "postgresql":
+            self.assertIsNone(default["pool"])
@@ -0,0 +1,206 @@
+"""
+Transcodificación de los videos subidos a HLS con varias calidades.
+
+Cuando una lección de video recibe un archivo, courses.signals la pone en la
+cola "hls" (courses.jobs) y el worker `transcode_videos` la procesa:
+
+1. ffmpeg (FFMPEG_BINARY) genera en un directorio temporal una escalera de
+   calidades (LADDER, sin superar la altura original), cada una con su
+   playlist de segmentos de SEGMENT_SECONDS, y el master.m3u8.
+2. Los archivos se guardan con el storage configurado junto al original:
+   <archivo sin extensión>.hls/<lección>/<corrida>/...
+3. Lesson.hls_playlist apunta al master y el reproductor lo usa en lugar
+   del archivo original.
+
+Si el archivo cambia mientras se transcodifica, el resultado se descarta.
+"""
+import logging
+import os
+import posixpath
+import shutil
+import subprocess
+import tempfile
+import uuid
+
+from django.conf import settings
+from django.core.files import File
+
+from . import cleanup, metadata
+from .jobs import LessonJobQueue
+from .storage import base_storage, stored_name
+
+logger = logging.getLogger("courses")
+
+queue = LessonJobQueue("hls", "HLS")
+
+MASTER_PLAYLIST = "master.m3u8"
+SEGMENT_SECONDS = 6
+
+# (alto, bitrate de video, bitrate de audio), de mayor a menor calidad
+LADDER = [
+    (1080, 5000, 192),
+    (720, 2800, 128),
+    (480, 1400, 128),
+    (360, 800, 96),
+]
+# Sin dimensiones conocidas se empieza en 720p
+DEFAULT_MAX_HEIGHT = 720
+
+
+class TranscodeError(Exception):
+    pass
+
+
+def ffmpeg_binary():
+    return getattr(settings, "FFMPEG_BINARY", "ffmpeg")
+
+
+def ladder_for(height):
+    """Calidades a generar para un video de `height` píxeles de alto."""
+    height = height or DEFAULT_MAX_HEIGHT
+    rungs = [rung for rung in LADDER if rung[0] <= height]
+    return rungs or LADDER[-1:]
+
+
+def enqueue(lesson):
+    """
+    Pone la lección en cola y deja de usar la playlist anterior (que era de
+    otro archivo); sus archivos van a la cola de borrado.
+    """
+    queue.enqueue([lesson.pk], hls_playlist="")
+    discard_output(lesson)
+    lesson.hls_status, lesson.hls_playlist = "pending", ""
+
+
+def discard(lesson):
+    """La lección ya no tiene video subido: se quita la playlist."""
+    from .models import Lesson
+
+    Lesson.objects.filter(pk=lesson.pk).update(hls_status="", hls_playlist="", hls_available_at=None)
+    discard_output(lesson)
+    lesson.hls_status, lesson.hls_playlist = "", ""
+
+
+def discard_output(lesson):
+    """Pone los archivos HLS de la lección en la cola de borrado (courses.cleanup)."""
+    if lesson.hls_playlist:
+        cleanup.enqueue([posixpath.dirname(lesson.hls_playlist)], prefix=True)
+
+
+def output_prefix(lesson):
+    """Directorio de una corrida, junto al archivo original."""
+    source = stored_name(lesson.attachment.storage, lesson.attachment.name)
+    return f"{posixpath.splitext(source)[0]}.hls/{lesson.pk}/{uuid.uuid4().hex[:12]}"
+
+
+def _has_audio(source):
+    command = [
+        getattr(settings, "FFPROBE_BINARY", "ffprobe"),
+        "-v", "error",
+        "-select_streams", "a",
+        "-show_entries", "stream=index",
+        "-of", "csv=p=0",
+        source,
+    ]
+    try:
+        result = subprocess.run(command, capture_output=True, timeout=60, check=True)
+    except (OSError, subprocess.SubprocessError):
+        # Sin ffprobe se asume que hay audio; si no, ffmpeg fallará y se reintenta
+        return True
+    return bool(result.stdout.strip())
+
+
+def ffmpeg_command(source, rungs, has_audio):
+    """Comando de ffmpeg que genera la escalera HLS en el directorio actual."""
+    split = "".join(f"[v{index}]" for index in range(len(rungs)))
+    filters = [f"[0:v]split={len(rungs)}{split}"]
+    filters += [f"[v{index}]scale=-2:{height}[v{index}out]" for index, (height, _, _) in enumerate(rungs)]
+    command = [
+        ffmpeg_binary(), "-y", "-v", "error", "-i", source,
+        "-filter_complex", ";".join(filters),
+    ]
+    stream_map = []
+    for index, (height, video_kbps, audio_kbps) in enumerate(rungs):
+        command += [
+            "-map", f"[v{index}out]",
+            f"-c:v:{index}", "libx264",
+            f"-b:v:{index}", f"{video_kbps}k",
+            f"-maxrate:v:{index}", f"{video_kbps * 107 // 100}k",
+            f"-bufsize:v:{index}", f"{video_kbps * 3 // 2}k",
+        ]
+        if has_audio:
+            command += ["-map", "0:a:0", f"-c:a:{index}", "aac", f"-b:a:{index}", f"{audio_kbps}k"]
+            stream_map.append(f"v:{index},a:{index}")
+        else:
+            stream_map.append(f"v:{index}")
+    command += [
+        "-preset", "veryfast",
+        "-pix_fmt", "yuv420p",
+        # Keyframe al inicio de cada segmento: las calidades quedan alineadas
+        "-force_key_frames", f"expr:gte(t,n_forced*{SEGMENT_SECONDS})",
+        "-sc_threshold", "0",
+        "-f", "hls",
+        "-hls_time", str(SEGMENT_SECONDS),
+        "-hls_playlist_type", "vod",
+        "-hls_flags", "independent_segments",
+        "-hls_segment_filename", "v%v/seg_%04d.ts",
+        "-master_pl_name", MASTER_PLAYLIST,
+        "-var_stream_map", " ".join(stream_map),
+        "v%v/index.m3u8",
+    ]
+    return command
+
+
+def _upload(storage, workdir, prefix):
+    for root, _, files in os.walk(workdir):
+        for filename in sorted(files):
+            path = os.path.join(root, filename)
+            relative = os.path.relpath(path, workdir).replace(os.sep, "/")
+            with open(path, "rb") as file:
+                storage.save(f"{prefix}/{relative}", File(file, name=filename))
+
+
+def transcode(lesson_id):
+    """Trabajo de la cola: genera y guarda la escalera HLS de una lección."""
+    from .models import Lesson
+
+    lesson = Lesson.objects.get(pk=lesson_id)
+    if lesson.content_type != "video" or not lesson.attachment:
+        queue.complete(lesson_id, hls_status="", hls_playlist="")
+        return
+    if shutil.which(ffmpeg_binary()) is None:
+        raise TranscodeError("ffmpeg no está instalado (FFMPEG_BINARY)")
+
+    name = lesson.attachment.name
+    storage = base_storage(lesson.attachment.storage)
+    try:
+        source = lesson.attachment.path
+    except NotImplementedError:
+        # En el bucket ffmpeg lee el original por HTTP
+        source = lesson.attachment.url
+
+    height = lesson.attachment_height or metadata.probe_video(source).get("attachment_height")
+    prefix = output_prefix(lesson)
+    with tempfile.TemporaryDirectory(prefix="hls-") as workdir:
+        try:
+            subprocess.run(
+                ffmpeg_command(source, ladder_for(height), _has_audio(source)),
+                cwd=workdir,
+                capture_output=True,
+                timeout=queue.job_timeout,
+                check=True,
+            )
+        except subprocess.CalledProcessError as e:
+            raise TranscodeError(e.stderr.decode(errors="replace")[-1000:] or "ffmpeg falló")
+        except subprocess.TimeoutExpired:
+            raise TranscodeError("ffmpeg excedió el tiempo máximo")
+        _upload(storage, workdir, prefix)
+
+    completed = queue.complete(
+        lesson_id, only_if={"attachment": name}, hls_playlist=f"{prefix}/{MASTER_PLAYLIST}"
+    )
+    if not completed:
+        # El archivo cambió (o la lección se reencoló) mientras se transcodificaba
+        cleanup.enqueue([prefix], prefix=True)
+        return
+    logger.info(f"HLS listo para la lección {lesson_id}: {prefix}")
@@ -1,21 +1,31 @@
 from django.urls import path
 
 from .views import (
+    CacheStatsView,
+    LessonChunkedUploadCreateView,
+    LessonChunkedUploadView,
     CommentCreateView,
     CourseCreateView,
     CourseDeleteView,
     CourseDetailView,
     CourseListView,
     CourseUpdateView,
+    DatabaseStatsView,
     EnrollmentCreateView,
     EnrollmentDeleteView,
     LearnerDashboardView,
     LessonCreateView,
     LessonDeleteView,
     LessonDetailView,
+    LessonHLSView,
+    LessonHeartbeatView,
+    LessonImageVariantView,
+    LessonMediaView,
     LessonProgressUpdateView,
     LessonReorderView,
     LessonUpdateView,
+    LessonUploadCompleteView,
+    LessonUploadStartView,
 )
 
 app_name = "courses"
@@ -24,6 +34,8 @@ urlpatterns = [
     path("", CourseListView.as_view(), name="course_list"),
     path("dashboard/", LearnerDashboardView.as_view(), name="dashboard"),
     path("create/", CourseCreateView.as_view(), name="course_create"),
+    path("cache-stats/", CacheStatsView.as_view(), name="cache_stats"),
+    path("db-stats/", DatabaseStatsView.as_view(), name="db_stats"),
     path(
         "<uuid:identifier>/edit/",
         CourseUpdateView.as_view(),
@@ -49,11 +61,51 @@ urlpatterns = [
         LessonCreateView.as_view(),
         name="lesson_create",
     ),
+    path(
+        "<uuid:identifier>/lessons/uploads/start/",
+        LessonUploadStartView.as_view(),
+        name="lesson_upload_start",
+    ),
+    path(
+        "<uuid:identifier>/lessons/uploads/complete/",
+        LessonUploadCompleteView.as_view(),
+        name="lesson_upload_complete",
+    ),
+    path(
+        "<uuid:identifier>/lessons/uploads/chunked/",
+        LessonChunkedUploadCreateView.as_view(),
+        name="lesson_chunked_upload_create",
+    ),
+    path(
+        "<uuid:identifier>/lessons/uploads/chunked/<uuid:upload_id>/",
+        LessonChunkedUploadView.as_view(),
+        name="lesson_chunked_upload",
+    ),
     path(
         "<uuid:identifier>/lessons/<int:pk>/",
         LessonDetailView.as_view(),
         name="lesson_detail",
     ),
+    path(
+        "<uuid:identifier>/lessons/<int:pk>/media/",
+        LessonMediaView.as_view(),
+        name="lesson_media",
+    ),
+    path(
+        "<uuid:identifier>/lessons/<int:pk>/media/<str:version>/",
+        LessonMediaView.as_view(),
+        name="lesson_media_version",
+    ),
+    path(
+        "<uuid:identifier>/lessons/<int:pk>/hls/<str:version>/<path:name>",
+        LessonHLSView.as_view(),
+        name="lesson_hls",
+    ),
+    path(
+        "<uuid:identifier>/lessons/<int:pk>/images/<str:version>/<int:width>.<slug:format>",
+        LessonImageVariantView.as_view(),
+        name="lesson_image_variant",
+    ),
     path(
         "<uuid:identifier>/lessons/<int:pk>/edit/",
         LessonUpdateView.as_view(),
@@ -69,6 +121,11 @@ urlpatterns = [
         LessonProgressUpdateView.as_view(),
         name="lesson_progress",
     ),
+    path(
+        "<uuid:identifier>/lessons/<int:pk>/heartbeat/",
+        LessonHeartbeatView.as_view(),
+        name="lesson_heartbeat",
+    ),
     path(
         "<uuid:identifier>/lessons/reorder/",
         LessonReorderView.as_view(),
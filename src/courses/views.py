@@ -1,10 +1,18 @@
+from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
-from django.db.models import Count, Q
-from django.http import Http404, HttpResponseForbidden, JsonResponse
+from django.db import OperationalError
+from django.db.models import Prefetch
+from django.http import (
+    Http404,
+    HttpResponse,
+    HttpResponseBadRequest,
+    HttpResponseForbidden,
+    JsonResponse,
+)
 from django.shortcuts import get_object_or_404, redirect
-from django.urls import reverse_lazy
+from django.urls import reverse, reverse_lazy
 from django.views import View
 from django.views.generic import (
     CreateView,
@@ -15,9 +23,18 @@ from django.views.generic import (
     UpdateView,
 )
 import json
+import posixpath
+import uuid
 
+from . import archive, caching, chunked_upload, cleanup, database, deletion, direct_upload, images, media
+from .access import CourseAccessMixin, get_course, resolve
 from .forms import CommentForm, CourseForm, LessonForm, SignupForm, UserProfileForm
-from .models import Course, Enrollment, Lesson, LessonProgress
+from .heartbeat import parse_position, position_buffer
+from .ordering import ReorderError, reorder_lessons
+from .pagination import KeysetPaginator
+from .search import search_courses
+from .storage import base_storage, stored_name
+from .models import Course, CourseProgressSummary, Enrollment, Lesson, LessonProgress
 
 
 class StaffRequiredMixin(UserPassesTestMixin):
@@ -35,7 +52,7 @@ class CourseInstructorMixin(UserPassesTestMixin):
             return self.course
         identifier = self.kwargs.get("identifier")
         if identifier:
-            self.course = get_object_or_404(Course, identifier=identifier)
+            self.course = get_course(self.request, identifier)
             return self.course
         obj = getattr(self, "object", None)
         if obj is None and hasattr(self, "get_object"):
@@ -58,47 +75,128 @@ class CourseInstructorMixin(UserPassesTestMixin):
         return course.instructor_id == user.id
 
 
-class CourseListView(ListView):
+class ReplicaReadMixin:
+    """
+    Lecturas de la vista desde la réplica (courses.database). La respuesta
+    se renderiza dentro del bloque para que las consultas perezosas de la
+    plantilla también vayan a la réplica; si la réplica falla a mitad del
+    request, se repite contra el primario.
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        replica = False
+        try:
+            with database.replica_reads(request) as replica:
+                return self._dispatch_rendered(request, *args, **kwargs)
+        except OperationalError:
+            if not replica:
+                raise
+            database.mark_replica_down()
+            return self._dispatch_rendered(request, *args, **kwargs)
+
+    def _dispatch_rendered(self, request, *args, **kwargs):
+        response = super().dispatch(request, *args, **kwargs)
+        if hasattr(response, "render") and not response.is_rendered:
+            response.render()
+        return response
+
+
+class AnonymousPageCacheMixin:
+    """
+    Cachea la página completa para visitantes anónimos. Las vistas definen
+    get_page_cache_key(); si retorna None la página no se cachea.
+    """
+
+    def get_page_cache_key(self):
+        raise NotImplementedError
+
+    def get(self, request, *args, **kwargs):
+        if (
+            not caching.enabled()
+            or request.user.is_authenticated
+            or len(messages.get_messages(request))
+        ):
+            return super().get(request, *args, **kwargs)
+        key = self.get_page_cache_key()
+        if key is None:
+            return super().get(request, *args, **kwargs)
+
+        content = caching.get_entry(key, kind="page")
+        if content is not None:
+            return HttpResponse(content)
+
+        response = super().get(request, *args, **kwargs)
+
+        def store(rendered):
+            if rendered.status_code == 200:
+                caching.set_entry(key, rendered.content)
+
+        response.add_post_render_callback(store)
+        return response
+
+
+# Columnas que necesita una tarjeta de curso (catálogo y tablero)
+CATALOG_CARD_FIELDS = (
+    "identifier",
+    "title",
+    "description",
+    "is_listed",
+    "created_at",
+    "lesson_count",
+    "enrollment_count",
+    "instructor__id",
+    "instructor__username",
+    "instructor__first_name",
+    "instructor__last_name",
+)
+
+
+class CourseListView(ReplicaReadMixin, AnonymousPageCacheMixin, ListView):
     model = Course
     template_name = "courses/course_list.html"
     context_object_name = "courses"
     paginate_by = 6
 
+    def get_page_cache_key(self):
+        return caching.page_key("catalog", caching.catalog_version(), self.request.GET.urlencode())
+
     def get_queryset(self):
         search = self.request.GET.get("q", "")
         instructor_filter = self.request.GET.get("instructor", "")
         
+        # Solo las columnas que usa la tarjeta del catálogo
         queryset = (
             Course.objects.filter(is_listed=True)
             .select_related("instructor")
-            .prefetch_related("lessons", "enrollments")
-            .annotate(
-                lesson_count=Count("lessons", distinct=True),
-                enrollment_count=Count("enrollments", distinct=True),
-            )
+            .only(*CATALOG_CARD_FIELDS)
             .order_by("-created_at")
         )
         
-        if search:
-            queryset = queryset.filter(
-                Q(title__icontains=search) | 
-                Q(description__icontains=search) |
-                Q(instructor__first_name__icontains=search) |
-                Q(instructor__last_name__icontains=search) |
-                Q(instructor__username__icontains=search)
-            )
-        
-        if instructor_filter:
-            queryset = queryset.filter(
-                Q(instructor__first_name__icontains=instructor_filter) |
-                Q(instructor__last_name__icontains=instructor_filter) |
-                Q(instructor__username__icontains=instructor_filter)
-            )
+        queryset = search_courses(queryset, search, instructor_filter)
         
         self.search = search
         self.instructor_filter = instructor_filter
         return queryset
 
+    def use_keyset_pagination(self):
+        # Las búsquedas se ordenan por relevancia, no por fecha: usan OFFSET
+        return (
+            getattr(settings, "CATALOG_PAGINATION", "keyset") == "keyset"
+            and not getattr(self, "search", "").strip()
+        )
+
+    def paginate_queryset(self, queryset, page_size):
+        if not self.use_keyset_pagination():
+            return super().paginate_queryset(queryset, page_size)
+        if getattr(self, "instructor_filter", "").strip():
+            # Con filtro el total cacheado del catálogo no aplica: COUNT del filtrado
+            count = queryset.count()
+        else:
+            count = caching.catalog_totals()["courses"]
+        paginator = KeysetPaginator(queryset, page_size, count=count)
+        page = paginator.page(self.request.GET.get("cursor"))
+        return paginator, page, page.object_list, page.has_other_pages()
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context["search"] = getattr(self, "search", "")
@@ -110,26 +208,44 @@ class CourseListView(ListView):
             )
         else:
             context["enrolled_ids"] = set()
+        context["enrolled_count"] = len(context["enrolled_ids"])
+        if caching.enabled():
+            caching.attach_versions(context["courses"])
         
-        # Estadísticas adicionales
-        context["total_courses"] = Course.objects.filter(is_listed=True).count()
-        context["total_instructors"] = Course.objects.filter(is_listed=True).values("instructor").distinct().count()
+        # Estadísticas adicionales (cacheadas unos segundos)
+        totals = caching.catalog_totals()
+        context["total_courses"] = totals["courses"]
+        context["total_instructors"] = totals["instructors"]
         
         return context
 
 
-class CourseDetailView(DetailView):
+class CourseDetailView(ReplicaReadMixin, AnonymousPageCacheMixin, DetailView):
     model = Course
     template_name = "courses/course_detail.html"
     context_object_name = "course"
     slug_field = "identifier"
     slug_url_kwarg = "identifier"
 
+    def get_page_cache_key(self):
+        identifier = self.kwargs["identifier"]
+        course_id = caching.course_id_for_identifier(identifier)
+        if course_id is None:
+            return None
+        return caching.page_key("course", identifier, caching.course_version(course_id))
+
     def get_queryset(self):
         return (
-            Course.objects.select_related("instructor")
-            .prefetch_related("lessons", "comments__user")
-            .annotate(enrollment_count=Count("enrollments", distinct=True))
+            Course.objects.filter(deletion_requested_at__isnull=True)
+            .select_related("instructor")
+            .defer("search_vector")
+            .prefetch_related(
+                # La lista de lecciones no muestra el contenido ni el archivo
+                Prefetch(
+                    "lessons",
+                    queryset=Lesson.objects.only("id", "course_id", "title", "content_type", "order"),
+                ),
+            )
         )
 
     def get_context_data(self, **kwargs):
@@ -140,22 +256,26 @@ class CourseDetailView(DetailView):
         lessons = list(course.lessons.all())
         context["lessons"] = lessons
         context["comment_form"] = CommentForm()
+        # Perezoso: solo se consulta si el fragmento de comentarios no está en caché
+        context["comments"] = course.comments.select_related("user")
 
-        is_enrolled = False
+        access = resolve(self.request, course)
+        is_enrolled = access.is_enrolled
         lesson_progress_map = {}
 
         if user.is_authenticated:
-            is_enrolled = Enrollment.objects.filter(
-                user=user, course=course
-            ).exists()
-            progress_qs = LessonProgress.objects.filter(
-                user=user, lesson__course=course
-            ).select_related("lesson")
+            archive.rehydrate_for(self.request, course)
+            # Sin order_by: el orden por defecto (lesson) volvería a unir con Lesson
+            progress_qs = (
+                LessonProgress.objects.filter(user=user, course=course)
+                .only("id", "lesson_id", "completed", "completed_at")
+                .order_by()
+            )
             lesson_progress_map = {
                 progress.lesson_id: progress for progress in progress_qs
             }
 
-        is_instructor = user.is_authenticated and course.instructor_id == user.id
+        is_instructor = access.is_instructor
         context["is_enrolled"] = is_enrolled
         lessons_with_progress = [
             {"lesson": lesson, "progress": lesson_progress_map.get(lesson.id)}
@@ -164,8 +284,10 @@ class CourseDetailView(DetailView):
         context["lessons_with_progress"] = lessons_with_progress
         context["lesson_progress_map"] = lesson_progress_map
         context["is_instructor"] = is_instructor
-        context["can_manage_course"] = user.is_authenticated and (
-            user.is_staff or is_instructor
+        context["can_manage_course"] = access.can_manage
+        # La lista de lecciones solo es igual para todos si no muestra datos del usuario
+        context["cache_lesson_list"] = not (
+            is_enrolled or context["can_manage_course"] or lesson_progress_map
         )
 
         total_lessons = len(lessons)
@@ -214,26 +336,28 @@ class CourseDeleteView(LoginRequiredMixin, CourseInstructorMixin, DeleteView):
     template_name = "courses/course_confirm_delete.html"
     slug_field = "identifier"
     slug_url_kwarg = "identifier"
-    success_url = reverse_lazy("courses:course_list")
+    success_url = reverse_lazy("courses:dashboard")
 
-    def delete(self, request, *args, **kwargs):
-        messages.success(request, "Curso eliminado.")
-        return super().delete(request, *args, **kwargs)
+    def get_queryset(self):
+        return Course.objects.filter(deletion_requested_at__isnull=True)
+
+    def form_valid(self, form):
+        # Se oculta ya y el worker `delete_courses` lo borra por lotes
+        deletion.request_deletion(self.object)
+        messages.success(self.request, "El curso se está eliminando. Puedes ver el avance en tu panel.")
+        return redirect(self.get_success_url())
 
 
-class LessonCreateView(LoginRequiredMixin, CreateView):
+class LessonCreateView(LoginRequiredMixin, CourseAccessMixin, CreateView):
     model = Lesson
     form_class = LessonForm
     template_name = "courses/lesson_form.html"
 
     def dispatch(self, request, *args, **kwargs):
-        identifier = kwargs.get("identifier")
-        self.course = get_object_or_404(Course, identifier=identifier)
-        
         # Verificar permisos: debe ser el instructor o staff
         if not request.user.is_authenticated:
             return redirect("login")
-        if self.course.instructor_id != request.user.id and not request.user.is_staff:
+        if not self.get_access().can_manage:
             return HttpResponseForbidden("Solo el instructor del curso puede agregar lecciones.")
         
         return super().dispatch(request, *args, **kwargs)
@@ -247,9 +371,16 @@ class LessonCreateView(LoginRequiredMixin, CreateView):
         messages.success(self.request, f"Lección '{form.instance.title}' creada exitosamente.")
         return super().form_valid(form)
 
+    def get_form_kwargs(self):
+        kwargs = super().get_form_kwargs()
+        kwargs["course"] = self.course
+        return kwargs
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context["course"] = self.course
+        context["direct_upload"] = direct_upload.enabled()
+        context["chunked_upload"] = chunked_upload.enabled()
         return context
 
     def get_success_url(self):
@@ -261,6 +392,18 @@ class LessonUpdateView(LoginRequiredMixin, CourseInstructorMixin, UpdateView):
     form_class = LessonForm
     template_name = "courses/lesson_form.html"
 
+    def get_form_kwargs(self):
+        kwargs = super().get_form_kwargs()
+        kwargs["course"] = self.get_course()
+        return kwargs
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["course"] = self.get_course()
+        context["direct_upload"] = direct_upload.enabled()
+        context["chunked_upload"] = chunked_upload.enabled()
+        return context
+
     def get_queryset(self):
         return Lesson.objects.filter(course__identifier=self.kwargs["identifier"])
 
@@ -295,25 +438,22 @@ class LessonUpdateView(LoginRequiredMixin, CourseInstructorMixin, UpdateView):
             new_attachment = instance.attachment
             new_attachment_name = new_attachment.name if new_attachment else None
             
-            # Solo eliminar el archivo antiguo si se subió un nuevo archivo diferente
+            # Solo eliminar el archivo antiguo si se subió un nuevo archivo
             # Esto permite que el usuario cambie el tipo de contenido sin perder el archivo
             should_delete = False
             
-            if new_attachment_name and new_attachment_name != old_attachment_name:
-                # Se subió un nuevo archivo diferente, eliminar el antiguo
+            if new_attachment_name and (
+                new_attachment_name != old_attachment_name or form.attachment_metadata is not None
+            ):
+                # Se subió un archivo nuevo. Con deduplicación puede tener el mismo
+                # nombre que el anterior (mismo contenido): igual se libera la
+                # referencia del anterior, porque el nuevo ya sumó la suya
                 should_delete = True
             
             if should_delete:
-                try:
-                    # Verificar que el archivo antiguo aún existe antes de eliminarlo
-                    if old_attachment_name and old_attachment.storage.exists(old_attachment_name):
-                        # Eliminar el archivo del storage (bucket o local)
-                        old_attachment.delete(save=False)
-                except Exception as e:
-                    # Si falla la eliminación, registrar pero no bloquear
-                    import logging
-                    logger = logging.getLogger(__name__)
-                    logger.warning(f"Error al eliminar archivo antiguo de OCI: {e}")
+                # Queda en la cola de borrado (courses.cleanup), sin llamar al
+                # bucket en el request. Con deduplicación solo resta una referencia
+                cleanup.release(old_attachment.storage, old_attachment_name)
         
         messages.success(self.request, "Lección actualizada.")
         return response
@@ -329,98 +469,96 @@ class LessonDeleteView(LoginRequiredMixin, CourseInstructorMixin, DeleteView):
     def get_queryset(self):
         return Lesson.objects.filter(course__identifier=self.kwargs["identifier"])
 
-    def delete(self, request, *args, **kwargs):
-        lesson = self.get_object()
-        
-        # Eliminar el archivo del storage antes de eliminar la lección
-        if lesson.attachment:
-            try:
-                lesson.attachment.delete(save=False)
-            except Exception as e:
-                # Si falla la eliminación, registrar pero continuar con la eliminación
-                import logging
-                logger = logging.getLogger(__name__)
-                logger.warning(f"Error al eliminar archivo de la lección: {e}")
-        
-        messages.success(request, "Lección eliminada.")
-        return super().delete(request, *args, **kwargs)
+    def form_valid(self, form):
+        # El archivo lo libera courses.signals al confirmar el borrado
+        # (con deduplicación solo resta una referencia al blob)
+        messages.success(self.request, "Lección eliminada.")
+        return super().form_valid(form)
 
     def get_success_url(self):
         return self.object.course.get_absolute_url()
 
 
-class LessonDetailView(LoginRequiredMixin, DetailView):
+class LessonDetailView(LoginRequiredMixin, CourseAccessMixin, DetailView):
     model = Lesson
     template_name = "courses/lesson_detail.html"
     context_object_name = "lesson"
+    course_queryset = Course.objects.select_related("instructor")
 
     def dispatch(self, request, *args, **kwargs):
-        self.course = get_object_or_404(
-            Course.objects.select_related("instructor"),
-            identifier=kwargs["identifier"]
-        )
-        if not self._has_access(request.user):
+        if not request.user.is_authenticated:
+            return self.handle_no_permission()
+        if not self.get_access().can_view:
             return HttpResponseForbidden("You must enroll in the course to view lessons.")
         return super().dispatch(request, *args, **kwargs)
 
-    def _has_access(self, user):
-        if not user.is_authenticated:
-            return False
-        if user.is_staff or self.course.instructor_id == user.id:
-            return True
-        return Enrollment.objects.filter(user=user, course=self.course).exists()
-
     def get_queryset(self):
         return Lesson.objects.filter(course=self.course).select_related("course", "course__instructor")
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        progress, _ = LessonProgress.objects.get_or_create(
-            user=self.request.user,
-            lesson=self.object,
-        )
+        lesson = self.object
         context["course"] = self.course
         
-        # Obtener lecciones anteriores y siguientes para navegación
-        all_lessons = list(
-            Lesson.objects.filter(course=self.course)
-            .order_by("order", "id")
-            .values_list("id", flat=True)
+        archive.rehydrate_for(self.request, self.course)
+        # Solo lectura: la fila de progreso se crea al marcar la lección o
+        # con el primer heartbeat del video (ver courses.heartbeat)
+        progress = (
+            LessonProgress.objects.filter(user=self.request.user, lesson=lesson)
+            .only("id", "completed", "completed_at", "last_position_seconds")
+            .first()
         )
+        context["progress"] = progress or LessonProgress(user=self.request.user, lesson=lesson)
         
-        context["previous_lesson"] = None
-        context["next_lesson"] = None
-        
-        try:
-            current_index = all_lessons.index(self.object.id)
-            
-            if current_index > 0:
-                previous_id = all_lessons[current_index - 1]
-                try:
-                    context["previous_lesson"] = Lesson.objects.get(id=previous_id)
-                except Lesson.DoesNotExist:
-                    pass
-            
-            if current_index < len(all_lessons) - 1:
-                next_id = all_lessons[current_index + 1]
-                try:
-                    context["next_lesson"] = Lesson.objects.get(id=next_id)
-                except Lesson.DoesNotExist:
-                    pass
-        except ValueError:
-            # La lección no está en la lista (no debería pasar, pero por seguridad)
-            pass
-        
-        context["progress"] = progress
+        # Lecciones vecinas: un LIMIT 1 por lado sobre el índice (course, order)
+        siblings = Lesson.objects.filter(course=self.course).only("id", "title")
+        context["previous_lesson"] = siblings.filter(order__lt=lesson.order).order_by("-order").first()
+        context["next_lesson"] = siblings.filter(order__gt=lesson.order).order_by("order").first()
         return context
 
 
-class EnrollmentCreateView(LoginRequiredMixin, View):
-    def post(self, request, *args, **kwargs):
-        course = get_object_or_404(
-            Course.objects.select_related("instructor"),
-            identifier=kwargs["identifier"]
+class LessonMediaView(LoginRequiredMixin, CourseAccessMixin, View):
+    """
+    Archivo adjunto de una lección, solo para quien tiene acceso al curso.
+    Con almacenamiento en disco la transferencia la hace Nginx
+    (X-Accel-Redirect) o, sin Nginx, courses.media con soporte de Range.
+    """
+
+    def get(self, request, *args, **kwargs):
+        if not self.get_access().can_view:
+            return HttpResponseForbidden("You must enroll in the course to view lessons.")
+        lesson = get_object_or_404(
+            Lesson.objects.only("id", "attachment", "attachment_sha256"), pk=kwargs["pk"], course=self.get_course()
         )
+        if not lesson.attachment:
+            raise Http404("La lección no tiene archivo.")
+        version = kwargs.get("version")
+        if version is not None and version != lesson.get_media_version():
+            # El archivo se reemplazó: la URL vieja lleva a la actual
+            return redirect(
+                "courses:lesson_media_version",
+                identifier=kwargs["identifier"],
+                pk=lesson.pk,
+                version=lesson.get_media_version(),
+            )
+        return media.set_cache_control(self.serve(request, lesson), immutable=version is not None)
+
+    def serve(self, request, lesson):
+        if getattr(settings, "USE_CLOUD_STORAGE", False):
+            return redirect(lesson.attachment.url)
+        if getattr(settings, "MEDIA_ACCEL_REDIRECT", ""):
+            return media.accel_redirect_response(
+                stored_name(lesson.attachment.storage, lesson.attachment.name)
+            )
+        try:
+            return media.serve_file(request, lesson.attachment.path, lesson.get_file_name())
+        except FileNotFoundError:
+            raise Http404("Archivo no encontrado.")
+
+
+class EnrollmentCreateView(LoginRequiredMixin, CourseAccessMixin, View):
+    def post(self, request, *args, **kwargs):
+        course = self.get_course()
         
         if course.instructor_id == request.user.id:
             messages.warning(request, "No puedes inscribirte en un curso que dictas.")
@@ -446,9 +584,9 @@ class EnrollmentCreateView(LoginRequiredMixin, View):
         return redirect(course.get_absolute_url())
 
 
-class EnrollmentDeleteView(LoginRequiredMixin, View):
+class EnrollmentDeleteView(LoginRequiredMixin, CourseAccessMixin, View):
     def post(self, request, *args, **kwargs):
-        course = get_object_or_404(Course, identifier=kwargs["identifier"])
+        course = self.get_course()
         deleted, _ = Enrollment.objects.filter(
             user=request.user, course=course
         ).delete()
@@ -459,26 +597,17 @@ class EnrollmentDeleteView(LoginRequiredMixin, View):
         return redirect("courses:course_list")
 
 
-class LessonProgressUpdateView(LoginRequiredMixin, View):
+class LessonProgressUpdateView(LoginRequiredMixin, CourseAccessMixin, View):
     def post(self, request, *args, **kwargs):
-        course = get_object_or_404(
-            Course.objects.select_related("instructor"),
-            identifier=kwargs["identifier"]
-        )
-        lesson = get_object_or_404(
-            Lesson.objects.select_related("course"),
-            pk=kwargs["pk"],
-            course=course
-        )
+        course = self.get_course()
         user = request.user
 
-        if not (
-            user.is_staff
-            or course.instructor_id == user.id
-            or Enrollment.objects.filter(user=user, course=course).exists()
-        ):
+        if not self.get_access().can_view:
             return HttpResponseForbidden("You must enroll before updating progress.")
 
+        lesson = get_object_or_404(Lesson, pk=kwargs["pk"], course=course)
+
+        archive.rehydrate_for(request, course)
         progress, created = LessonProgress.objects.get_or_create(user=user, lesson=lesson)
         action = request.POST.get("action", "toggle")
         position = request.POST.get("position", None)
@@ -498,139 +627,312 @@ class LessonProgressUpdateView(LoginRequiredMixin, View):
             progress.save(update_fields=["completed", "completed_at"])
             messages.info(request, "La lección quedó pendiente.")
         elif action == "update_position" and position:
-            # Para videos, guardar la posición de reproducción
-            try:
-                position_seconds = int(float(position))
-                progress.last_position_seconds = position_seconds
-                progress.save(update_fields=["last_position_seconds"])
-            except (ValueError, TypeError):
-                pass
+            # Compatibilidad: las posiciones ahora pasan por el buffer del heartbeat
+            position = parse_position(position)
+            if position is not None:
+                position_buffer.record(user.id, lesson.id, position)
 
         # Redirigir según el origen
         redirect_url = request.POST.get("next", course.get_absolute_url())
         return redirect(redirect_url)
 
 
-class LearnerDashboardView(LoginRequiredMixin, TemplateView):
+class LessonHeartbeatView(LoginRequiredMixin, View):
+    """
+    Heartbeat del reproductor de video: guarda la posición en memoria y
+    responde 204 sin tocar la base de datos. El buffer la escribe después.
+    """
+
+    def post(self, request, *args, **kwargs):
+        position = parse_position(request.POST.get("position"))
+        if position is None:
+            return HttpResponseBadRequest("Posición inválida.")
+        position_buffer.record(request.user.id, kwargs["pk"], position)
+        return HttpResponse(status=204)
+
+
+class LearnerDashboardView(LoginRequiredMixin, ReplicaReadMixin, TemplateView):
     template_name = "courses/dashboard.html"
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         user = self.request.user
-        enrolled_courses = (
-            Course.objects.filter(enrollments__user=user)
-            .select_related("instructor")
-            .prefetch_related("lessons")
-            .distinct()
-        )
-
-        progress_entries = LessonProgress.objects.filter(
-            user=user, lesson__course__in=enrolled_courses
-        ).select_related("lesson", "lesson__course")
-
-        progress_map = {}
-        for entry in progress_entries:
-            course_id = entry.lesson.course_id
-            progress_map.setdefault(course_id, {})[entry.lesson_id] = entry
-
-        dashboard_courses = []
-        for course in enrolled_courses:
-            lessons = list(course.lessons.all())
-            total = len(lessons)
-            completed = 0
-            lesson_progress = progress_map.get(course.id, {})
-            for lesson in lessons:
-                progress = lesson_progress.get(lesson.id)
-                if progress and progress.completed:
-                    completed += 1
-            percent = round((completed / total) * 100, 2) if total else 0
-            dashboard_courses.append(
-                {
-                    "course": course,
-                    "completed_lessons": completed,
-                    "total_lessons": total,
-                    "progress_percent": percent,
-                }
+        # Un solo SELECT sobre el resumen de progreso (índice user, course)
+        summaries = (
+            CourseProgressSummary.objects.filter(
+                user=user, course__enrollments__user=user, course__deletion_requested_at__isnull=True
             )
+            .select_related("course", "course__instructor")
+            .only(
+                "course_id",
+                "completed_lessons",
+                "total_lessons",
+                "last_activity",
+                *(f"course__{field}" for field in CATALOG_CARD_FIELDS),
+            )
+        )
+        dashboard_courses = [
+            {
+                "course": summary.course,
+                "completed_lessons": min(summary.completed_lessons, summary.total_lessons),
+                "total_lessons": summary.total_lessons,
+                "progress_percent": summary.progress_percent,
+            }
+            for summary in summaries
+        ]
 
         context["dashboard_courses"] = dashboard_courses
-        context["teaching_courses"] = Course.objects.filter(instructor=user)
+        context["teaching_courses"] = Course.objects.filter(instructor=user).only(
+            "identifier",
+            "title",
+            "lesson_count",
+            "enrollment_count",
+            "created_at",
+            "deletion_requested_at",
+            "deletion_total",
+            "deletion_done",
+        )
         context["total_completed_lessons"] = sum(item["completed_lessons"] for item in dashboard_courses)
         context["total_lessons_available"] = sum(item["total_lessons"] for item in dashboard_courses)
         return context
 
 
-class LessonReorderView(LoginRequiredMixin, View):
+class LessonReorderView(LoginRequiredMixin, CourseAccessMixin, View):
     """Vista AJAX para reordenar lecciones con drag-and-drop"""
     
     def post(self, request, *args, **kwargs):
-        course = get_object_or_404(Course, identifier=kwargs["identifier"])
+        course = self.get_course()
         
         # Verificar permisos
-        if not (request.user.is_staff or course.instructor_id == request.user.id):
+        if not self.get_access().can_manage:
             return JsonResponse({"error": "No tienes permisos para reordenar lecciones"}, status=403)
         
         try:
-            from django.db import transaction
-            
             data = json.loads(request.body)
-            lesson_orders = data.get("lesson_orders", [])  # Lista de [lesson_id, new_order]
+            lesson_orders = data.get("lesson_orders", [])  # Lista de {id, order}
             
             if not lesson_orders:
                 return JsonResponse({"error": "No se proporcionaron lecciones para reordenar"}, status=400)
             
-            # Validar que todas las lecciones pertenecen al curso
-            lesson_ids = [item.get("id") for item in lesson_orders if item.get("id")]
-            lessons = Lesson.objects.filter(id__in=lesson_ids, course=course)
-            
-            if lessons.count() != len(lesson_ids):
-                return JsonResponse({"error": "Algunas lecciones no pertenecen a este curso"}, status=400)
-            
-            # Usar transacción para evitar conflictos de orden único
-            with transaction.atomic():
-                # Paso 1: Mover todas las lecciones a valores temporales altos para evitar conflictos
-                # Usamos valores muy altos (10000+) que no deberían estar en uso normalmente
-                temp_offset = 10000
-                for lesson in lessons:
-                    lesson.order = temp_offset + lesson.id
-                    lesson.save(update_fields=["order"])
-                
-                # Refrescar los objetos desde la base de datos para asegurar que tenemos los valores actualizados
-                lessons = Lesson.objects.filter(id__in=lesson_ids, course=course)
-                lesson_dict = {lesson.id: lesson for lesson in lessons}
-                
-                # Paso 2: Actualizar a los valores finales
-                for item in lesson_orders:
-                    lesson_id = item.get("id")
-                    new_order = item.get("order")
-                    
-                    if lesson_id and new_order is not None and new_order > 0:
-                        lesson = lesson_dict.get(lesson_id)
-                        if lesson:
-                            lesson.order = new_order
-                            lesson.save(update_fields=["order"])
+            # Valida que sea una permutación de todas las lecciones del curso
+            # y aplica el orden en un número fijo de sentencias
+            reorder_lessons(course, lesson_orders)
             
             return JsonResponse({"success": True, "message": "Lecciones reordenadas exitosamente"})
             
+        except ReorderError as e:
+            return JsonResponse({"error": str(e)}, status=400)
         except json.JSONDecodeError:
             return JsonResponse({"error": "Datos inválidos"}, status=400)
         except Exception as e:
             return JsonResponse({"error": str(e)}, status=500)
 
 
-class CommentCreateView(LoginRequiredMixin, CreateView):
+class LessonHLSView(LoginRequiredMixin, CourseAccessMixin, View):
+    """
+    Playlists y segmentos HLS de una lección (courses.transcoding), con el
+    mismo control de acceso que el archivo original. Las rutas del master
+    son relativas, así que el navegador pide todo a través de esta vista (o
+    directo al bucket, tras la primera redirección).
+    """
+
+    def get(self, request, *args, **kwargs):
+        if not self.get_access().can_view:
+            return HttpResponseForbidden("You must enroll in the course to view lessons.")
+        lesson = get_object_or_404(
+            Lesson.objects.only("id", "attachment", "hls_status", "hls_playlist"),
+            pk=kwargs["pk"],
+            course=self.get_course(),
+        )
+        if not lesson.get_hls_url():
+            raise Http404("El video aún no está listo.")
+        if kwargs["version"] != lesson.get_hls_version():
+            raise Http404("Archivo no encontrado.")
+        directory = posixpath.dirname(lesson.hls_playlist)
+        name = posixpath.normpath(posixpath.join(directory, kwargs["name"]))
+        if not name.startswith(directory + "/"):
+            raise Http404("Archivo no encontrado.")
+
+        return serve_derived_file(request, lesson, name)
+
+
+def serve_derived_file(request, lesson, name):
+    """
+    Entrega un archivo derivado del adjunto (HLS, variantes) ya autorizado.
+    Cada corrida escribe en un directorio nuevo: la respuesta es inmutable.
+    """
+    storage = base_storage(lesson.attachment.storage)
+    if getattr(settings, "USE_CLOUD_STORAGE", False):
+        response = redirect(storage.url(name))
+    elif getattr(settings, "MEDIA_ACCEL_REDIRECT", ""):
+        response = media.accel_redirect_response(name)
+    else:
+        try:
+            response = media.serve_file(request, storage.path(name))
+        except FileNotFoundError:
+            raise Http404("Archivo no encontrado.")
+    return media.set_cache_control(response, immutable=True)
+
+
+class LessonImageVariantView(LoginRequiredMixin, CourseAccessMixin, View):
+    """
+    Variantes AVIF/WebP de una imagen (courses.images), con el mismo
+    control de acceso que el archivo original.
+    """
+
+    def get(self, request, *args, **kwargs):
+        if not self.get_access().can_view:
+            return HttpResponseForbidden("You must enroll in the course to view lessons.")
+        lesson = get_object_or_404(
+            Lesson.objects.only("id", "attachment", "image_status", "image_variants"),
+            pk=kwargs["pk"],
+            course=self.get_course(),
+        )
+        format, width = kwargs["format"], kwargs["width"]
+        if (
+            lesson.image_status != "ready"
+            or kwargs["version"] != posixpath.basename(lesson.image_variants.get("prefix", ""))
+            or width not in lesson.image_variants.get(format, [])
+        ):
+            raise Http404("Archivo no encontrado.")
+        return serve_derived_file(request, lesson, images.variant_name(lesson.image_variants, format, width))
+
+
+class LessonUploadStartView(LoginRequiredMixin, CourseAccessMixin, View):
+    """
+    Inicia una subida directa al bucket: responde las URLs prefirmadas de
+    cada parte. Body JSON: {filename, size, content_type}.
+    """
+
+    def post(self, request, *args, **kwargs):
+        if not direct_upload.enabled():
+            raise Http404("La subida directa no está habilitada.")
+        if not self.get_access().can_manage:
+            return JsonResponse({"error": "No tienes permisos para subir archivos"}, status=403)
+        try:
+            data = json.loads(request.body)
+            upload = direct_upload.start_upload(
+                self.get_course(), data.get("content_type"), data.get("filename"), data.get("size")
+            )
+        except json.JSONDecodeError:
+            return JsonResponse({"error": "Datos inválidos"}, status=400)
+        except direct_upload.UploadError as e:
+            return JsonResponse({"error": str(e)}, status=400)
+        return JsonResponse(upload)
+
+
+class LessonUploadCompleteView(LoginRequiredMixin, CourseAccessMixin, View):
+    """
+    Completa la subida directa y valida el objeto. Body JSON:
+    {token, parts: [{part_number, etag}]}. Responde el token del adjunto
+    que se envía con el formulario de la lección.
+    """
+
+    def post(self, request, *args, **kwargs):
+        if not direct_upload.enabled():
+            raise Http404("La subida directa no está habilitada.")
+        if not self.get_access().can_manage:
+            return JsonResponse({"error": "No tienes permisos para subir archivos"}, status=403)
+        try:
+            data = json.loads(request.body)
+            attachment = direct_upload.complete_upload(
+                self.get_course(), data.get("token", ""), data.get("parts", [])
+            )
+        except json.JSONDecodeError:
+            return JsonResponse({"error": "Datos inválidos"}, status=400)
+        except direct_upload.UploadError as e:
+            return JsonResponse({"error": str(e)}, status=400)
+        return JsonResponse({"attachment": attachment})
+
+
+class LessonChunkedUploadCreateView(LoginRequiredMixin, CourseAccessMixin, View):
+    """
+    Registra una subida por partes (almacenamiento local).
+    Body JSON: {filename, size, content_type}.
+    """
+
+    def post(self, request, *args, **kwargs):
+        if not chunked_upload.enabled():
+            raise Http404("La subida por partes no está habilitada.")
+        if not self.get_access().can_manage:
+            return JsonResponse({"error": "No tienes permisos para subir archivos"}, status=403)
+        course = self.get_course()
+        try:
+            data = json.loads(request.body)
+            upload_id = chunked_upload.create_upload(
+                course, request.user, data.get("content_type"), data.get("filename"), data.get("size")
+            )
+        except json.JSONDecodeError:
+            return JsonResponse({"error": "Datos inválidos"}, status=400)
+        except chunked_upload.ChunkError as e:
+            return JsonResponse({"error": str(e)}, status=e.status)
+        url = reverse("courses:lesson_chunked_upload", args=[course.identifier, uuid.UUID(upload_id)])
+        response = JsonResponse(
+            {"url": url, "chunk_size": chunked_upload.chunk_size(), "offset": 0}, status=201
+        )
+        response["Location"] = url
+        return response
+
+
+class LessonChunkedUploadView(LoginRequiredMixin, CourseAccessMixin, View):
+    """
+    HEAD: offset confirmado (para reanudar). PATCH: agrega un chunk en el
+    offset del header Upload-Offset; con el último responde el token del adjunto.
+    """
+
+    http_method_names = ["head", "patch", "options"]
+
+    def dispatch(self, request, *args, **kwargs):
+        if not chunked_upload.enabled():
+            raise Http404("La subida por partes no está habilitada.")
+        if request.user.is_authenticated:
+            self.upload = chunked_upload.get_upload(kwargs["upload_id"].hex, self.get_course(), request.user)
+            if self.upload is None:
+                raise Http404("Subida no encontrada.")
+        return super().dispatch(request, *args, **kwargs)
+
+    def _offset_response(self, offset, status=204):
+        response = HttpResponse(status=status)
+        response["Upload-Offset"] = str(offset)
+        response["Upload-Length"] = str(self.upload["size"])
+        response["Cache-Control"] = "no-store"
+        return response
+
+    def head(self, request, *args, **kwargs):
+        return self._offset_response(self.upload["offset"], status=200)
+
+    def patch(self, request, *args, **kwargs):
+        upload_id = kwargs["upload_id"].hex
+        try:
+            offset = int(request.headers.get("Upload-Offset", ""))
+            length = int(request.META.get("CONTENT_LENGTH") or 0)
+        except ValueError:
+            return JsonResponse({"error": "Falta el header Upload-Offset"}, status=400)
+        try:
+            offset = chunked_upload.append_chunk(
+                upload_id, self.upload, offset, length, request, request.headers.get("Upload-Checksum")
+            )
+        except chunked_upload.ChunkError as e:
+            response = JsonResponse({"error": str(e)}, status=e.status)
+            if e.offset is not None:
+                response["Upload-Offset"] = str(e.offset)
+            return response
+
+        if offset < self.upload["size"]:
+            return self._offset_response(offset)
+        attachment = chunked_upload.finish_upload(upload_id, self.upload, self.get_course())
+        response = JsonResponse({"attachment": attachment})
+        response["Upload-Offset"] = str(offset)
+        return response
+
+
+class CommentCreateView(LoginRequiredMixin, CourseAccessMixin, CreateView):
     form_class = CommentForm
 
     def dispatch(self, request, *args, **kwargs):
-        self.course = get_object_or_404(Course, identifier=kwargs["identifier"])
-        is_enrolled = Enrollment.objects.filter(
-            user=request.user, course=self.course
-        ).exists()
-        if not (
-            is_enrolled
-            or request.user.is_staff
-            or self.course.instructor_id == request.user.id
-        ):
+        if not request.user.is_authenticated:
+            return self.handle_no_permission()
+        if not self.get_access().can_view:
             return HttpResponseForbidden("You must be enrolled to comment.")
         return super().dispatch(request, *args, **kwargs)
 
@@ -644,6 +946,20 @@ class CommentCreateView(LoginRequiredMixin, CreateView):
         return self.course.get_absolute_url()
 
 
+class CacheStatsView(LoginRequiredMixin, StaffRequiredMixin, View):
+    """Aciertos y fallos del caché de páginas y fragmentos (solo staff)."""
+
+    def get(self, request, *args, **kwargs):
+        return JsonResponse(caching.stats())
+
+
+class DatabaseStatsView(LoginRequiredMixin, StaffRequiredMixin, View):
+    """Pool de conexiones del worker que atiende el request (solo staff)."""
+
+    def get(self, request, *args, **kwargs):
+        return JsonResponse(database.pool_stats())
+
+
 class SignUpView(CreateView):
     form_class = SignupForm
     template_name = "registration/signup.html"
@@ -0,0 +1,19 @@
+# Configuración de Gunicorn (se carga automáticamente desde src/)
+# Los parámetros de bind/workers siguen definiéndose en docker-compose.
+
+
+def worker_exit(server, worker):
+    """Guarda las posiciones de video pendientes antes de que el worker termine."""
+    from courses.heartbeat import position_buffer
+
+    position_buffer.shutdown()
+    close_database_pools()
+
+
+def close_database_pools():
+    """Cierra los pools de conexiones del worker para no dejar sesiones abiertas."""
+    from django.db import connections
+
+    for connection in connections.all(initialized_only=True):
+        if getattr(connection, "pool", None):
+            connection.close_pool()